@@ -10,7 +10,7 @@ from alembic import context
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app.db.conexion import Base
-from app.db.modelos import modelos_core, modelos_pedidos, modelos_financieros, modelos_operativos, modelos_configuracion, modelos_feedback
+from app.db.modelos import modelos_core, modelos_pedidos, modelos_financieros, modelos_operativos, modelos_configuracion, modelos_feedback, modelos_metricas
 # --- FIN DE MODIFICACIÓN ---
 
 
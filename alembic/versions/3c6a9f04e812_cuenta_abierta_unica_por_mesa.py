@@ -0,0 +1,56 @@
+"""Cuenta abierta única por mesa
+
+Revision ID: 3c6a9f04e812
+Revises: e71c4a9d3b25
+Create Date: 2025-09-24 16:37:02.194467
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c6a9f04e812'
+down_revision: Union[str, Sequence[str], None] = 'e71c4a9d3b25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fusiona las cuentas abiertas duplicadas que dejó la carrera anterior: los pedidos
+    # y el total pasan a la más antigua de cada mesa y las demás quedan CANCELADA.
+    op.execute("""
+        CREATE TEMP TABLE cuentas_duplicadas ON COMMIT DROP AS
+        SELECT c.id, MIN(c.id) OVER (PARTITION BY c.negocio_id, c.mesa_id) AS cuenta_destino
+        FROM cuentas c
+        WHERE c.estado = 'ABIERTA' AND c.mesa_id IS NOT NULL
+    """)
+    op.execute("DELETE FROM cuentas_duplicadas WHERE id = cuenta_destino")
+    op.execute("""
+        UPDATE pedidos p SET cuenta_id = d.cuenta_destino
+        FROM cuentas_duplicadas d WHERE p.cuenta_id = d.id
+    """)
+    op.execute("""
+        UPDATE cuentas c SET total_calculado = c.total_calculado + s.total
+        FROM (
+            SELECT d.cuenta_destino, SUM(o.total_calculado) AS total
+            FROM cuentas_duplicadas d JOIN cuentas o ON o.id = d.id
+            GROUP BY d.cuenta_destino
+        ) s
+        WHERE c.id = s.cuenta_destino
+    """)
+    op.execute("""
+        UPDATE cuentas c SET estado = 'CANCELADA', total_calculado = 0
+        FROM cuentas_duplicadas d WHERE c.id = d.id
+    """)
+
+    op.create_index('uq_cuentas_abierta_por_mesa', 'cuentas', ['negocio_id', 'mesa_id'], unique=True,
+                    postgresql_where=sa.text("estado = 'ABIERTA'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_cuentas_abierta_por_mesa', table_name='cuentas')
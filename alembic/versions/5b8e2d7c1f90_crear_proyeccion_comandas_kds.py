@@ -0,0 +1,74 @@
+"""Crear proyección comandas_kds
+
+Revision ID: 5b8e2d7c1f90
+Revises: 9d3f1a6b2c47
+Create Date: 2025-09-21 18:05:37.640129
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e2d7c1f90'
+down_revision: Union[str, Sequence[str], None] = '9d3f1a6b2c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('comandas_kds',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('negocio_id', sa.Integer(), nullable=False),
+    sa.Column('pedido_id', sa.Integer(), nullable=False),
+    sa.Column('centro_produccion_id', sa.Integer(), nullable=True),
+    sa.Column('vista', sa.String(length=20), nullable=False),
+    sa.Column('mesa_id', sa.Integer(), nullable=True),
+    sa.Column('estado', postgresql.ENUM(name='estadopedido', create_type=False), nullable=False),
+    sa.Column('total_pedido', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('items', sa.JSON(), nullable=False),
+    sa.Column('fecha_creacion', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['centro_produccion_id'], ['centros_produccion.id'], ),
+    sa.ForeignKeyConstraint(['negocio_id'], ['negocios.id'], ),
+    sa.ForeignKeyConstraint(['pedido_id'], ['pedidos.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_comandas_kds_pedido_id'), 'comandas_kds', ['pedido_id'], unique=False)
+    op.create_index('ix_comandas_kds_centro_estado', 'comandas_kds', ['centro_produccion_id', 'estado', 'fecha_creacion'], unique=False)
+    op.create_index('ix_comandas_kds_negocio_vista', 'comandas_kds', ['negocio_id', 'vista', 'estado', 'fecha_creacion'], unique=False)
+
+    # Carga inicial con los pedidos que todavía aparecen en algún KDS
+    op.execute("""
+        INSERT INTO comandas_kds (negocio_id, pedido_id, centro_produccion_id, vista, mesa_id, estado, total_pedido, items, fecha_creacion)
+        SELECT p.negocio_id, p.id, pr.centro_produccion_id, 'PRODUCCION', p.mesa_id, p.estado, p.total_pedido,
+               json_agg(json_build_object('nombre', d.nombre_producto, 'cantidad', d.cantidad, 'nota', d.nota_cocina) ORDER BY d.id),
+               p.fecha_creacion
+        FROM pedidos p
+        JOIN detalles_pedido d ON d.pedido_id = p.id
+        JOIN productos pr ON pr.id = d.producto_id
+        WHERE pr.centro_produccion_id IS NOT NULL
+          AND p.estado NOT IN ('COMPLETADO', 'CANCELADO')
+        GROUP BY p.id, pr.centro_produccion_id
+    """)
+    op.execute("""
+        INSERT INTO comandas_kds (negocio_id, pedido_id, centro_produccion_id, vista, mesa_id, estado, total_pedido, items, fecha_creacion)
+        SELECT p.negocio_id, p.id, NULL, 'COBRO', p.mesa_id, p.estado, p.total_pedido,
+               json_agg(json_build_object('nombre', d.nombre_producto, 'cantidad', d.cantidad, 'nota', d.nota_cocina) ORDER BY d.id),
+               p.fecha_creacion
+        FROM pedidos p
+        JOIN detalles_pedido d ON d.pedido_id = p.id
+        WHERE p.estado = 'PENDIENTE_DE_PAGO'
+        GROUP BY p.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_comandas_kds_negocio_vista', table_name='comandas_kds')
+    op.drop_index('ix_comandas_kds_centro_estado', table_name='comandas_kds')
+    op.drop_index(op.f('ix_comandas_kds_pedido_id'), table_name='comandas_kds')
+    op.drop_table('comandas_kds')
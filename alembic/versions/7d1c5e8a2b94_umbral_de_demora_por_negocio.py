@@ -0,0 +1,28 @@
+"""Umbral de demora del KDS por negocio
+
+Revision ID: 7d1c5e8a2b94
+Revises: f2b58c3e7a41
+Create Date: 2025-09-30 10:04:37.518220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d1c5e8a2b94'
+down_revision: Union[str, Sequence[str], None] = 'f2b58c3e7a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('negocios', sa.Column('minutos_alerta_demora', sa.Integer(), server_default='10', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('negocios', 'minutos_alerta_demora')
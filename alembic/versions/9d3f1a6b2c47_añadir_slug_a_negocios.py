@@ -0,0 +1,53 @@
+"""Añadir slug a negocios
+
+Revision ID: 9d3f1a6b2c47
+Revises: 4201516563af
+Create Date: 2025-09-20 10:42:11.318204
+
+"""
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3f1a6b2c47'
+down_revision: Union[str, Sequence[str], None] = '4201516563af'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _slug(texto):
+    # Misma regla que app.servicios.servicio_negocio.generar_slug, copiada para que la
+    # migración no dependa del código de la aplicación.
+    texto = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", texto.lower()).strip("-") or "negocio"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('negocios', sa.Column('slug', sa.String(length=255), nullable=True))
+
+    # Rellena el slug de los negocios existentes a partir del nombre comercial
+    conexion = op.get_bind()
+    negocios = sa.table('negocios', sa.column('id', sa.Integer), sa.column('nombre_comercial', sa.String), sa.column('slug', sa.String))
+    usados = set()
+    for negocio_id, nombre in conexion.execute(sa.select(negocios.c.id, negocios.c.nombre_comercial).order_by(negocios.c.id)):
+        base = _slug(nombre)
+        slug, sufijo = base, 1
+        while slug in usados:
+            sufijo += 1
+            slug = f"{base}-{sufijo}"
+        usados.add(slug)
+        conexion.execute(negocios.update().where(negocios.c.id == negocio_id).values(slug=slug))
+
+    op.create_index(op.f('ix_negocios_slug'), 'negocios', ['slug'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_negocios_slug'), table_name='negocios')
+    op.drop_column('negocios', 'slug')
@@ -0,0 +1,73 @@
+"""Crear métricas del dashboard
+
+Revision ID: a4d7e2f9b618
+Revises: 3c6a9f04e812
+Create Date: 2025-09-26 11:42:18.903514
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d7e2f9b618'
+down_revision: Union[str, Sequence[str], None] = '3c6a9f04e812'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('metricas_diarias',
+    sa.Column('negocio_id', sa.Integer(), nullable=False),
+    sa.Column('dia', sa.Date(), nullable=False),
+    sa.Column('ventas', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('pedidos', sa.Integer(), nullable=False),
+    sa.Column('pedidos_cancelados', sa.Integer(), nullable=False),
+    sa.Column('mesas_atendidas', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['negocio_id'], ['negocios.id'], ),
+    sa.PrimaryKeyConstraint('negocio_id', 'dia')
+    )
+    op.create_table('metricas_negocio',
+    sa.Column('negocio_id', sa.Integer(), nullable=False),
+    sa.Column('pedidos_activos', sa.Integer(), nullable=False),
+    sa.Column('actualizado_en', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['negocio_id'], ['negocios.id'], ),
+    sa.PrimaryKeyConstraint('negocio_id')
+    )
+
+    # Carga inicial desde el histórico, con los mismos criterios que servicio_metricas
+    op.execute(sa.text("""
+        INSERT INTO metricas_diarias (negocio_id, dia, ventas, pedidos, pedidos_cancelados, mesas_atendidas)
+        SELECT negocio_id, dia, SUM(ventas), SUM(pedidos), SUM(pedidos_cancelados), SUM(mesas_atendidas)
+        FROM (
+            SELECT negocio_id, date(timezone(:zona, fecha_creacion)) AS dia,
+                   COALESCE(SUM(total_pedido) FILTER (WHERE estado IN ('PENDIENTE', 'EN_PREPARACION', 'LISTO_PARA_RECOGER', 'COMPLETADO')), 0) AS ventas,
+                   COUNT(*) FILTER (WHERE estado IN ('PENDIENTE', 'EN_PREPARACION', 'LISTO_PARA_RECOGER', 'COMPLETADO')) AS pedidos,
+                   COUNT(*) FILTER (WHERE estado = 'CANCELADO') AS pedidos_cancelados,
+                   0 AS mesas_atendidas
+            FROM pedidos WHERE fecha_creacion IS NOT NULL
+            GROUP BY 1, 2
+            UNION ALL
+            SELECT negocio_id, date(timezone(:zona, fecha_apertura)), 0, 0, 0, COUNT(*)
+            FROM cuentas WHERE mesa_id IS NOT NULL AND fecha_apertura IS NOT NULL
+            GROUP BY 1, 2
+        ) hechos
+        GROUP BY negocio_id, dia
+    """).bindparams(zona=settings.ZONA_HORARIA))
+    op.execute("""
+        INSERT INTO metricas_negocio (negocio_id, pedidos_activos)
+        SELECT negocio_id, COUNT(*) FROM pedidos
+        WHERE estado IN ('PENDIENTE', 'EN_PREPARACION', 'LISTO_PARA_RECOGER')
+        GROUP BY negocio_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('metricas_negocio')
+    op.drop_table('metricas_diarias')
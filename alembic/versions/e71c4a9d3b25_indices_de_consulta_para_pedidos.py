@@ -0,0 +1,33 @@
+"""Índices de consulta para pedidos
+
+Revision ID: e71c4a9d3b25
+Revises: 5b8e2d7c1f90
+Create Date: 2025-09-23 09:12:48.551872
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e71c4a9d3b25'
+down_revision: Union[str, Sequence[str], None] = '5b8e2d7c1f90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Pedidos en espera: parcial, solo contiene lo que está en producción
+    op.create_index('ix_pedidos_en_produccion', 'pedidos', ['negocio_id', 'fecha_creacion'], unique=False,
+                    postgresql_where=sa.text("estado IN ('PENDIENTE', 'EN_PREPARACION')"))
+    # Carga de detalles por pedido (selectinload hace WHERE pedido_id IN (...))
+    op.create_index(op.f('ix_detalles_pedido_pedido_id'), 'detalles_pedido', ['pedido_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_detalles_pedido_pedido_id'), table_name='detalles_pedido')
+    op.drop_index('ix_pedidos_en_produccion', table_name='pedidos')
@@ -0,0 +1,90 @@
+"""Crear resúmenes de ventas y cobros
+
+Revision ID: f2b58c3e7a41
+Revises: a4d7e2f9b618
+Create Date: 2025-09-28 09:15:44.271806
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b58c3e7a41'
+down_revision: Union[str, Sequence[str], None] = 'a4d7e2f9b618'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('resumen_ventas_producto',
+    sa.Column('negocio_id', sa.Integer(), nullable=False),
+    sa.Column('dia', sa.Date(), nullable=False),
+    sa.Column('local_id', sa.Integer(), nullable=False),
+    sa.Column('producto_id', sa.Integer(), nullable=False),
+    sa.Column('centro_produccion_id', sa.Integer(), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('bruto', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['negocio_id'], ['negocios.id'], ),
+    sa.PrimaryKeyConstraint('negocio_id', 'dia', 'local_id', 'producto_id', 'centro_produccion_id')
+    )
+    op.create_table('resumen_cobros',
+    sa.Column('negocio_id', sa.Integer(), nullable=False),
+    sa.Column('dia', sa.Date(), nullable=False),
+    sa.Column('local_id', sa.Integer(), nullable=False),
+    sa.Column('medio_de_pago', postgresql.ENUM(name='mediodepago', create_type=False), nullable=False),
+    sa.Column('transacciones', sa.Integer(), nullable=False),
+    sa.Column('monto', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('propinas', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['negocio_id'], ['negocios.id'], ),
+    sa.PrimaryKeyConstraint('negocio_id', 'dia', 'local_id', 'medio_de_pago')
+    )
+    op.create_index('ix_transacciones_fecha', 'transacciones', ['fecha_transaccion'], unique=False)
+
+    # Carga inicial con todo el histórico (mismos criterios que servicio_reportes.recalcular_resumenes)
+    op.execute(sa.text("""
+        INSERT INTO resumen_ventas_producto (negocio_id, dia, local_id, producto_id, centro_produccion_id, cantidad, bruto)
+        SELECT p.negocio_id, date(timezone(:zona, p.fecha_creacion)), COALESCE(z.local_id, 0), d.producto_id,
+               COALESCE(pr.centro_produccion_id, 0),
+               SUM(d.cantidad), SUM(d.cantidad * (d.precio_unitario + COALESCE(e.extra, 0)))
+        FROM detalles_pedido d
+        JOIN pedidos p ON p.id = d.pedido_id
+        JOIN productos pr ON pr.id = d.producto_id
+        LEFT JOIN mesas m ON m.id = p.mesa_id
+        LEFT JOIN zonas z ON z.id = m.zona_id
+        LEFT JOIN (
+            SELECT dm.detalle_pedido_id, SUM(o.precio_extra) AS extra
+            FROM detalle_pedido_modificadores dm JOIN opciones_modificadores o ON o.id = dm.opcion_modificador_id
+            GROUP BY dm.detalle_pedido_id
+        ) e ON e.detalle_pedido_id = d.id
+        WHERE p.fecha_creacion IS NOT NULL
+          AND p.estado IN ('PENDIENTE', 'EN_PREPARACION', 'LISTO_PARA_RECOGER', 'COMPLETADO')
+        GROUP BY 1, 2, 3, 4, 5
+    """).bindparams(zona=settings.ZONA_HORARIA))
+    op.execute(sa.text("""
+        INSERT INTO resumen_cobros (negocio_id, dia, local_id, medio_de_pago, transacciones, monto, propinas)
+        SELECT negocio_id, dia, local_id, medio_de_pago, COUNT(*), SUM(monto), COALESCE(SUM(propina), 0)
+        FROM (
+            SELECT c.negocio_id, date(timezone(:zona, t.fecha_transaccion)) AS dia, COALESCE(z.local_id, 0) AS local_id,
+                   t.medio_de_pago, t.monto,
+                   ROUND(COALESCE(c.propina, 0) * t.monto / NULLIF(SUM(t.monto) OVER (PARTITION BY t.cuenta_id), 0), 2) AS propina
+            FROM transacciones t
+            JOIN cuentas c ON c.id = t.cuenta_id
+            LEFT JOIN zonas z ON z.id = c.zona_id
+            WHERE t.estado = 'EXITOSA' AND t.fecha_transaccion IS NOT NULL
+        ) por_transaccion
+        GROUP BY 1, 2, 3, 4
+    """).bindparams(zona=settings.ZONA_HORARIA))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transacciones_fecha', table_name='transacciones')
+    op.drop_table('resumen_cobros')
+    op.drop_table('resumen_ventas_producto')
@@ -0,0 +1,55 @@
+# app/api/v1/respuestas_carta.py
+import hashlib
+import threading
+from typing import Dict, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from app.core.app_setup import templates
+from app.servicios.servicio_carta import MenuSnapshot
+
+# (negocio_id, marca) -> (etag, html_bytes)
+_html_cache: Dict[Tuple[int, str], Tuple[str, bytes]] = {}
+_lock_html = threading.Lock()
+
+def _render_carta(request: Request, negocio, menu: MenuSnapshot) -> Tuple[str, bytes]:
+    """
+    Renderiza la carta una sola vez por (negocio, marca, versión del catálogo).
+    La plantilla no depende de la mesa ni de la zona (el JS las lee de la URL),
+    así que el mismo HTML sirve para todas las mesas.
+    """
+    brand_config = request.state.brand_config
+    clave = (negocio.id, brand_config["brand_name"])
+    firma = f"{negocio.id}|{negocio.nombre_comercial}|{brand_config['brand_name']}|{brand_config['logo_url']}|{menu.version}"
+    etag = '"' + hashlib.sha1(firma.encode("utf-8")).hexdigest()[:20] + '"'
+
+    en_cache = _html_cache.get(clave)
+    if en_cache and en_cache[0] == etag:
+        return en_cache
+
+    html = templates.get_template("public/carta_virtual.html").render({
+        "negocio": negocio,
+        "categorias": menu.categorias,
+        "brand_config": brand_config,
+    }).encode("utf-8")
+    with _lock_html:
+        _html_cache[clave] = (etag, html)
+    return etag, html
+
+def CartaVirtualResponse(request: Request, negocio, menu: MenuSnapshot) -> Response:
+    """
+    Devuelve la carta pre-renderizada con ETag fuerte. Si el navegador ya tiene esta
+    versión (If-None-Match), responde 304 sin cuerpo. Sin Last-Modified: el catálogo no
+    guarda fecha de cambio, y la hora de cada snapshot varía entre workers y recargas.
+    """
+    etag, html = _render_carta(request, negocio, menu)
+    cabeceras = {
+        "ETag": etag,
+        # El navegador guarda la carta pero la revalida en cada escaneo
+        "Cache-Control": "no-cache",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [e.strip() for e in if_none_match.split(",")]):
+        return Response(status_code=304, headers=cabeceras)
+
+    return Response(content=html, media_type="text/html; charset=utf-8", headers=cabeceras)
@@ -9,7 +9,7 @@ def PanelBaseResponse(request: Request, current_user, template_name: str, contex
     Acepta un fragmento de HTML (template_name) y lo inyecta en la plantilla base.
     """
     brand_config = request.state.brand_config
-    user_permissions = {p.codigo for p in current_user.rol.permisos}
+    user_permissions = current_user.permisos
     
     # Contexto global para la plantilla base
     global_context = {
@@ -1,24 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from urllib.parse import unquote
 
 # Importaciones estandarizadas y centralizadas
-from app.core.app_setup import templates
-from app.db.conexion import SessionLocal
+from app.api.v1.respuestas_carta import CartaVirtualResponse
+from app.db.conexion import get_db, get_async_db
 from app.db.modelos import modelos_core, modelos_pedidos
 from app.esquemas import esquemas_carta, esquemas_pedido
-from app.servicios import servicio_llm, servicio_pedido
+from app.servicios import servicio_carta, servicio_negocio, servicio_orden_voz, servicio_pedido
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 # === RUTA PARA MOSTRAR LA CARTA (GET) ===
 @router.get("/carta/{slug_negocio}/{zona_id}/{mesa_id}", response_class=HTMLResponse)
@@ -32,74 +27,45 @@ def get_carta_virtual(
     """
     Muestra la carta virtual pública de un negocio para una mesa específica.
     """
-    nombre_decodificado = unquote(slug_negocio)
-    negocio = db.query(modelos_core.Negocio).filter(modelos_core.Negocio.nombre_comercial == nombre_decodificado).first()
-    if not negocio:
-        raise HTTPException(status_code=404, detail=f"No se encontró el negocio '{nombre_decodificado}'.")
+    negocio = servicio_negocio.resolver_negocio(db, slug_negocio)
+    if not negocio or not negocio.activo:
+        raise HTTPException(status_code=404, detail=f"No se encontró el negocio '{unquote(slug_negocio)}'.")
     
     mesa = db.query(modelos_core.Mesa).filter(modelos_core.Mesa.id == mesa_id).first()
     zona = db.query(modelos_core.Zona).filter(modelos_core.Zona.id == zona_id).first()
     if not mesa or not zona:
         raise HTTPException(status_code=404, detail="La mesa o zona especificadas no existen.")
         
-    # Consulta para cargar el menú completo de este negocio
-    categorias = db.query(modelos_core.Categoria).options(
-        joinedload(modelos_core.Categoria.productos).joinedload(modelos_core.Producto.variantes),
-        joinedload(modelos_core.Categoria.productos).joinedload(modelos_core.Producto.grupos_modificadores).joinedload(modelos_core.GrupoModificador.opciones)
-    ).filter(modelos_core.Categoria.negocio_id == negocio.id).all()
+    # Menú completo de este negocio, desde la caché de snapshots
+    menu = servicio_carta.get_menu(db, negocio.id)
 
-    brand_config = request.state.brand_config
-    
-    context = {
-        "request": request,
-        "negocio": negocio,
-        "categorias": categorias,
-        "brand_config": brand_config,
-        "mesa_id": mesa_id,
-        "zona_id": zona_id
-    }
-    return templates.TemplateResponse("public/carta_virtual.html", context)
+    # HTML pre-renderizado por versión del catálogo, con ETag (304 si el navegador ya lo tiene)
+    return CartaVirtualResponse(request, negocio, menu)
 
 # === RUTA PARA PROCESAR VOZ/TEXTO (POST) ===
 @router.post("/carta/{slug_negocio}/parse-orden-voz")
-def parse_orden_voz(
+async def parse_orden_voz(
     slug_negocio: str,
     orden: esquemas_carta.OrdenVozRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    nombre_decodificado = unquote(slug_negocio)
-    negocio = db.query(modelos_core.Negocio).filter(modelos_core.Negocio.nombre_comercial == nombre_decodificado).first()
-    if not negocio:
-        raise HTTPException(status_code=404, detail=f"No se encontró el negocio '{nombre_decodificado}'")
-
-    print(f"\n--- INICIO DIAGNÓSTICO parse-orden-voz ---") # <-- LOG 1: Inicio
-    print(f"Texto recibido del cliente: '{orden.texto_orden}'")
-    
-    productos_db = db.query(modelos_core.Producto).options(
-        # ... (joinedloads sin cambios)
-    ).filter(modelos_core.Producto.negocio_id == negocio.id, modelos_core.Producto.activo == True).all()
-
-    print(f"Productos encontrados en BD para este negocio: {[p.nombre for p in productos_db]}") # <-- LOG 2: Productos de la BD
+    negocio = await servicio_negocio.resolver_negocio_async(db, slug_negocio)
+    if not negocio or not negocio.activo:
+        raise HTTPException(status_code=404, detail=f"No se encontró el negocio '{unquote(slug_negocio)}'")
 
-    if not productos_db:
+    # El prompt sale del snapshot en caché: sin consultar el catálogo en cada orden
+    menu = await servicio_carta.get_menu_async(db, negocio.id)
+    if not menu.items_formulario:
         return {"intent": "UNKNOWN", "entities": []}
 
-    menu_simple_para_llm = [
-        {"id": p.id, "nombre": p.nombre, "alias": p.alias} for p in productos_db
-    ]
-    
-    print(f"Menú simple enviado al LLM: {menu_simple_para_llm}") # <-- LOG 3: Menú para el LLM
-
-    resultado_llm = servicio_llm.procesar_orden_con_llm(menu_simple_para_llm, orden.texto_orden)
-    
-    print(f"Respuesta recibida del LLM: {resultado_llm}") # <-- LOG 4: Respuesta del LLM
-    print(f"--- FIN DIAGNÓSTICO ---\n")
+    # Las órdenes simples se resuelven localmente; el LLM queda para las dudosas
+    resultado_llm = await servicio_orden_voz.interpretar_orden(menu, orden.texto_orden)
 
-    if resultado_llm.get("entities"):
-        for entity in resultado_llm["entities"]:
-            producto_completo_encontrado = next((p for p in productos_db if p.id == entity.get("product_id")), None)
-            if producto_completo_encontrado:
-                entity["full_product_data"] = esquemas_carta.ItemFormulario.model_validate(producto_completo_encontrado).model_dump()
+    # Payloads precalculados en el snapshot: ni consultas ni validación por petición
+    for entity in resultado_llm.get("entities", []):
+        item_formulario = menu.items_formulario.get(entity.get("product_id"))
+        if item_formulario:
+            entity["full_product_data"] = item_formulario
 
     return resultado_llm
 
@@ -110,20 +76,18 @@ async def iniciar_proceso_pedido(
     zona_id: int,
     mesa_id: int,
     pedido_in: esquemas_pedido.PedidoCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    nombre_decodificado = unquote(slug_negocio)
-    negocio = db.query(modelos_core.Negocio).filter(modelos_core.Negocio.nombre_comercial == nombre_decodificado).first()
-    if not negocio:
-        raise HTTPException(status_code=404, detail=f"No se encontró el negocio '{nombre_decodificado}'")
+    negocio = await servicio_negocio.resolver_negocio_async(db, slug_negocio)
+    if not negocio or not negocio.activo:
+        raise HTTPException(status_code=404, detail=f"No se encontró el negocio '{unquote(slug_negocio)}'")
     
     pedido_in.zona_id = zona_id
     pedido_in.mesa_id = mesa_id
     
     if negocio.modo_cobro == 'POSTPAGO':
         try:
-            # === CAMBIO 2: Usar 'await' para llamar a la función asíncrona ===
-            nuevo_pedido = await servicio_pedido.crear_nuevo_pedido(db=db, negocio_id=negocio.id, pedido_data=pedido_in)
+            nuevo_pedido = await servicio_pedido.crear_nuevo_pedido_async(db=db, negocio_id=negocio.id, pedido_data=pedido_in)
             return esquemas_pedido.RespuestaProcesoPedido(
                 status="enviado_a_cocina",
                 mensaje=f"¡Pedido #{nuevo_pedido.id} confirmado! Ya estamos preparando tu orden.",
@@ -135,7 +99,7 @@ async def iniciar_proceso_pedido(
 
     elif negocio.modo_cobro == 'PREPAGO':
         try:
-            pedido_pendiente = await servicio_pedido.crear_nuevo_pedido(db=db, negocio_id=negocio.id, pedido_data=pedido_in, estado_inicial=modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO)
+            pedido_pendiente = await servicio_pedido.crear_nuevo_pedido_async(db=db, negocio_id=negocio.id, pedido_data=pedido_in, estado_inicial=modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO)
             url_pago_simulada = f"/pagar/{pedido_pendiente.cuenta_id}"
             return esquemas_pedido.RespuestaProcesoPedido(
                 status="pago_requerido",
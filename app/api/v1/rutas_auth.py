@@ -6,36 +6,31 @@ from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 # Importaciones estandarizadas y corregidas
-from app.db.conexion import SessionLocal
+from app.db.conexion import get_db, get_async_db
 from app.db.modelos import modelos_core
 from app.esquemas import esquemas_auth, esquemas_core
-from app.servicios.servicio_usuario import authenticate_user # <-- Importación correcta
+from app.servicios.servicio_usuario import authenticate_user_async
 from app.core.seguridad import crear_access_token, ACCESS_TOKEN_EXPIRE_MINUTES # <-- Importaciones correctas
 
 from app.api.v1.rutas_usuarios import get_current_user
+from app.servicios.servicio_usuario import UsuarioAutenticado
 from app.servicios import servicio_usuario
 from app.core import seguridad
 from app.core.config import settings
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 router = APIRouter()
 
-# Función de dependencia para obtener la sesión de la base de datos
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.post("/token", response_model=esquemas_auth.Token)
-def login(
+async def login(
     response: Response,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
-    usuario = authenticate_user(db=db, numero_documento=form_data.username, password_plano=form_data.password)
+    usuario = await authenticate_user_async(db=db, numero_documento=form_data.username, password_plano=form_data.password)
     if not usuario:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -75,15 +70,16 @@ def recover_password(data: esquemas_core.PasswordRecoveryRequest, db: Session =
 
 
 @router.post("/reset-password", status_code=status.HTTP_204_NO_CONTENT)
-def reset_password(
+async def reset_password(
     data: esquemas_core.PasswordReset, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Finaliza el proceso de reseteo de contraseña usando el token/código.
+    El hash nuevo se calcula en el pool de bcrypt, sin ocupar un hilo de peticiones.
     """
     # Ahora pasamos el objeto 'data' completo directamente al servicio.
-    exito = servicio_usuario.resetear_password(db=db, data=data) 
+    exito = await servicio_usuario.resetear_password(db=db, data=data) 
 
     if not exito:
         raise HTTPException(
@@ -100,18 +96,18 @@ def logout(response: Response):
 
 
 @router.get("/users/me", response_model=esquemas_core.Usuario)
-def read_users_me(current_user: modelos_core.Usuario = Depends(get_current_user)):
+def read_users_me(current_user: UsuarioAutenticado = Depends(get_current_user), db: Session = Depends(get_db)):
     """
     Endpoint protegido que devuelve los datos del usuario actual.
     Sirve para verificar si el token JWT es válido.
     """
-    return current_user
+    return db.get(modelos_core.Usuario, current_user.id)
 
 
 @router.get("/users/me", response_model=esquemas_core.Usuario)
-def read_users_me(current_user: modelos_core.Usuario = Depends(get_current_user)):
+def read_users_me(current_user: UsuarioAutenticado = Depends(get_current_user), db: Session = Depends(get_db)):
     """
     Endpoint protegido que devuelve los datos del usuario actual.
     Sirve para verificar si el token JWT es válido.
     """
-    return current_user
\ No newline at end of file
+    return db.get(modelos_core.Usuario, current_user.id)
\ No newline at end of file
@@ -1,17 +1,121 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
+import asyncio
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from sqlalchemy import select
+from typing import Optional
+from app.core.serializacion import de_json
 from app.core.websocket_manager import manager
+from app.db.conexion import SessionLocal, AsyncSessionLocal
+from app.db.modelos import modelos_operativos
+from app.esquemas import esquemas_pedido
+from app.api.v1.rutas_usuarios import token_de_conexion, usuario_de_token
+from app.servicios import servicio_estado_pedido
+from app.servicios.servicio_usuario import UsuarioAutenticado
 
 router = APIRouter()
 
+# Códigos de cierre propios (rango 4000-4999): el KDS no reintenta con ellos
+CIERRE_NO_AUTENTICADO = 4401
+CIERRE_PROHIBIDO = 4403
+
+
+async def _usuario_del_socket(websocket: WebSocket) -> Optional[UsuarioAutenticado]:
+    """El usuario del JWT con que se abrió el socket (la cookie de la sesión del panel)."""
+    token = token_de_conexion(websocket)
+    if token is None:
+        return None
+
+    def resolver():
+        with SessionLocal() as db:
+            return usuario_de_token(db, token)
+    return await asyncio.to_thread(resolver)
+
+async def _centro_del_negocio(center_id: str, negocio_id: Optional[int]) -> bool:
+    """El canal de un socket es un centro de producción, y solo del negocio del usuario."""
+    if negocio_id is None or not center_id.isdigit():
+        return False
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(modelos_operativos.CentroProduccion.id).where(
+                modelos_operativos.CentroProduccion.id == int(center_id),
+                modelos_operativos.CentroProduccion.negocio_id == negocio_id
+            )
+        )).first() is not None
+
+async def _rechazar(websocket: WebSocket, codigo: int):
+    # Se acepta y se cierra con código: rechazar el handshake solo le llega al navegador como 1006
+    await websocket.accept()
+    await websocket.close(code=codigo)
+
+async def _atender_comando(usuario: UsuarioAutenticado, datos) -> dict:
+    """
+    Comandos que un KDS puede enviar por su socket. Por ahora uno:
+    {"comando": "CAMBIAR_ESTADOS", "id": ..., "cambios": [{"pedido_id", "nuevo_estado", "estado_actual"}]}
+    Devuelve la respuesta para ese socket (el resultado del lote o un error).
+    """
+    if not isinstance(datos, dict):
+        return {"error": "El mensaje no es un comando."}
+    respuesta = {"id": datos.get("id"), "comando": datos.get("comando")}
+
+    if datos.get("comando") != "CAMBIAR_ESTADOS":
+        return {**respuesta, "error": "Comando desconocido."}
+    try:
+        lote = esquemas_pedido.PedidosEstadoUpdate.model_validate(datos)
+    except ValidationError as e:
+        return {**respuesta, "error": f"Lote inválido: {e.error_count()} errores."}
+
+    try:
+        async with AsyncSessionLocal() as db:
+            cambios, rechazados = await servicio_estado_pedido.cambiar_estados(
+                db, usuario.negocio_id, [(c.pedido_id, c.nuevo_estado, c.estado_actual) for c in lote.cambios]
+            )
+    except Exception as e:
+        # El socket sigue abierto: el KDS puede reintentar el lote
+        print(f"[KDS] Error aplicando lote de estados: {e}")
+        return {**respuesta, "error": "No se pudo aplicar el lote."}
+    return {**respuesta, **servicio_estado_pedido.resultado_lote(cambios, rechazados)}
+
+
 # La ruta usa el ID del centro de producción (ej: 1 para Cocina, 2 para Barra)
+# Un KDS que se reconecta envía ?resume_from=<último seq>&epoca=<epoca> para recibir solo lo que se perdió
 @router.websocket("/ws/kds/{center_id}")
-async def websocket_endpoint(websocket: WebSocket, center_id: str):
-    await manager.connect(websocket, center_id)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    center_id: str,
+    resume_from: Optional[int] = None,
+    epoca: Optional[str] = None
+):
+    usuario = await _usuario_del_socket(websocket)
+    if usuario is None:
+        await _rechazar(websocket, CIERRE_NO_AUTENTICADO)
+        return
+    if not await _centro_del_negocio(center_id, usuario.negocio_id):
+        await _rechazar(websocket, CIERRE_PROHIBIDO)
+        return
+
+    conexion = await manager.connect(
+        websocket, center_id, resume_from=resume_from, epoca=epoca,
+        negocio_id=usuario.negocio_id, usuario_id=usuario.id
+    )
     try:
-        # Mantener la conexión abierta para recibir pings (aunque este KDS solo emite)
+        # El KDS contesta los PING del servidor y envía comandos (p. ej. varios "listo" a la vez)
         while True:
-            data = await websocket.receive_text()
-            # Opcional: si el KDS envía un mensaje de "Comanda Lista", lo procesaríamos aquí
+            mensaje = await websocket.receive()
+            if mensaje["type"] == "websocket.disconnect":
+                break
+            # JSON en texto o en binario; cualquier otra cosa cae en "El mensaje no es un comando."
+            try:
+                datos = de_json(mensaje.get("text") or mensaje.get("bytes"))
+            except (TypeError, ValueError):
+                datos = None
+            if isinstance(datos, dict) and datos.get("control") == "PONG":
+                manager.registrar_actividad(conexion, datos.get("t"))
+                continue
+            manager.registrar_actividad(conexion)
+            manager.responder(conexion, await _atender_comando(usuario, datos))
     except WebSocketDisconnect:
+        pass
+    finally:
+        # También si un comando falla de forma inesperada: el socket no queda registrado
         manager.disconnect(websocket, center_id)
-        print(f"Cliente {center_id} desconectado.")
\ No newline at end of file
+        print(f"Cliente {center_id} desconectado.")
@@ -1,28 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Optional
 from datetime import datetime, timezone, timedelta
-from collections import defaultdict
 from pydantic import BaseModel
-import json
+import anyio
 
 # --- Importaciones Estandarizadas ---
-from app.db.conexion import SessionLocal
+from app.db.conexion import get_db, get_async_db
 from app.db.modelos import modelos_core, modelos_pedidos, modelos_operativos, modelos_configuracion, modelos_financieros
 from app.esquemas import esquemas_core, esquemas_configuracion, esquemas_pedido
 from app.api.v1.rutas_usuarios import get_current_user
+from app.servicios.servicio_usuario import UsuarioAutenticado
+from app.core.serializacion import RespuestaJSON, a_json
 from app.core.websocket_manager import manager
+from app.servicios import servicio_demoras, servicio_estado_pedido, servicio_kds, servicio_metricas, servicio_negocio, servicio_pedido
+from app.servicios.servicio_demoras import planificador_demoras
+from app.core.fechas import rango_dia_local
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
 class NotificacionCobroRequest(BaseModel):
     alias_cliente: str
@@ -31,145 +29,125 @@ class NotificacionCobroRequest(BaseModel):
 # --- ENDPOINTS DE GESTIÓN DE PEDIDOS (KDS) ---
 
 @router.post("/panel/pedidos/{pedido_id}/actualizar-estado", status_code=status.HTTP_200_OK)
-def actualizar_estado_pedido(
+async def actualizar_estado_pedido(
     pedido_id: int,
     estado_update: esquemas_pedido.PedidoEstadoUpdate,
-    db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
-    pedido = db.query(modelos_pedidos.Pedido).filter(
-        modelos_pedidos.Pedido.id == pedido_id,
-        modelos_pedidos.Pedido.negocio_id == current_user.negocio_id
-    ).first()
-    if not pedido:
+    """
+    Transición validada por la máquina de estados, aplicada con un solo UPDATE
+    condicional y difundida como delta a los centros del pedido y a Caja.
+    """
+    try:
+        cambio = await servicio_estado_pedido.cambiar_estado(
+            db, current_user.negocio_id, pedido_id, estado_update.nuevo_estado, estado_update.estado_actual
+        )
+    except servicio_estado_pedido.PedidoNoEncontrado:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Pedido no encontrado.")
-    
-    pedido.estado = estado_update.nuevo_estado
-    db.commit()
-    db.refresh(pedido)
-    return {"mensaje": "Estado del pedido actualizado con éxito.", "nuevo_estado": pedido.estado}
+    except servicio_estado_pedido.TransicionInvalida as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {
+        "mensaje": "Estado del pedido actualizado con éxito.",
+        "nuevo_estado": cambio.nuevo_estado,
+        "estado_anterior": cambio.estado_anterior
+    }
+
+@router.post("/panel/pedidos/actualizar-estados", status_code=status.HTTP_200_OK)
+async def actualizar_estados_pedidos(
+    lote: esquemas_pedido.PedidosEstadoUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UsuarioAutenticado = Depends(get_current_user)
+):
+    """
+    Varias transiciones en una transacción, con un solo UPDATE y un mensaje por centro.
+    Responde 200 aunque alguna no se aplique: cada rechazo trae su motivo.
+    """
+    cambios, rechazados = await servicio_estado_pedido.cambiar_estados(
+        db, current_user.negocio_id, [(c.pedido_id, c.nuevo_estado, c.estado_actual) for c in lote.cambios]
+    )
+    return servicio_estado_pedido.resultado_lote(cambios, rechazados)
 
 @router.post("/panel/pedidos/{pedido_id}/marcar-pagado", status_code=status.HTTP_200_OK)
 async def marcar_pedido_como_pagado(
     pedido_id: int,
-    db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
-    pedido = db.query(modelos_pedidos.Pedido).options(
-        joinedload(modelos_pedidos.Pedido.detalles).joinedload(modelos_pedidos.DetallePedido.producto)
-    ).filter(
-        modelos_pedidos.Pedido.id == pedido_id,
-        modelos_pedidos.Pedido.negocio_id == current_user.negocio_id
-    ).first()
-    if not pedido:
+    try:
+        cambio = await servicio_estado_pedido.cambiar_estado(
+            db, current_user.negocio_id, pedido_id, modelos_pedidos.EstadoPedido.PENDIENTE,
+            estado_esperado=modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO
+        )
+    except servicio_estado_pedido.PedidoNoEncontrado:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Pedido no encontrado.")
-    if pedido.estado != modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO:
+    except servicio_estado_pedido.TransicionInvalida:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El pedido no está pendiente de pago.")
-    
-    pedido.estado = modelos_pedidos.EstadoPedido.PENDIENTE
-    db.commit()
-    db.refresh(pedido)
-
-    comandos_por_centro = defaultdict(list)
-    for detalle in pedido.detalles:
-        if detalle.producto and detalle.producto.centro_produccion_id:
-            centro_id = str(detalle.producto.centro_produccion_id)
-            comandos_por_centro[centro_id].append({
-                "nombre": detalle.nombre_producto, "cantidad": detalle.cantidad, "nota": detalle.nota_cocina
-            })
 
-    for centro_id, items in comandos_por_centro.items():
+    # Las comandas de producción devueltas por la transición ya traen los items de cada centro
+    for comanda in cambio.comandas:
+        if comanda.vista != servicio_kds.VISTA_PRODUCCION:
+            continue
         mensaje_kds = {
-            "mesa_id": pedido.mesa_id, "pedido_id": pedido.id,
-            "total_pedido": float(pedido.total_pedido), "items": items,
-            "fecha_creacion": pedido.fecha_creacion.isoformat()
+            "mesa_id": cambio.mesa_id, "pedido_id": cambio.pedido_id,
+            "total_pedido": cambio.total_pedido, "items": comanda.items,
+            "fecha_creacion": cambio.fecha_creacion
         }
-        await manager.broadcast(json.dumps(mensaje_kds), client_id=centro_id)
+        await manager.broadcast(a_json(mensaje_kds), client_id=str(comanda.centro_produccion_id))
         
-    return {"mensaje": f"Pedido #{pedido.id} marcado como pagado y enviado a producción."}
+    return {"mensaje": f"Pedido #{cambio.pedido_id} marcado como pagado y enviado a producción."}
 
 # --- ENDPOINTS PARA CARGA DE DATOS DEL KDS ---
 
-def agrupar_pedidos_para_kds(pedidos: List[modelos_pedidos.Pedido], centro_id: int):
-    resultado = defaultdict(lambda: {"mesa_id": 0, "fecha_creacion": None, "total_pedido": 0.0, "estado": "", "items": [], "total_cobrar": 0.0})
-    for pedido in pedidos:
-        items_del_centro = []
-        if pedido.estado == modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO:
-            items_del_centro = [{"nombre": det.nombre_producto, "cantidad": det.cantidad, "nota": det.nota_cocina} for det in pedido.detalles]
-        else:
-            for det in pedido.detalles:
-                if det.producto and det.producto.centro_produccion_id == centro_id:
-                    items_del_centro.append({"nombre": det.nombre_producto, "cantidad": det.cantidad, "nota": det.nota_cocina})
-        
-        if items_del_centro:
-            info = resultado[pedido.id]
-            info["mesa_id"] = pedido.mesa_id
-            info["fecha_creacion"] = pedido.fecha_creacion.isoformat()
-            info["total_pedido"] = float(pedido.total_pedido)
-            info["estado"] = pedido.estado.value
-            if pedido.estado == modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO:
-                info["total_cobrar"] = float(pedido.total_pedido)
-            info["items"] = items_del_centro
-            
-    return [{"pedido_id": pid, **data} for pid, data in resultado.items()]
-
-@router.get("/panel/kds/{centro_id}/pedidos-pendientes", response_model=List[dict])
+# Devuelven RespuestaJSON ya armada: las comandas son dicts planos, sin pasar por
+# response_model ni por el jsonable_encoder de FastAPI
+@router.get("/panel/kds/{centro_id}/pedidos-pendientes", response_class=RespuestaJSON)
 def get_pedidos_pendientes_kds(
     centro_id: int,
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
-    centro = db.query(modelos_operativos.CentroProduccion).get(centro_id)
+    centro = db.get(modelos_operativos.CentroProduccion, centro_id)
     if not centro:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Centro de producción no encontrado.")
 
-    estados_a_buscar = []
+    # Caja ve los pedidos por cobrar del negocio; el resto de centros, sus propias comandas
     if centro.nombre == 'Caja':
-        estados_a_buscar.append(modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO)
-    else:
-        estados_a_buscar.extend([modelos_pedidos.EstadoPedido.PENDIENTE, modelos_pedidos.EstadoPedido.EN_PREPARACION])
-
-    pedidos_activos = db.query(modelos_pedidos.Pedido).options(
-        joinedload(modelos_pedidos.Pedido.detalles).joinedload(modelos_pedidos.DetallePedido.producto)
-    ).filter(
-        modelos_pedidos.Pedido.negocio_id == current_user.negocio_id,
-        modelos_pedidos.Pedido.estado.in_(estados_a_buscar)
-    ).order_by(modelos_pedidos.Pedido.fecha_creacion.asc()).all()
-    
-    return agrupar_pedidos_para_kds(pedidos_activos, centro_id)
+        return RespuestaJSON(servicio_kds.leer_comandas_cobro(db, current_user.negocio_id))
+    return RespuestaJSON(servicio_kds.leer_comandas_produccion(db, current_user.negocio_id, centro_id, servicio_kds.ESTADOS_EN_PRODUCCION))
 
-@router.get("/panel/kds/{centro_id}/pedidos-completados", response_model=List[dict])
+@router.get("/panel/kds/{centro_id}/pedidos-completados", response_class=RespuestaJSON)
 def get_pedidos_completados_kds(
     centro_id: int,
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
-    hoy = datetime.now(timezone.utc).date()
-    pedidos_completados = db.query(modelos_pedidos.Pedido).options(
-        joinedload(modelos_pedidos.Pedido.detalles).joinedload(modelos_pedidos.DetallePedido.producto)
-    ).filter(
-        modelos_pedidos.Pedido.negocio_id == current_user.negocio_id,
-        modelos_pedidos.Pedido.estado == modelos_pedidos.EstadoPedido.LISTO_PARA_RECOGER,
-        func.date(modelos_pedidos.Pedido.fecha_creacion) >= hoy
-    ).order_by(modelos_pedidos.Pedido.fecha_creacion.desc()).all()
-    
-    return agrupar_pedidos_para_kds(pedidos_completados, centro_id)
+    inicio_hoy, fin_hoy = rango_dia_local()
+    return RespuestaJSON(servicio_kds.leer_comandas_produccion(
+        db, current_user.negocio_id, centro_id, [modelos_pedidos.EstadoPedido.LISTO_PARA_RECOGER],
+        desde=inicio_hoy, hasta=fin_hoy, recientes_primero=True
+    ))
 
-@router.get("/panel/negocio/pedidos-en-espera", response_model=List[dict])
+@router.get("/panel/negocio/pedidos-en-espera", response_class=RespuestaJSON)
 def get_pedidos_mayor_espera(
+    centro_id: Optional[int] = None,
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
-    umbral_tiempo = datetime.now(timezone.utc) - timedelta(minutes=10)
+    """
+    Pedidos que superan el umbral de demora del negocio. El KDS lo pide con su centro_id
+    solo al cargar o tras un snapshot; a partir de ahí recibe DEMORA por su socket.
+    """
+    umbral_tiempo = datetime.now(timezone.utc) - timedelta(minutes=planificador_demoras.minutos(current_user.negocio_id))
+    if centro_id is not None:
+        return RespuestaJSON(servicio_demoras.leer_demorados_centro(db, current_user.negocio_id, centro_id, umbral_tiempo))
     
-    pedidos_demorados = db.query(modelos_pedidos.Pedido).options(
-        joinedload(modelos_pedidos.Pedido.cuenta).joinedload(modelos_financieros.Cuenta.mesa).joinedload(modelos_core.Mesa.zona),
-        joinedload(modelos_pedidos.Pedido.detalles)
-    ).filter(
-        modelos_pedidos.Pedido.negocio_id == current_user.negocio_id,
-        modelos_pedidos.Pedido.estado.in_([modelos_pedidos.EstadoPedido.PENDIENTE, modelos_pedidos.EstadoPedido.EN_PREPARACION]),
-        modelos_pedidos.Pedido.fecha_creacion < umbral_tiempo
-    ).order_by(modelos_pedidos.Pedido.fecha_creacion.asc()).limit(5).all()
+    pedidos_demorados = db.execute(
+        servicio_pedido.consulta_pedidos_demorados(current_user.negocio_id, umbral_tiempo).options(
+            joinedload(modelos_pedidos.Pedido.cuenta).joinedload(modelos_financieros.Cuenta.mesa).joinedload(modelos_core.Mesa.zona),
+            selectinload(modelos_pedidos.Pedido.detalles)
+        )
+    ).scalars().all()
 
     resultado = []
     ahora = datetime.now(timezone.utc)
@@ -180,19 +158,31 @@ def get_pedidos_mayor_espera(
         minutos_espera = int(tiempo_espera.total_seconds() / 60)
         item_ejemplo = pedido.detalles[0].nombre_producto if pedido.detalles else "N/A"
         resultado.append({
+            "pedido_id": pedido.id,
+            "fecha_creacion": fecha_creacion_utc,
             "mesa_nombre": pedido.cuenta.mesa.nombre_o_numero,
             "zona_nombre": pedido.cuenta.mesa.zona.nombre,
             "minutos_espera": minutos_espera,
             "item_ejemplo": item_ejemplo
         })
-    return resultado
+    return RespuestaJSON(resultado)
+
+@router.get("/panel/dashboard/metricas", response_model=dict)
+def get_metricas_dashboard(
+    db: Session = Depends(get_db),
+    current_user: UsuarioAutenticado = Depends(get_current_user)
+):
+    """Cifras del dashboard desde los contadores incrementales (lectura por clave primaria)."""
+    metricas = servicio_metricas.leer_dashboard(db, current_user.negocio_id)
+    metricas["alertas_stock"] = servicio_metricas.contar_alertas_stock(db, current_user.negocio_id)
+    return metricas
 
 # --- ENDPOINTS PARA CONFIGURACIÓN DEL NEGOCIO ---
 
 @router.get("/panel/configuracion-negocio", response_model=esquemas_core.Negocio)
 def get_configuracion_negocio(
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
     negocio = db.query(modelos_core.Negocio).options(
         joinedload(modelos_core.Negocio.locales)
@@ -205,9 +195,9 @@ def get_configuracion_negocio(
 def update_configuracion_negocio(
     config_in: esquemas_core.NegocioUpdate,
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
-    if current_user.rol.nombre != 'Dueño':
+    if current_user.rol_nombre != 'Dueño':
         raise HTTPException(status_code=403, detail="No tienes permiso para modificar la configuración.")
     negocio = db.query(modelos_core.Negocio).filter(modelos_core.Negocio.id == current_user.negocio_id).first()
     if not negocio:
@@ -217,8 +207,15 @@ def update_configuracion_negocio(
     negocio.modo_cobro = config_in.modo_cobro
     negocio.tema_id = config_in.tema_id
     negocio.logo_url = config_in.logo_url
+    umbral_cambiado = config_in.minutos_alerta_demora not in (None, negocio.minutos_alerta_demora)
+    if umbral_cambiado:
+        negocio.minutos_alerta_demora = config_in.minutos_alerta_demora
     db.commit()
     db.refresh(negocio)
+    servicio_negocio.invalidar_negocio(negocio.id)
+    if umbral_cambiado:
+        # Ruta síncrona (hilo del threadpool): la difusión se ejecuta en el event loop
+        anyio.from_thread.run(planificador_demoras.umbral_cambiado, negocio.id, negocio.minutos_alerta_demora)
     return negocio
 
 # --- ENDPOINTS PARA GESTIÓN DE LOCALES ---
@@ -226,7 +223,7 @@ def update_configuracion_negocio(
 @router.get("/panel/locales", response_model=List[esquemas_configuracion.LocalConMetodos])
 def get_locales_del_negocio(
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
     locales = db.query(modelos_core.Local).options(
         joinedload(modelos_core.Local.metodos_pago)
@@ -238,9 +235,9 @@ def update_local(
     local_id: int,
     local_in: esquemas_core.LocalUpdate,
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
-    if current_user.rol.nombre != 'Dueño':
+    if current_user.rol_nombre != 'Dueño':
         raise HTTPException(status_code=403, detail="No tienes permiso para modificar locales.")
         
     local = db.query(modelos_core.Local).filter(
@@ -264,9 +261,9 @@ def add_metodo_pago_a_local(
     local_id: int,
     metodo_in: esquemas_core.MetodoPagoCreate,
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
-    if current_user.rol.nombre != 'Dueño':
+    if current_user.rol_nombre != 'Dueño':
         raise HTTPException(status_code=403, detail="No tienes permiso para añadir métodos de pago.")
         
     local = db.query(modelos_core.Local).filter(
@@ -291,10 +288,14 @@ def add_metodo_pago_a_local(
 async def notificar_cobro_efectivo(
     pedido_id: int,
     notificacion_in: NotificacionCobroRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
     # No requiere autenticación del cliente, ya que la URL es "secreta" por un tiempo
 ):
-    pedido = db.query(modelos_pedidos.Pedido).filter(modelos_pedidos.Pedido.id == pedido_id).first()
+    pedido = (await db.execute(
+        select(modelos_pedidos.Pedido).options(
+            selectinload(modelos_pedidos.Pedido.detalles)
+        ).where(modelos_pedidos.Pedido.id == pedido_id)
+    )).scalars().first()
     if not pedido:
         raise HTTPException(status_code=404, detail="Pedido no encontrado.")
 
@@ -303,23 +304,25 @@ async def notificar_cobro_efectivo(
     
     # Guardar el alias en la base de datos
     pedido.alias_cliente = notificacion_in.alias_cliente
-    db.commit()
+    await db.commit()
 
     # Enviar la notificación por WebSocket a Caja
-    id_caja = db.query(modelos_operativos.CentroProduccion.id).filter(
-        modelos_operativos.CentroProduccion.negocio_id == pedido.negocio_id,
-        modelos_operativos.CentroProduccion.nombre == 'Caja'
-    ).scalar()
+    id_caja = (await db.execute(
+        select(modelos_operativos.CentroProduccion.id).where(
+            modelos_operativos.CentroProduccion.negocio_id == pedido.negocio_id,
+            modelos_operativos.CentroProduccion.nombre == 'Caja'
+        ).limit(1)
+    )).scalar()
     
     if id_caja:
         mensaje_caja = {
             "tipo_alerta": "COBRO_PENDIENTE_EFECTIVO",
             "mesa_id": pedido.mesa_id,
             "pedido_id": pedido.id,
-            "total_cobrar": float(pedido.total_pedido),
+            "total_cobrar": pedido.total_pedido,
             "alias_cliente": pedido.alias_cliente,
             "items": [{"nombre": det.nombre_producto, "cantidad": det.cantidad} for det in pedido.detalles]
         }
-        await manager.broadcast(json.dumps(mensaje_caja), client_id=str(id_caja))
+        await manager.broadcast(a_json(mensaje_caja), client_id=str(id_caja))
     
     return {"mensaje": "Notificación de cobro en efectivo enviada a caja."}
\ No newline at end of file
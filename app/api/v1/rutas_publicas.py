@@ -7,23 +7,19 @@ from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session, joinedload
 
 from app.core.app_setup import templates
-from app.db.conexion import SessionLocal
+from app.api.v1.respuestas_carta import CartaVirtualResponse
+from app.db.conexion import get_db
 from app.db.modelos import modelos_core
 from app.db.modelos import modelos_configuracion, modelos_operativos
 
 from app.esquemas import esquemas_configuracion
+from app.servicios import servicio_carta, servicio_negocio
 
 from typing import List, Optional
 from urllib.parse import unquote
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.get("/carta/{slug_negocio}/{zona_id}/{mesa_id}", response_class=HTMLResponse)
 def get_carta_virtual(
@@ -33,31 +29,18 @@ def get_carta_virtual(
     mesa_id: int,
     db: Session = Depends(get_db)
 ):
-    nombre_decodificado = unquote(slug_negocio)
-    negocio = db.query(modelos_core.Negocio).filter(modelos_core.Negocio.nombre_comercial == nombre_decodificado).first()
-    if not negocio:
-        raise HTTPException(status_code=404, detail=f"No se encontró el negocio '{nombre_decodificado}'.")
+    negocio = servicio_negocio.resolver_negocio(db, slug_negocio)
+    if not negocio or not negocio.activo:
+        raise HTTPException(status_code=404, detail=f"No se encontró el negocio '{unquote(slug_negocio)}'.")
     
     mesa = db.query(modelos_core.Mesa).filter(modelos_core.Mesa.id == mesa_id).first()
     zona = db.query(modelos_core.Zona).filter(modelos_core.Zona.id == zona_id).first()
     if not mesa or not zona:
          raise HTTPException(status_code=404, detail="La mesa o zona especificadas no existen.")
         
-    categorias = db.query(modelos_core.Categoria).options(
-        joinedload(modelos_core.Categoria.productos).joinedload(modelos_core.Producto.variantes)
-    ).filter(modelos_core.Categoria.negocio_id == negocio.id).all()
+    menu = servicio_carta.get_menu(db, negocio.id)
 
-    brand_config = request.state.brand_config
-    
-    context = {
-        "request": request,
-        "negocio": negocio,
-        "categorias": categorias,
-        "brand_config": brand_config,
-        "mesa_id": mesa_id,
-        "zona_id": zona_id
-    }
-    return templates.TemplateResponse("public/carta_virtual.html", context)
+    return CartaVirtualResponse(request, negocio, menu)
 
 
 # === AÑADE ESTA NUEVA RUTA ===
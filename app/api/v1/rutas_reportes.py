@@ -0,0 +1,79 @@
+from datetime import date, timedelta
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from app.db.conexion import get_db
+from app.api.v1.rutas_usuarios import get_current_user
+from app.servicios.servicio_usuario import UsuarioAutenticado
+from app.servicios import servicio_reportes
+from app.core.fechas import dia_local
+
+router = APIRouter()
+
+# Los resúmenes son diarios: incluso dos años de un local son pocas miles de filas
+MAX_DIAS_RANGO = 731
+
+
+# --- Dependencias ---
+def get_dueno(current_user: UsuarioAutenticado = Depends(get_current_user)):
+    if current_user.rol_nombre != 'Dueño':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo el dueño puede ver los reportes.")
+    return current_user
+
+def rango_fechas(
+    desde: Optional[date] = Query(None, description="Primer día local incluido. Por defecto, hace 29 días."),
+    hasta: Optional[date] = Query(None, description="Último día local incluido. Por defecto, hoy.")
+):
+    hasta = hasta or dia_local()
+    desde = desde or hasta - timedelta(days=29)
+    if desde > hasta:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'desde' no puede ser posterior a 'hasta'.")
+    if (hasta - desde).days >= MAX_DIAS_RANGO:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"El rango no puede superar {MAX_DIAS_RANGO} días.")
+    return desde, hasta
+
+
+# --- Endpoints ---
+@router.get("/panel/reportes/ventas", response_model=List[dict])
+def get_reporte_ventas(
+    agrupar: Literal["dia", "local", "centro", "producto"] = "dia",
+    local_id: Optional[int] = None,
+    rango: tuple = Depends(rango_fechas),
+    db: Session = Depends(get_db),
+    current_user: UsuarioAutenticado = Depends(get_dueno)
+):
+    """
+    Cantidad vendida y bruto del rango, agrupados por día, local, centro de producción
+    o producto. Lee el resumen diario, nunca los detalles de pedido.
+    """
+    desde, hasta = rango
+    return servicio_reportes.ventas_por(db, current_user.negocio_id, desde, hasta, agrupar, local_id)
+
+@router.get("/panel/reportes/productos-top", response_model=List[dict])
+def get_reporte_productos_top(
+    limite: int = Query(10, ge=1, le=100),
+    criterio: Literal["cantidad", "bruto"] = "cantidad",
+    local_id: Optional[int] = None,
+    rango: tuple = Depends(rango_fechas),
+    db: Session = Depends(get_db),
+    current_user: UsuarioAutenticado = Depends(get_dueno)
+):
+    """Los productos más vendidos del rango, por unidades o por importe."""
+    desde, hasta = rango
+    return servicio_reportes.productos_top(db, current_user.negocio_id, desde, hasta, limite, criterio, local_id)
+
+@router.get("/panel/reportes/cobros", response_model=List[dict])
+def get_reporte_cobros(
+    local_id: Optional[int] = None,
+    rango: tuple = Depends(rango_fechas),
+    db: Session = Depends(get_db),
+    current_user: UsuarioAutenticado = Depends(get_dueno)
+):
+    """
+    Transacciones, monto y propinas por medio de pago. Los cobros se resumen en el
+    recálculo nocturno (scripts/recalcular_resumenes.py): el día en curso no aparece hasta entonces.
+    """
+    desde, hasta = rango
+    return servicio_reportes.cobros_por_medio(db, current_user.negocio_id, desde, hasta, local_id)
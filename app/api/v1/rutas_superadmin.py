@@ -1,26 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
 # Importaciones estandarizadas
-from app.db.conexion import SessionLocal
+from app.db.conexion import get_db, get_async_db, estadisticas_pool
 from app.db.modelos import modelos_core
 from app.esquemas import esquemas_core
 from app.api.v1.rutas_usuarios import get_current_user
-from app.core.seguridad import hashear_password
+from app.servicios.servicio_usuario import UsuarioAutenticado
+from app.core.seguridad import hashear_password_async, estadisticas_hashing
+from app.core.websocket_manager import manager
+from app.servicios.servicio_negocio import generar_slug_unico
+from app.servicios import servicio_llm, servicio_orden_voz
+from app.servicios.servicio_demoras import planificador_demoras
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+class ConfiguracionLote(BaseModel):
+    # ventana_ms=None devuelve el centro a la configuración por defecto (WS_LOTE_VENTANA_MS)
+    ventana_ms: Optional[int] = Field(None, ge=0, le=1000)
+    max_lote: Optional[int] = Field(None, ge=1, le=500)
+
 
 # --- Dependencia de Seguridad Específica para Super-Admin ---
-def get_super_usuario(current_user: modelos_core.Usuario = Depends(get_current_user)):
-    if not current_user.rol or current_user.rol.nombre != 'SuperUsuario':
+def get_super_usuario(current_user: UsuarioAutenticado = Depends(get_current_user)):
+    if current_user.rol_nombre != 'SuperUsuario':
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Acceso denegado. Se requieren permisos de Super Administrador."
@@ -32,7 +40,7 @@ def get_super_usuario(current_user: modelos_core.Usuario = Depends(get_current_u
 @router.get("/superadmin/negocios", response_model=List[esquemas_core.Negocio])
 def get_lista_negocios(
     db: Session = Depends(get_db),
-    super_user: modelos_core.Usuario = Depends(get_super_usuario)
+    super_user: UsuarioAutenticado = Depends(get_super_usuario)
 ):
     """
     Devuelve una lista de todos los negocios registrados en el sistema.
@@ -41,26 +49,33 @@ def get_lista_negocios(
     return negocios
 
 @router.post("/superadmin/negocios", response_model=esquemas_core.Negocio, status_code=status.HTTP_201_CREATED)
-def crear_negocio_y_dueño(
+async def crear_negocio_y_dueño(
     negocio_in: esquemas_core.NegocioCreate,
-    db: Session = Depends(get_db),
-    super_user: modelos_core.Usuario = Depends(get_super_usuario)
+    db: AsyncSession = Depends(get_async_db),
+    super_user: UsuarioAutenticado = Depends(get_super_usuario)
 ):
     """
     Crea un nuevo Negocio y su primer usuario 'Dueño'.
-    Solo accesible por un SuperUsuario.
+    Solo accesible por un SuperUsuario. Async: el hash de la contraseña espera en el
+    pool de bcrypt, no en un hilo de peticiones.
     """
     # Verificar si el RUC o el email del dueño ya existen
-    db_negocio = db.query(modelos_core.Negocio).filter(modelos_core.Negocio.ruc == negocio_in.ruc).first()
+    db_negocio = (await db.execute(
+        select(modelos_core.Negocio.id).where(modelos_core.Negocio.ruc == negocio_in.ruc)
+    )).first()
     if db_negocio:
         raise HTTPException(status_code=400, detail="El RUC ya está registrado.")
     
-    db_usuario = db.query(modelos_core.Usuario).filter(modelos_core.Usuario.email == negocio_in.dueño.email).first()
+    db_usuario = (await db.execute(
+        select(modelos_core.Usuario.id).where(modelos_core.Usuario.email == negocio_in.dueño.email)
+    )).first()
     if db_usuario:
         raise HTTPException(status_code=400, detail="El email del dueño ya está en uso.")
 
     # Obtener el rol de "Dueño"
-    rol_dueño = db.query(modelos_core.Rol).filter(modelos_core.Rol.nombre == 'Dueño').first()
+    rol_dueño = (await db.execute(
+        select(modelos_core.Rol).where(modelos_core.Rol.nombre == 'Dueño').limit(1)
+    )).scalars().first()
     if not rol_dueño:
         raise HTTPException(status_code=500, detail="El rol 'Dueño' no está configurado en el sistema.")
 
@@ -69,10 +84,11 @@ def crear_negocio_y_dueño(
         ruc=negocio_in.ruc,
         razon_social=negocio_in.razon_social,
         nombre_comercial=negocio_in.nombre_comercial,
+        slug=await generar_slug_unico(db, negocio_in.nombre_comercial),
         marca_origen=negocio_in.marca_origen
     )
     db.add(nuevo_negocio)
-    db.flush() # Para obtener el ID del nuevo negocio antes del commit
+    await db.flush() # Para obtener el ID del nuevo negocio antes del commit
 
     # Crear el usuario dueño asociado
     nuevo_dueño = modelos_core.Usuario(
@@ -81,13 +97,74 @@ def crear_negocio_y_dueño(
         numero_documento=negocio_in.dueño.numero_documento,
         email=negocio_in.dueño.email,
         telefono=negocio_in.dueño.telefono,
-        password_hashed=hashear_password(negocio_in.dueño.password),
+        password_hashed=await hashear_password_async(negocio_in.dueño.password),
         rol_id=rol_dueño.id,
         negocio_id=nuevo_negocio.id # <-- Asociación clave
     )
     db.add(nuevo_dueño)
     
-    db.commit()
-    db.refresh(nuevo_negocio)
-    
-    return nuevo_negocio
\ No newline at end of file
+    await db.commit()
+    # Sin carga perezosa en async: los valores por defecto del servidor y 'locales' se leen aquí
+    return (await db.execute(
+        select(modelos_core.Negocio)
+        .options(selectinload(modelos_core.Negocio.locales))
+        .where(modelos_core.Negocio.id == nuevo_negocio.id)
+        .execution_options(populate_existing=True)
+    )).scalars().one()
+
+
+@router.get("/superadmin/seguridad/hashing", response_model=dict)
+def get_metricas_hashing(super_user: UsuarioAutenticado = Depends(get_super_usuario)):
+    """
+    Estado del pool de bcrypt de este worker: trabajos en cola y en ejecución,
+    espera media en cola y coste medio de cada hash/verificación.
+    """
+    return estadisticas_hashing()
+
+
+@router.get("/superadmin/llm/metricas", response_model=dict)
+def get_metricas_llm(super_user: UsuarioAutenticado = Depends(get_super_usuario)):
+    """
+    Órdenes de voz de este worker: cuántas resolvió el intérprete local, y de las
+    llamadas al LLM, timeouts, errores, rechazos con el circuito abierto y su estado.
+    """
+    return {**servicio_orden_voz.METRICAS_INTERPRETE, **servicio_llm.get_cliente().estadisticas()}
+
+
+@router.get("/superadmin/websockets/metricas", response_model=dict)
+async def get_metricas_websockets(super_user: UsuarioAutenticado = Depends(get_super_usuario)):
+    """
+    Devuelve los contadores de difusión de este worker: mensajes encolados,
+    enviados y descartados, sockets expulsados por lentos, rotos o inactivos, el
+    detalle de cada socket (latencia, bytes, última señal) y los plazos de demora
+    que lleva el planificador del KDS. Es async para leer ese estado en el hilo del
+    event loop, que es quien lo modifica.
+    """
+    return {
+        **manager.estadisticas(),
+        "conexiones": manager.detalle_conexiones(),
+        "demoras": planificador_demoras.estadisticas(),
+    }
+
+
+@router.put("/superadmin/websockets/lotes/{centro_id}", response_model=dict)
+async def configurar_lote_centro(
+    centro_id: int,
+    configuracion: ConfiguracionLote,
+    super_user: UsuarioAutenticado = Depends(get_super_usuario)
+):
+    """
+    Ajusta en caliente, en todos los workers, los micro-lotes de eventos de un centro:
+    cuántos ms se agrupan sus eventos en una sola trama y cuántos como máximo.
+    """
+    await manager.configurar_lote(str(centro_id), configuracion.ventana_ms, configuracion.max_lote)
+    return {"centro_id": centro_id, **configuracion.model_dump()}
+
+
+@router.get("/superadmin/db/pool", response_model=dict)
+def get_metricas_pool(super_user: UsuarioAutenticado = Depends(get_super_usuario)):
+    """
+    Devuelve el estado de los pools de conexiones de este worker (en uso, libres,
+    overflow) y las esperas acumuladas para obtener conexión, incluidos los timeouts.
+    """
+    return estadisticas_pool()
\ No newline at end of file
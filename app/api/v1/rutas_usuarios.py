@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.requests import HTTPConnection
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from jose import JWTError, jwt
 
 # Importaciones estandarizadas
-from app.db.conexion import SessionLocal
+from app.db.conexion import get_db
 from app.db.modelos.modelos_core import Usuario
 from app.esquemas import esquemas_core
 from app.core.config import settings
@@ -15,48 +16,47 @@ router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 # --- DEPENDENCIA DE SEGURIDAD RECONSTRUIDA ---
-async def get_current_user(
-    request: Request,
-    db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No se pudieron validar las credenciales",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+def token_de_conexion(conexion: HTTPConnection) -> Optional[str]:
+    """El JWT de una petición o de un WebSocket: cookie primero, luego cabecera Authorization."""
     # Intenta obtener el token de la cookie primero (para cargas de página)
-    token = request.cookies.get("access_token")
+    token = conexion.cookies.get("access_token")
     if token:
         # La cookie incluye "Bearer ", lo eliminamos
         token = token.split("Bearer ")[-1]
 
     # Si no hay cookie, intenta obtenerlo de la cabecera Authorization (para llamadas de API)
     if not token:
-        auth_header = request.headers.get("Authorization")
+        auth_header = conexion.headers.get("Authorization")
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split("Bearer ")[-1]
-    
-    if token is None:
-        raise credentials_exception
+    return token or None
 
+def usuario_de_token(db: Session, token: str) -> Optional[servicio_usuario.UsuarioAutenticado]:
+    """Valida el JWT y resuelve su sujeto; None si el token no es válido o el usuario no existe."""
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        numero_documento: str = payload.get("sub")
-        if numero_documento is None:
-            raise credentials_exception
     except JWTError:
+        return None
+    numero_documento: str = payload.get("sub")
+    if numero_documento is None:
+        return None
+    return servicio_usuario.get_usuario_autenticado(db, numero_documento)
+
+async def get_current_user(
+    request: Request,
+    db: Session = Depends(get_db)
+) -> servicio_usuario.UsuarioAutenticado:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="No se pudieron validar las credenciales",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    token = token_de_conexion(request)
+    if token is None:
         raise credentials_exception
-    
-    usuario = db.query(Usuario).filter(Usuario.numero_documento == numero_documento).first()
+    usuario = usuario_de_token(db, token)
     if usuario is None:
         raise credentials_exception
     return usuario
@@ -67,12 +67,12 @@ def read_users(
     skip: int = 0, 
     limit: int = 100, 
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: servicio_usuario.UsuarioAutenticado = Depends(get_current_user)
 ):
     """
     Obtiene una lista de usuarios. Requiere autenticación.
     """
-    if current_user.rol.nombre != 'SuperUsuario': # Ejemplo de protección por rol
+    if current_user.rol_nombre != 'SuperUsuario': # Ejemplo de protección por rol
         raise HTTPException(status_code=403, detail="No tienes permiso para ver todos los usuarios.")
     
     users = servicio_usuario.get_users(db, skip=skip, limit=limit)
@@ -5,19 +5,15 @@ from sqlalchemy.orm import Session
 
 # --- IMPORTACIONES ESTANDARIZADAS ---
 from app.core.app_setup import templates
-from app.db.conexion import SessionLocal
+from app.db.conexion import get_db
 from app.api.v1.rutas_usuarios import get_current_user
+from app.servicios.servicio_usuario import UsuarioAutenticado
 from app.db.modelos import modelos_core, modelos_operativos
 from app.api.v1.rutas_superadmin import get_super_usuario
+from app.servicios import servicio_metricas
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -38,22 +34,17 @@ async def login_page(request: Request):
 @router.get("/panel", response_class=HTMLResponse)
 def get_panel_page(
     request: Request,
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    db: Session = Depends(get_db),
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
     """
     Sirve la página principal del panel (Dashboard).
     """
     brand_config = request.state.brand_config
     
-    # --- DATOS DE EJEMPLO AMPLIADOS ---
-    dashboard_data = {
-        "ventas_hoy": 2847.30,
-        "comparacion_ayer": 12.5,
-        "pedidos_activos": 18,
-        "promedio_diario": 15,
-        "alertas_stock": 5,
-        "clientes_atendidos": 142
-    }
+    # Contadores mantenidos al escribir pedidos: no se suma el histórico en cada carga
+    dashboard_data = servicio_metricas.leer_dashboard(db, current_user.negocio_id)
+    dashboard_data["alertas_stock"] = servicio_metricas.contar_alertas_stock(db, current_user.negocio_id)
 
     # --- NUEVOS DATOS PARA "ACTIVIDAD RECIENTE" ---
     actividad_reciente = [
@@ -77,7 +68,7 @@ def get_kds_page(
     request: Request,
     centro_id: int,
     db: Session = Depends(get_db),
-    current_user: modelos_core.Usuario = Depends(get_current_user) # Usamos la referencia completa
+    current_user: UsuarioAutenticado = Depends(get_current_user) # Usamos la referencia completa
 ):
     """
     Sirve la página del Monitor de Cocina/Barra (KDS).
@@ -115,7 +106,7 @@ def get_kds_page(
 @router.get("/panel/superadmin/negocios", response_class=HTMLResponse)
 def get_gestion_negocios_page(
     request: Request,
-    current_user: modelos_core.Usuario = Depends(get_super_usuario) # Protegido
+    current_user: UsuarioAutenticado = Depends(get_super_usuario) # Protegido
 ):
     """
     Sirve la página de gestión de negocios para el Super-Admin.
@@ -132,12 +123,12 @@ def get_gestion_negocios_page(
 @router.get("/panel/configuracion", response_class=HTMLResponse)
 def get_configuracion_page(
     request: Request,
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
     """
     Sirve la página de configuración del negocio para el rol 'Dueño'.
     """
-    if current_user.rol.nombre != 'Dueño':
+    if current_user.rol_nombre != 'Dueño':
         return RedirectResponse(url="/panel", status_code=status.HTTP_303_SEE_OTHER)
 
     brand_config = request.state.brand_config
@@ -152,13 +143,13 @@ def get_configuracion_page(
 @router.get("/panel/personal", response_class=HTMLResponse)
 def get_personal_page(
     request: Request,
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
     """
     Sirve la página de gestión de personal.
     (En el futuro, protegeremos esta ruta por permiso, no por rol).
     """
-    if current_user.rol.nombre not in ['Dueño', 'SuperUsuario']:
+    if current_user.rol_nombre not in ['Dueño', 'SuperUsuario']:
         # Redirigir a una página de "acceso denegado" o al dashboard
         return RedirectResponse(url="/panel", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -175,7 +166,8 @@ def get_personal_page(
 @router.get("/panel/guia-demo", response_class=HTMLResponse)
 def get_guia_demo_page(
     request: Request,
-    current_user: modelos_core.Usuario = Depends(get_current_user)
+    db: Session = Depends(get_db),
+    current_user: UsuarioAutenticado = Depends(get_current_user)
 ):
     """
     Sirve una página interna con los enlaces y credenciales para la demo.
@@ -187,39 +179,34 @@ def get_guia_demo_page(
         "nieves": {"slug": "Nieves"}
     }
 
-    db = SessionLocal()
-    try:
-        # --- LÓGICA CORREGIDA Y ROBUSTA ---
-        # IDs para Restaurante "Sabor Criollo"
-        negocio_resto = db.query(modelos_core.Negocio).filter_by(nombre_comercial='Sabor Criollo').first()
-        if negocio_resto:
-            local_resto = db.query(modelos_core.Local).filter_by(negocio_id=negocio_resto.id).first()
-            if local_resto:
-                zona_resto = db.query(modelos_core.Zona).filter_by(local_id=local_resto.id).first()
-                if zona_resto:
-                    mesa_resto = db.query(modelos_core.Mesa).filter_by(zona_id=zona_resto.id).first()
-                    demo_data["sabor_criollo"]["zona"] = zona_resto.id
-                    demo_data["sabor_criollo"]["mesa"] = mesa_resto.id
-
-            demo_data["sabor_criollo"]["kds_cocina"] = db.query(modelos_operativos.CentroProduccion.id).filter_by(nombre='Cocina', negocio_id=negocio_resto.id).scalar()
-            demo_data["sabor_criollo"]["kds_barra"] = db.query(modelos_operativos.CentroProduccion.id).filter_by(nombre='Barra', negocio_id=negocio_resto.id).scalar()
-
-        # IDs para Discoteca "Nieves"
-        negocio_disco = db.query(modelos_core.Negocio).filter_by(nombre_comercial='Nieves').first()
-        if negocio_disco:
-            local_disco = db.query(modelos_core.Local).filter_by(negocio_id=negocio_disco.id).first()
-            if local_disco:
-                zona_disco = db.query(modelos_core.Zona).filter_by(local_id=local_disco.id).first()
-                if zona_disco:
-                    mesa_disco = db.query(modelos_core.Mesa).filter_by(zona_id=zona_disco.id).first()
-                    demo_data["nieves"]["zona"] = zona_disco.id
-                    demo_data["nieves"]["mesa"] = mesa_disco.id
-
-            demo_data["nieves"]["kds_caja"] = db.query(modelos_operativos.CentroProduccion.id).filter_by(nombre='Caja', negocio_id=negocio_disco.id).scalar()
-            demo_data["nieves"]["kds_barra"] = db.query(modelos_operativos.CentroProduccion.id).filter_by(nombre='Barra Principal', negocio_id=negocio_disco.id).scalar()
-
-    finally:
-        db.close()
+    # --- LÓGICA CORREGIDA Y ROBUSTA ---
+    # IDs para Restaurante "Sabor Criollo"
+    negocio_resto = db.query(modelos_core.Negocio).filter_by(nombre_comercial='Sabor Criollo').first()
+    if negocio_resto:
+        local_resto = db.query(modelos_core.Local).filter_by(negocio_id=negocio_resto.id).first()
+        if local_resto:
+            zona_resto = db.query(modelos_core.Zona).filter_by(local_id=local_resto.id).first()
+            if zona_resto:
+                mesa_resto = db.query(modelos_core.Mesa).filter_by(zona_id=zona_resto.id).first()
+                demo_data["sabor_criollo"]["zona"] = zona_resto.id
+                demo_data["sabor_criollo"]["mesa"] = mesa_resto.id
+
+        demo_data["sabor_criollo"]["kds_cocina"] = db.query(modelos_operativos.CentroProduccion.id).filter_by(nombre='Cocina', negocio_id=negocio_resto.id).scalar()
+        demo_data["sabor_criollo"]["kds_barra"] = db.query(modelos_operativos.CentroProduccion.id).filter_by(nombre='Barra', negocio_id=negocio_resto.id).scalar()
+
+    # IDs para Discoteca "Nieves"
+    negocio_disco = db.query(modelos_core.Negocio).filter_by(nombre_comercial='Nieves').first()
+    if negocio_disco:
+        local_disco = db.query(modelos_core.Local).filter_by(negocio_id=negocio_disco.id).first()
+        if local_disco:
+            zona_disco = db.query(modelos_core.Zona).filter_by(local_id=local_disco.id).first()
+            if zona_disco:
+                mesa_disco = db.query(modelos_core.Mesa).filter_by(zona_id=zona_disco.id).first()
+                demo_data["nieves"]["zona"] = zona_disco.id
+                demo_data["nieves"]["mesa"] = mesa_disco.id
+
+        demo_data["nieves"]["kds_caja"] = db.query(modelos_operativos.CentroProduccion.id).filter_by(nombre='Caja', negocio_id=negocio_disco.id).scalar()
+        demo_data["nieves"]["kds_barra"] = db.query(modelos_operativos.CentroProduccion.id).filter_by(nombre='Barra Principal', negocio_id=negocio_disco.id).scalar()
 
     context = {
         "request": request,
@@ -0,0 +1,33 @@
+# app/core/fechas.py
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from app.core.config import settings
+
+
+def zona_horaria(nombre: Optional[str] = None) -> ZoneInfo:
+    """Zona horaria del negocio (por ahora, la misma para todos: settings.ZONA_HORARIA)."""
+    return ZoneInfo(nombre or settings.ZONA_HORARIA)
+
+
+def dia_local(instante: Optional[datetime] = None, zona: Optional[str] = None) -> date:
+    """Fecha local de un instante (por defecto, ahora). Los instantes sin zona se toman como UTC."""
+    tz = zona_horaria(zona)
+    if instante is None:
+        return datetime.now(tz).date()
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=timezone.utc)
+    return instante.astimezone(tz).date()
+
+
+def rango_dia_local(dia: Optional[date] = None, zona: Optional[str] = None) -> Tuple[datetime, datetime]:
+    """
+    Devuelve [inicio, fin) del día local como instantes UTC. Sirve para filtrar
+    columnas timestamptz por rango, sin envolverlas en date(), que anula los índices.
+    """
+    tz = zona_horaria(zona)
+    dia = dia or datetime.now(tz).date()
+    inicio = datetime.combine(dia, time.min, tzinfo=tz)
+    fin = datetime.combine(dia + timedelta(days=1), time.min, tzinfo=tz)
+    return inicio.astimezone(timezone.utc), fin.astimezone(timezone.utc)
@@ -1,5 +1,9 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Callable, Optional, Tuple, TypeVar
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.core.config import settings
@@ -10,13 +14,83 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # --- ¡CONSTANTE AÑADIDA Y CORREGIDA! ---
 ACCESS_TOKEN_EXPIRE_MINUTES = 480 # 8 horas
 
+# --- POOL DEDICADO PARA BCRYPT ---
+# bcrypt libera el GIL mientras calcula, así que basta un pool de hilos pequeño y propio:
+# limita cuántos hashes corren a la vez sin ocupar el threadpool de las rutas síncronas.
+_pool_hashing = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_lock_metricas = threading.Lock()
+METRICAS_HASHING = {
+    "en_cola": 0,
+    "en_ejecucion": 0,
+    "completadas": 0,
+    "rehashes": 0,
+    "espera_total_ms": 0.0,
+    "espera_max_ms": 0.0,
+    "trabajo_total_ms": 0.0,
+}
+
+T = TypeVar("T")
+
+def _medir(funcion: Callable[..., T], encolado: float, *args) -> T:
+    """Se ejecuta dentro del pool: registra la espera en cola y el tiempo de bcrypt."""
+    inicio = time.perf_counter()
+    espera_ms = (inicio - encolado) * 1000
+    with _lock_metricas:
+        METRICAS_HASHING["en_cola"] -= 1
+        METRICAS_HASHING["en_ejecucion"] += 1
+        METRICAS_HASHING["espera_total_ms"] += espera_ms
+        METRICAS_HASHING["espera_max_ms"] = max(METRICAS_HASHING["espera_max_ms"], espera_ms)
+    try:
+        return funcion(*args)
+    finally:
+        with _lock_metricas:
+            METRICAS_HASHING["en_ejecucion"] -= 1
+            METRICAS_HASHING["completadas"] += 1
+            METRICAS_HASHING["trabajo_total_ms"] += (time.perf_counter() - inicio) * 1000
+
+def _enviar_al_pool(funcion: Callable[..., T], *args):
+    with _lock_metricas:
+        METRICAS_HASHING["en_cola"] += 1
+    return _pool_hashing.submit(_medir, funcion, time.perf_counter(), *args)
+
+def estadisticas_hashing() -> dict:
+    with _lock_metricas:
+        metricas = dict(METRICAS_HASHING)
+    completadas = metricas["completadas"]
+    return {
+        **metricas,
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "espera_media_ms": metricas["espera_total_ms"] / completadas if completadas else 0.0,
+        "trabajo_medio_ms": metricas["trabajo_total_ms"] / completadas if completadas else 0.0,
+    }
+
+
 def verificar_password(password_plano: str, password_hashed: str) -> bool:
     """Verifica si una contraseña en texto plano coincide con una hasheada."""
-    return pwd_context.verify(password_plano, password_hashed)
+    return _enviar_al_pool(pwd_context.verify, password_plano, password_hashed).result()
 
 def hashear_password(password: str) -> str:
     """Genera el hash de una contraseña."""
-    return pwd_context.hash(password)
+    return _enviar_al_pool(pwd_context.hash, password).result()
+
+async def verificar_password_async(password_plano: str, password_hashed: str) -> bool:
+    return await asyncio.wrap_future(_enviar_al_pool(pwd_context.verify, password_plano, password_hashed))
+
+async def hashear_password_async(password: str) -> str:
+    return await asyncio.wrap_future(_enviar_al_pool(pwd_context.hash, password))
+
+async def verificar_y_actualizar_async(password_plano: str, password_hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica la contraseña y, si passlib considera el hash obsoleto (needs_update:
+    esquema o número de rondas antiguos), devuelve también el hash nuevo para guardarlo.
+    """
+    valido, nuevo_hash = await asyncio.wrap_future(
+        _enviar_al_pool(pwd_context.verify_and_update, password_plano, password_hashed)
+    )
+    if nuevo_hash:
+        with _lock_metricas:
+            METRICAS_HASHING["rehashes"] += 1
+    return valido, nuevo_hash
 
 
 def crear_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -0,0 +1,32 @@
+# app/core/serializacion.py
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# Claves no str (p. ej. ids enteros en dicts de métricas) se escriben como texto, igual que json.dumps
+OPCIONES = orjson.OPT_NON_STR_KEYS
+
+
+def _por_defecto(valor: Any):
+    # datetime, date, UUID y Enum los resuelve orjson; Decimal no
+    if isinstance(valor, Decimal):
+        return float(valor) # el front opera con números (toFixed)
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+def a_json(valor: Any) -> bytes:
+    """JSON en UTF-8, listo para la red. Es la única serialización de API y WebSockets."""
+    return orjson.dumps(valor, default=_por_defecto, option=OPCIONES)
+
+def de_json(datos) -> Any:
+    return orjson.loads(datos)
+
+
+class RespuestaJSON(JSONResponse):
+    """
+    Respuesta por defecto de la app (default_response_class). Devolverla directamente
+    desde una ruta, con dicts ya armados, evita además el jsonable_encoder de FastAPI.
+    """
+    def render(self, content: Any) -> bytes:
+        return a_json(content)
@@ -1,31 +1,617 @@
+import asyncio
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter, deque
 from fastapi import WebSocket
-from typing import Dict, List
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
+from sqlalchemy.engine import make_url
+from app.core.config import settings
+from app.core.serializacion import a_json, de_json
+
+# Firma del callback con el que un backend entrega un mensaje (JSON ya codificado) a los sockets locales
+EntregaLocal = Callable[[str, bytes], Awaitable[None]]
+# Mensaje vacío: el evento real no pudo viajar y los sockets del canal deben recargar desde la API
+RECARGAR = b""
+
+
+# --- BACKENDS DE DIFUSIÓN (PUB/SUB) ---
+
+class BackendDifusion(ABC):
+    """
+    Interfaz de los backends de difusión. 'publicar' envía un mensaje a un canal
+    (centro de producción) y el backend se encarga de que cada proceso lo reciba
+    y lo entregue, mediante 'entregar', solo a sus propios sockets. Si el backend
+    pudo perder mensajes (p. ej. tras reconectarse) llama a 'perdida'.
+    'publicar' no lanza: el mensaje sale después del commit de quien lo envía.
+    """
+    async def iniciar(self, entregar: EntregaLocal, perdida: Optional[Callable[[], None]] = None) -> None:
+        self.entregar = entregar
+        self.perdida = perdida
+
+    @abstractmethod
+    async def publicar(self, canal: str, mensaje: bytes) -> None:
+        ...
+
+    async def detener(self) -> None:
+        pass
+
+
+class BackendEnProceso(BackendDifusion):
+    """Backend por defecto: entrega directa a los sockets de este mismo proceso."""
+
+    def __init__(self, entregar: Optional[EntregaLocal] = None):
+        self.entregar = entregar
+
+    async def publicar(self, canal: str, mensaje: bytes) -> None:
+        await self.entregar(canal, mensaje)
+
+
+class BackendPostgres(BackendDifusion):
+    """
+    Backend multi-proceso sobre LISTEN/NOTIFY de la base de datos existente.
+    Cada worker escucha el mismo canal de Postgres y reparte las notificaciones
+    entre sus sockets locales, incluidas las que él mismo publicó.
+    """
+    CANAL_PG = "sirveme_ws"
+    # NOTIFY rechaza payloads de 8000 bytes o más
+    MAX_PAYLOAD = 7999
+    # Segundos entre intentos de recuperar la conexión de escucha
+    ESPERA_RECONEXION = 2
+
+    def __init__(self, database_url: str):
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.conexion_escucha = None
+        self.fd_escucha: Optional[int] = None
+        self.conexion_publicacion = None
+        self.lock_publicacion = asyncio.Lock()
+        self.tarea_reconexion: Optional[asyncio.Task] = None
+        # Notificaciones recibidas, en orden; una sola tarea las entrega a los sockets locales
+        self.recibidas: Optional[asyncio.Queue] = None
+        self.tarea_reparto: Optional[asyncio.Task] = None
+
+    def _conectar(self):
+        import psycopg2
+        conexion = psycopg2.connect(self.dsn)
+        conexion.autocommit = True
+        return conexion
+
+    def _conectar_escucha(self):
+        conexion = self._conectar()
+        with conexion.cursor() as cur:
+            cur.execute(f"LISTEN {self.CANAL_PG};")
+        return conexion
+
+    async def iniciar(self, entregar: EntregaLocal, perdida: Optional[Callable[[], None]] = None) -> None:
+        await super().iniciar(entregar, perdida)
+        self.loop = asyncio.get_running_loop()
+        self.recibidas = asyncio.Queue()
+        self.tarea_reparto = self.loop.create_task(self._repartir())
+        self.conexion_publicacion = await asyncio.to_thread(self._conectar)
+        await self._escuchar()
+
+    async def _repartir(self):
+        """Entrega las notificaciones una a una, en el orden en que llegó cada NOTIFY."""
+        while True:
+            canal, mensaje = await self.recibidas.get()
+            try:
+                await self.entregar(canal, mensaje)
+            except Exception as e:
+                print(f"[WS-PG] Error al entregar un mensaje del canal {canal}: {e!r}")
+
+    async def _escuchar(self):
+        conexion = await asyncio.to_thread(self._conectar_escucha)
+        self.conexion_escucha, self.fd_escucha = conexion, conexion.fileno()
+        self.loop.add_reader(self.fd_escucha, self._leer_notificaciones)
+
+    def _soltar_escucha(self):
+        if self.conexion_escucha is None:
+            return
+        # fileno() ya no responde con la conexión cerrada: se usa el descriptor guardado
+        self.loop.remove_reader(self.fd_escucha)
+        self.conexion_escucha.close()
+        self.conexion_escucha = self.fd_escucha = None
+
+    async def _reconectar_escucha(self):
+        import psycopg2
+        while True:
+            await asyncio.sleep(self.ESPERA_RECONEXION)
+            try:
+                await self._escuchar()
+            except psycopg2.Error as e:
+                print(f"[WS-PG] No se pudo restablecer la escucha: {e}")
+                continue
+            print("[WS-PG] Escucha restablecida.")
+            # Lo notificado mientras tanto se perdió: los KDS de este worker recargan
+            if self.perdida:
+                self.perdida()
+            return
+
+    def _leer_notificaciones(self):
+        import psycopg2
+        try:
+            self.conexion_escucha.poll()
+        except psycopg2.Error as e:
+            print(f"[WS-PG] Conexión de escucha perdida ({e.__class__.__name__}); reconectando...")
+            self._soltar_escucha()
+            if self.tarea_reconexion is None or self.tarea_reconexion.done():
+                self.tarea_reconexion = self.loop.create_task(self._reconectar_escucha())
+            return
+        while self.conexion_escucha.notifies:
+            notificacion = self.conexion_escucha.notifies.pop(0)
+            canal, separador, mensaje = notificacion.payload.partition("\n")
+            if not separador:
+                print(f"[WS-PG] Notificación inválida descartada: {notificacion.payload[:80]}")
+                continue
+            self.recibidas.put_nowait((canal, mensaje.encode("utf-8")))
+
+    def _notificar(self, payload: str):
+        import psycopg2
+        # Un segundo intento con conexión nueva si la anterior se cayó o la cerró el servidor
+        for intento in range(2):
+            try:
+                if self.conexion_publicacion is None or self.conexion_publicacion.closed:
+                    self.conexion_publicacion = self._conectar()
+                with self.conexion_publicacion.cursor() as cur:
+                    cur.execute("SELECT pg_notify(%s, %s);", (self.CANAL_PG, payload))
+                return
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if self.conexion_publicacion is not None:
+                    self.conexion_publicacion.close()
+                    self.conexion_publicacion = None
+                if intento:
+                    raise
+
+    async def publicar(self, canal: str, mensaje: bytes) -> None:
+        if len(canal.encode("utf-8")) + 1 + len(mensaje) > self.MAX_PAYLOAD:
+            # Un pedido grande no cabe en NOTIFY: viaja solo el aviso y el KDS lo lee de la API
+            print(f"[WS-PG] Mensaje de {len(mensaje)} bytes para el canal {canal}: se envía aviso de recarga.")
+            mensaje = RECARGAR
+        # "canal\n<json>": el mensaje viaja tal cual, sin volver a serializarlo dentro de un sobre JSON
+        payload = canal + "\n" + mensaje.decode("utf-8")
+        try:
+            # psycopg2 no admite uso concurrente de una misma conexión
+            async with self.lock_publicacion:
+                await asyncio.to_thread(self._notificar, payload)
+            return
+        except Exception as e:
+            print(f"[WS-PG] Error al publicar en el canal {canal}: {e}")
+        # Al menos los sockets de este worker reciben el evento
+        await self.entregar(canal, mensaje)
+
+    async def detener(self) -> None:
+        for tarea in (self.tarea_reconexion, self.tarea_reparto):
+            if tarea is not None:
+                tarea.cancel()
+        self.tarea_reconexion = self.tarea_reparto = None
+        self._soltar_escucha()
+        if self.conexion_publicacion is not None:
+            self.conexion_publicacion.close()
+            self.conexion_publicacion = None
+
+
+def crear_backend(nombre: str, database_url: str) -> BackendDifusion:
+    """Construye el backend de difusión configurado en settings.WS_BACKEND."""
+    if nombre == "memoria":
+        return BackendEnProceso()
+    if nombre == "postgres":
+        return BackendPostgres(database_url)
+    raise ValueError(f"Backend de WebSocket desconocido: '{nombre}'.")
+
+
+# --- GESTOR DE CONEXIONES ---
+
+# Canal interno por el que se reparte a todos los workers la configuración de lotes de un centro
+CANAL_CONFIG_LOTES = "_lotes"
+
+
+class ConexionCliente:
+    """
+    Un socket conectado con su propia cola de salida acotada. Una tarea escritora
+    dedicada la vacía, de modo que un tablet lento solo se retrasa a sí mismo.
+    Lleva también quién lo abrió y sus métricas de vida (latencia, bytes, última señal).
+    """
+    def __init__(self, websocket: WebSocket, client_id: str, max_cola: int, negocio_id: Optional[int] = None, usuario_id: Optional[int] = None):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=max_cola)
+        self.tarea_escritora: Optional[asyncio.Task] = None
+        self.negocio_id = negocio_id
+        self.usuario_id = usuario_id
+        self.conectado_en = time.time()
+        self.ultimo_visto = self.conectado_en
+        self.pings_sin_respuesta = 0
+        self.latencia_ms: Optional[float] = None # Ida y vuelta del último PING, cola de salida incluida
+        self.bytes_enviados = 0
+        self.mensajes_enviados = 0
+
+    def detalle(self, ahora: float) -> dict:
+        return {
+            "centro": self.client_id,
+            "negocio_id": self.negocio_id,
+            "usuario_id": self.usuario_id,
+            "conectado_hace_s": round(ahora - self.conectado_en),
+            "ultimo_visto_hace_s": round(ahora - self.ultimo_visto, 1),
+            "latencia_ms": self.latencia_ms,
+            "pings_sin_respuesta": self.pings_sin_respuesta,
+            "bytes_enviados": self.bytes_enviados,
+            "mensajes_enviados": self.mensajes_enviados,
+            "mensajes_en_cola": self.cola.qsize(),
+        }
+
 
 class ConnectionManager:
-    def __init__(self):
+    """
+    Cada evento entregado a un centro recibe un número de secuencia creciente y se
+    guarda (ya serializado) en un buffer circular por centro. Un socket que se
+    reconecta con 'resume_from' recibe solo los eventos perdidos; si el hueco ya
+    salió del buffer, o la 'epoca' no es la de este proceso, se le pide un snapshot.
+    Todas las tramas son JSON en UTF-8 enviadas como mensajes binarios.
+    Trama de evento:  {"seq": N, "epoca": "...", "evento": <mensaje original>}
+    Trama de control: {"control": "HOLA" | "SNAPSHOT", "seq": N, "epoca": "..."}
+    Respuesta a un comando del propio socket: {"control": "RESPUESTA", "id": ..., ...}
+    (no lleva secuencia ni se repite al reconectar).
+    Latido: {"control": "PING", "t": ms}; el cliente contesta {"control": "PONG", "t": ms}.
+    Un socket que deja sin contestar 'pings_sin_respuesta' pings seguidos se cierra.
+    Con micro-lotes (ventana_lote_ms > 0, global o por centro), los eventos que llegan
+    a un centro dentro de la ventana salen juntos en una trama con un solo número:
+    {"seq": N, "epoca": "...", "eventos": [<mensaje>, ...]}
+    """
+    def __init__(
+        self,
+        backend: Optional[BackendDifusion] = None,
+        max_cola: int = 100,
+        max_repeticion: int = 200,
+        intervalo_ping: float = 20,
+        pings_sin_respuesta: int = 3,
+        ventana_lote_ms: int = 0,
+        max_lote: int = 20
+    ):
         # Diccionario para guardar conexiones por centro de producción (Cocina, Barra, etc.)
-        # Formato: {"cocina": [ws1, ws2], "barra": [ws3]}
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Formato: {"cocina": [conexion1, conexion2], "barra": [conexion3]}
+        self.active_connections: Dict[str, List[ConexionCliente]] = {}
+        self.backend: BackendDifusion = backend or BackendEnProceso(self.entregar_local)
+        self.max_cola = max_cola
+        # Identifica la numeración de este proceso; cambia en cada arranque
+        self.epoca = uuid.uuid4().hex[:12]
+        self.max_repeticion = max_repeticion
+        self.secuencias: Dict[str, int] = {}
+        self.repeticion: Dict[str, Deque[Tuple[int, bytes]]] = {}
+        # Canales que no son centros: sus mensajes van a un servicio del proceso, no a sockets
+        self.canales_internos: Dict[str, EntregaLocal] = {}
+        self.intervalo_ping = intervalo_ping
+        self.pings_sin_respuesta = pings_sin_respuesta
+        self.tarea_latidos: Optional[asyncio.Task] = None
+        # Cierres de sockets expulsados en curso (el loop solo guarda referencias débiles)
+        self.cierres: Set[asyncio.Task] = set()
+        # Lotes: configuración por defecto, la propia de cada centro, y lo pendiente de enviar
+        self.lote_por_defecto: Tuple[int, int] = (ventana_lote_ms, max_lote)
+        self.lotes_por_centro: Dict[str, Tuple[int, int]] = {}
+        self.lotes_pendientes: Dict[str, List[bytes]] = {}
+        self.temporizadores_lote: Dict[str, asyncio.TimerHandle] = {}
+        self.tamanos_lote: Counter = Counter()
+        self.suscribir_interno(CANAL_CONFIG_LOTES, self._recibir_config_lote)
+        self.metricas = {
+            "mensajes_encolados": 0,
+            "mensajes_enviados": 0,
+            "mensajes_descartados": 0,
+            "conexiones_expulsadas": 0,
+            "eventos_repetidos": 0,
+            "snapshots_solicitados": 0,
+            "conexiones_inactivas_cerradas": 0,
+            "bytes_enviados": 0,
+        }
+
+    async def usar_backend(self, backend: BackendDifusion):
+        """Sustituye el backend de difusión (al arrancar la app, o en pruebas)."""
+        await self.backend.detener()
+        await backend.iniciar(self.entregar_local, self.pedir_snapshots)
+        self.backend = backend
+
+    async def cerrar(self):
+        if self.tarea_latidos:
+            self.tarea_latidos.cancel()
+            self.tarea_latidos = None
+        for client_id in list(self.lotes_pendientes):
+            self._vaciar_lote(client_id)
+        # Cada cierre tiene su propio timeout: esperarlos no alarga el apagado sin límite
+        if self.cierres:
+            await asyncio.gather(*self.cierres, return_exceptions=True)
+        await self.backend.detener()
+
+    def iniciar_latidos(self):
+        """Arranca la tarea que hace ping a todos los sockets y cierra los que no contestan."""
+        if self.tarea_latidos is None:
+            self.tarea_latidos = asyncio.create_task(self._latir())
+
+    async def _latir(self):
+        while True:
+            await asyncio.sleep(self.intervalo_ping)
+            self.revisar_conexiones()
+
+    def revisar_conexiones(self):
+        """
+        Una pasada del latido: cierra los sockets con demasiados pings sin PONG y
+        encola un PING a los demás. Una sola tarea para todo el proceso, no una por socket.
+        """
+        ahora = time.time()
+        ping = a_json({"control": "PING", "t": int(ahora * 1000)})
+        for conexiones in list(self.active_connections.values()):
+            for conexion in list(conexiones):
+                if conexion.pings_sin_respuesta >= self.pings_sin_respuesta:
+                    self.metricas["conexiones_inactivas_cerradas"] += 1
+                    self._expulsar(conexion, f"{conexion.pings_sin_respuesta} pings sin respuesta")
+                    continue
+                conexion.pings_sin_respuesta += 1
+                try:
+                    conexion.cola.put_nowait(ping)
+                except asyncio.QueueFull:
+                    self.metricas["mensajes_descartados"] += 1
+                    self._expulsar(conexion, "cola de salida llena")
+
+    def registrar_actividad(self, conexion: ConexionCliente, pong_t: Optional[int] = None):
+        """Cualquier mensaje del cliente prueba que sigue vivo; un PONG trae además la latencia."""
+        ahora = time.time()
+        conexion.ultimo_visto = ahora
+        conexion.pings_sin_respuesta = 0
+        if isinstance(pong_t, (int, float)):
+            conexion.latencia_ms = round(ahora * 1000 - pong_t, 1)
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    def suscribir_interno(self, canal: str, manejador: EntregaLocal):
+        """
+        Registra un servicio de este proceso como destino de un canal interno. Lo que
+        se publique en ese canal llega, vía backend, al manejador de cada worker.
+        """
+        self.canales_internos[canal] = manejador
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        client_id: str,
+        resume_from: Optional[int] = None,
+        epoca: Optional[str] = None,
+        negocio_id: Optional[int] = None,
+        usuario_id: Optional[int] = None
+    ) -> ConexionCliente:
         await websocket.accept()
+        conexion = ConexionCliente(websocket, client_id, self.max_cola, negocio_id, usuario_id)
+        # Sin 'await' entre la reanudación y el registro: ningún evento se cuela en medio
+        self._reanudar(conexion, resume_from, epoca)
+        conexion.tarea_escritora = asyncio.create_task(self._escribir(conexion))
         if client_id not in self.active_connections:
             self.active_connections[client_id] = []
-        self.active_connections[client_id].append(websocket)
+        self.active_connections[client_id].append(conexion)
         print(f"WS Conexión activa: {client_id}. Total: {len(self.active_connections[client_id])}")
+        return conexion
+
+    def _buscar(self, websocket: WebSocket, client_id: str) -> Optional[ConexionCliente]:
+        return next((c for c in self.active_connections.get(client_id, []) if c.websocket is websocket), None)
+
+    def _quitar(self, conexion: ConexionCliente) -> bool:
+        conexiones = self.active_connections.get(conexion.client_id)
+        if not conexiones or conexion not in conexiones:
+            return False
+        conexiones.remove(conexion)
+        if not conexiones:
+            del self.active_connections[conexion.client_id]
+        if conexion.tarea_escritora and conexion.tarea_escritora is not asyncio.current_task():
+            conexion.tarea_escritora.cancel()
+        return True
 
     def disconnect(self, websocket: WebSocket, client_id: str):
-        if client_id in self.active_connections and websocket in self.active_connections[client_id]:
-            self.active_connections[client_id].remove(websocket)
-            if not self.active_connections[client_id]:
-                del self.active_connections[client_id]
+        conexion = self._buscar(websocket, client_id)
+        if conexion:
+            self._quitar(conexion)
+
+    def _expulsar(self, conexion: ConexionCliente, motivo: str):
+        """Saca de circulación un socket desbordado o roto y lo cierra en segundo plano."""
+        if not self._quitar(conexion):
+            return
+        self.metricas["conexiones_expulsadas"] += 1
+        self.metricas["mensajes_descartados"] += conexion.cola.qsize()
+        print(f"[WS] Conexión expulsada del centro {conexion.client_id}: {motivo}")
+        tarea = asyncio.create_task(self._cerrar_socket(conexion.websocket))
+        self.cierres.add(tarea)
+        tarea.add_done_callback(self.cierres.discard)
+
+    async def _cerrar_socket(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), timeout=5)
+        except Exception:
+            pass
+
+    async def _escribir(self, conexion: ConexionCliente):
+        while True:
+            mensaje = await conexion.cola.get()
+            try:
+                # Tramas binarias: se envían los bytes ya codificados, sin re-codificar por socket
+                await conexion.websocket.send_bytes(mensaje)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metricas["mensajes_descartados"] += 1
+                self._expulsar(conexion, f"error de envío ({e.__class__.__name__})")
+                return
+            conexion.bytes_enviados += len(mensaje)
+            conexion.mensajes_enviados += 1
+            self.metricas["bytes_enviados"] += len(mensaje)
+            self.metricas["mensajes_enviados"] += 1
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
 
-    async def broadcast(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            for connection in self.active_connections[client_id]:
-                await connection.send_text(message)
+    def responder(self, conexion: ConexionCliente, respuesta: dict):
+        """
+        Encola la respuesta a un comando solo para el socket que lo envió. Pasa por su
+        cola, como los eventos, para no escribir en el socket en paralelo a la tarea escritora.
+        """
+        try:
+            conexion.cola.put_nowait(a_json({"control": "RESPUESTA", **respuesta}))
+        except asyncio.QueueFull:
+            self._expulsar(conexion, "cola de salida llena")
+
+    def _trama_control(self, tipo: str, client_id: str) -> bytes:
+        return a_json({"control": tipo, "seq": self.secuencias.get(client_id, 0), "epoca": self.epoca})
+
+    def _reanudar(self, conexion: ConexionCliente, resume_from: Optional[int], epoca: Optional[str]):
+        """Pone en la cola del socket nuevo los eventos que se perdió, o le pide un snapshot."""
+        client_id = conexion.client_id
+        if resume_from is None:
+            conexion.cola.put_nowait(self._trama_control("HOLA", client_id))
+            return
+
+        actual = self.secuencias.get(client_id, 0)
+        buffer = self.repeticion.get(client_id, ())
+        pendientes = [trama for seq, trama in buffer if seq > resume_from]
+        primera_disponible = buffer[0][0] if buffer else actual + 1
+        hueco_cubierto = (
+            epoca == self.epoca
+            and resume_from <= actual
+            and resume_from + 1 >= primera_disponible
+            and len(pendientes) < self.max_cola
+        )
+        if not hueco_cubierto:
+            self.metricas["snapshots_solicitados"] += 1
+            conexion.cola.put_nowait(self._trama_control("SNAPSHOT", client_id))
+            return
+
+        for trama in pendientes:
+            conexion.cola.put_nowait(trama)
+        self.metricas["eventos_repetidos"] += len(pendientes)
+
+    def _secuenciar(self, client_id: str, message: bytes, clave: str = "evento") -> bytes:
+        """Asigna el siguiente número de secuencia del centro y guarda la trama para repetición."""
+        seq = self.secuencias.get(client_id, 0) + 1
+        self.secuencias[client_id] = seq
+        # El mensaje ya es JSON: se incrusta en la trama sin decodificarlo
+        trama = b'{"seq":%d,"epoca":"%s","%s":%s}' % (seq, self.epoca.encode(), clave.encode(), message)
+        if client_id not in self.repeticion:
+            self.repeticion[client_id] = deque(maxlen=self.max_repeticion)
+        self.repeticion[client_id].append((seq, trama))
+        return trama
+
+    async def entregar_local(self, client_id: str, message: bytes):
+        """
+        Secuencia el mensaje (JSON ya codificado), lo encola para los sockets de este
+        proceso y retorna sin esperar el envío. La misma trama sirve a todos los sockets.
+        """
+        manejador = self.canales_internos.get(client_id)
+        if manejador is not None:
+            if message == RECARGAR:
+                print(f"[WS] Mensaje del canal interno {client_id} descartado: no cabía en el backend.")
+                return
+            await manejador(client_id, message)
+            return
+        if message == RECARGAR:
+            self._pedir_snapshot(client_id)
+            return
+        ventana_ms, max_lote = self.lotes_por_centro.get(client_id, self.lote_por_defecto)
+        if ventana_ms <= 0:
+            self._encolar(client_id, self._secuenciar(client_id, message))
+            return
+
+        pendientes = self.lotes_pendientes.setdefault(client_id, [])
+        pendientes.append(message)
+        if len(pendientes) >= max_lote:
+            self._vaciar_lote(client_id)
+        elif len(pendientes) == 1:
+            self.temporizadores_lote[client_id] = asyncio.get_running_loop().call_later(
+                ventana_ms / 1000, self._vaciar_lote, client_id
+            )
+
+    def _vaciar_lote(self, client_id: str):
+        """Envía lo acumulado del centro: un evento suelto tal cual, varios en una trama 'eventos'."""
+        temporizador = self.temporizadores_lote.pop(client_id, None)
+        if temporizador:
+            temporizador.cancel()
+        mensajes = self.lotes_pendientes.pop(client_id, None)
+        if not mensajes:
+            return
+        self.tamanos_lote[len(mensajes)] += 1
+        if len(mensajes) == 1:
+            trama = self._secuenciar(client_id, mensajes[0])
+        else:
+            # Los mensajes ya son JSON: se unen como texto, sin volver a serializarlos
+            trama = self._secuenciar(client_id, b"[" + b",".join(mensajes) + b"]", clave="eventos")
+        self._encolar(client_id, trama)
+
+    def _pedir_snapshot(self, client_id: str):
+        """
+        Un evento del centro no llegará a sus sockets: se les pide recargar desde la API.
+        Se vacía el buffer de repetición para que quien reanude desde antes también recargue.
+        """
+        self._vaciar_lote(client_id)
+        self.secuencias[client_id] = self.secuencias.get(client_id, 0) + 1
+        self.repeticion.pop(client_id, None)
+        self.metricas["snapshots_solicitados"] += len(self.active_connections.get(client_id, ()))
+        self._encolar(client_id, self._trama_control("SNAPSHOT", client_id))
+
+    def pedir_snapshots(self):
+        """Todos los centros con sockets en este worker recargan (el backend pudo perder mensajes)."""
+        for client_id in list(self.active_connections):
+            self._pedir_snapshot(client_id)
+
+    def _encolar(self, client_id: str, trama: bytes):
+        for conexion in list(self.active_connections.get(client_id, [])):
+            try:
+                conexion.cola.put_nowait(trama)
+                self.metricas["mensajes_encolados"] += 1
+            except asyncio.QueueFull:
+                self.metricas["mensajes_descartados"] += 1
+                self._expulsar(conexion, "cola de salida llena")
+
+    async def configurar_lote(self, client_id: str, ventana_ms: Optional[int], max_lote: Optional[int] = None):
+        """
+        Fija la ventana y el tamaño máximo de lote de un centro en todos los workers
+        (ventana_ms=None vuelve a la configuración por defecto). No sobrevive a un reinicio.
+        """
+        await self.backend.publicar(CANAL_CONFIG_LOTES, a_json(
+            {"centro": client_id, "ventana_ms": ventana_ms, "max_lote": max_lote}
+        ))
+
+    async def _recibir_config_lote(self, canal: str, mensaje: bytes):
+        datos = de_json(mensaje)
+        client_id = datos["centro"]
+        self._vaciar_lote(client_id)
+        if datos["ventana_ms"] is None:
+            self.lotes_por_centro.pop(client_id, None)
+        else:
+            self.lotes_por_centro[client_id] = (datos["ventana_ms"], datos["max_lote"] or self.lote_por_defecto[1])
+
+    async def broadcast(self, message: Union[bytes, str], client_id: str):
+        """
+        Publica un mensaje ya codificado (serializacion.a_json) para un centro. Se codifica
+        una vez aquí, no por socket: las tramas se envían como bytes a todos los destinatarios.
+        """
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        await self.backend.publicar(client_id, message)
+
+    def estadisticas(self) -> dict:
+        return {
+            **self.metricas,
+            "conexiones_activas": sum(len(c) for c in self.active_connections.values()),
+            "mensajes_en_cola": sum(c.cola.qsize() for conexiones in self.active_connections.values() for c in conexiones),
+            "lotes": {
+                "ventana_ms": self.lote_por_defecto[0],
+                "max_lote": self.lote_por_defecto[1],
+                "por_centro": {centro: {"ventana_ms": v, "max_lote": m} for centro, (v, m) in self.lotes_por_centro.items()},
+                "enviados": sum(self.tamanos_lote.values()),
+                "eventos": sum(tamano * n for tamano, n in self.tamanos_lote.items()),
+                "por_tamano": dict(sorted(self.tamanos_lote.items())),
+            },
+        }
+
+    def detalle_conexiones(self) -> List[dict]:
+        """Métricas de cada socket de este worker: latencia, bytes enviados y última señal de vida."""
+        ahora = time.time()
+        return [c.detalle(ahora) for conexiones in self.active_connections.values() for c in conexiones]
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager(
+    max_cola=settings.WS_COLA_MAXIMA,
+    max_repeticion=settings.WS_BUFFER_REPETICION,
+    intervalo_ping=settings.WS_INTERVALO_PING,
+    pings_sin_respuesta=settings.WS_PINGS_SIN_RESPUESTA,
+    ventana_lote_ms=settings.WS_LOTE_VENTANA_MS,
+    max_lote=settings.WS_LOTE_MAXIMO
+)
@@ -1,11 +1,92 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker, registry
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+# --- POOL DE CONEXIONES INSTRUMENTADO ---
+
+class _PoolMedidoMixin:
+    """
+    Mide cuánto espera cada petición para obtener una conexión del pool y cuántas
+    se rinden por timeout. El resto de cifras (en uso, overflow) las da el propio pool.
+    """
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            METRICAS_POOL[self._nombre_metricas]["timeouts"] += 1
+            raise
+        finally:
+            espera_ms = (time.perf_counter() - inicio) * 1000
+            metricas = METRICAS_POOL[self._nombre_metricas]
+            metricas["checkouts"] += 1
+            metricas["espera_total_ms"] += espera_ms
+            metricas["espera_max_ms"] = max(metricas["espera_max_ms"], espera_ms)
+
+class PoolMedido(_PoolMedidoMixin, QueuePool):
+    _nombre_metricas = "sync"
+
+class PoolMedidoAsync(_PoolMedidoMixin, AsyncAdaptedQueuePool):
+    _nombre_metricas = "async"
+
+METRICAS_POOL = {
+    nombre: {"checkouts": 0, "timeouts": 0, "espera_total_ms": 0.0, "espera_max_ms": 0.0}
+    for nombre in ("sync", "async")
+}
+
+OPCIONES_POOL = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+}
+
+engine = create_engine(settings.DATABASE_URL, poolclass=PoolMedido, **OPCIONES_POOL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def get_db():
+    """Dependencia única de sesión síncrona para todos los routers."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# --- MOTOR ASÍNCRONO (asyncpg) PARA LAS RUTAS 'async def' ---
+# Misma base de datos que el motor síncrono; solo cambia el driver.
+async_engine = create_async_engine(
+    make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg"),
+    poolclass=PoolMedidoAsync,
+    **OPCIONES_POOL
+)
+# expire_on_commit=False: en modo asíncrono no hay carga perezosa tras el commit
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def estadisticas_pool() -> dict:
+    """Estado en vivo de ambos pools más los contadores acumulados de espera y timeouts."""
+    resultado = {}
+    for nombre, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        metricas = METRICAS_POOL[nombre]
+        resultado[nombre] = {
+            "tamano": pool.size(),
+            "en_uso": pool.checkedout(),
+            "libres": pool.checkedin(),
+            "overflow": pool.overflow(),
+            **metricas,
+            "espera_media_ms": metricas["espera_total_ms"] / metricas["checkouts"] if metricas["checkouts"] else 0.0,
+        }
+    return resultado
+
 #--- LÍNEA A AÑADIR ---
 # Esta línea le dice a SQLAlchemy: "Ahora que todos los modelos que heredan
 # de 'Base' han sido cargados, por favor, resuelve todas las relaciones pendientes".
@@ -5,4 +5,5 @@ from .modelos_pedidos import *
 from .modelos_financieros import *
 from .modelos_operativos import *
 from .modelos_configuracion import *
-from .modelos_feedback import *
\ No newline at end of file
+from .modelos_feedback import *
+from .modelos_metricas import *
\ No newline at end of file
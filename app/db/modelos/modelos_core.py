@@ -52,9 +52,13 @@ class Negocio(Base):
     ruc = Column(String(11), unique=True, index=True, nullable=False)
     razon_social = Column(String(255), nullable=False)
     nombre_comercial = Column(String(255))
+    # Identificador de la carta pública en la URL (/carta/{slug}/...). No cambia al renombrar el negocio.
+    slug = Column(String(255), unique=True, index=True, nullable=True)
     marca_origen = Column(String(50), nullable=False)
     activo = Column(Boolean, default=True)
     modo_cobro = Column(String(20), nullable=False, server_default='POSTPAGO')
+    # Minutos en producción tras los que el KDS avisa de la demora de un pedido
+    minutos_alerta_demora = Column(Integer, nullable=False, server_default='10')
     
     # --- NUEVOS CAMPOS DE CONFIGURACIÓN ---
     tema_id = Column(Integer, ForeignKey("temas.id"), nullable=True)
@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Enum as SQLAlchemyEnum
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Enum as SQLAlchemyEnum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.conexion import Base
@@ -44,6 +44,12 @@ class Cuenta(Base):
     transacciones = relationship("Transaccion", back_populates="cuenta")
     mesa = relationship("Mesa")
 
+    __table_args__ = (
+        # Una sola cuenta abierta por mesa; también es el destino del ON CONFLICT al cargar pedidos
+        Index('uq_cuentas_abierta_por_mesa', 'negocio_id', 'mesa_id', unique=True,
+              postgresql_where=estado == EstadoCuenta.ABIERTA),
+    )
+
 class Transaccion(Base):
     __tablename__ = 'transacciones'
     id = Column(Integer, primary_key=True, index=True)
@@ -57,4 +63,9 @@ class Transaccion(Base):
     fecha_transaccion = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relaciones
-    cuenta = relationship("Cuenta", back_populates="transacciones")
\ No newline at end of file
+    cuenta = relationship("Cuenta", back_populates="transacciones")
+
+    __table_args__ = (
+        # El recálculo nocturno de los reportes lee las transacciones por rango de fecha
+        Index('ix_transacciones_fecha', 'fecha_transaccion'),
+    )
\ No newline at end of file
@@ -0,0 +1,57 @@
+from sqlalchemy import Column, Integer, Numeric, ForeignKey, Date, DateTime, Enum as SQLAlchemyEnum
+from sqlalchemy.sql import func
+from app.db.conexion import Base
+from app.db.modelos.modelos_financieros import MedioDePago
+
+# Miembro "desconocido" de una dimensión: pedidos sin mesa (sin local) o productos sin centro
+SIN_DIMENSION = 0
+
+class MetricaDiaria(Base):
+    """
+    Contadores del dashboard por negocio y día local. Se incrementan en la misma
+    transacción que crea o cambia cada pedido; servicio_metricas.recalcular_metricas
+    los rehace desde pedidos y cuentas si alguna vez se desvían.
+    """
+    __tablename__ = 'metricas_diarias'
+    negocio_id = Column(Integer, ForeignKey('negocios.id'), primary_key=True)
+    dia = Column(Date, primary_key=True)
+
+    ventas = Column(Numeric(12, 2), nullable=False, default=0)
+    pedidos = Column(Integer, nullable=False, default=0)
+    pedidos_cancelados = Column(Integer, nullable=False, default=0)
+    mesas_atendidas = Column(Integer, nullable=False, default=0) # Cuentas de mesa abiertas ese día
+
+class MetricaNegocio(Base):
+    """Contadores del negocio que no dependen del día (pedidos en curso ahora mismo)."""
+    __tablename__ = 'metricas_negocio'
+    negocio_id = Column(Integer, ForeignKey('negocios.id'), primary_key=True)
+    pedidos_activos = Column(Integer, nullable=False, default=0)
+    actualizado_en = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ResumenVentaProducto(Base):
+    """
+    Ventas agregadas por negocio, local, día local, producto y centro de producción.
+    Los informes leen aquí en lugar de recorrer detalles_pedido. Las columnas de
+    dimensión no son nulas: SIN_DIMENSION (0) hace de "sin local" / "sin centro".
+    """
+    __tablename__ = 'resumen_ventas_producto'
+    negocio_id = Column(Integer, ForeignKey('negocios.id'), primary_key=True)
+    dia = Column(Date, primary_key=True)
+    local_id = Column(Integer, primary_key=True)
+    producto_id = Column(Integer, primary_key=True)
+    centro_produccion_id = Column(Integer, primary_key=True)
+
+    cantidad = Column(Integer, nullable=False, default=0)
+    bruto = Column(Numeric(14, 2), nullable=False, default=0) # Precio unitario + modificadores, por cantidad
+
+class ResumenCobro(Base):
+    """Cobros agregados por negocio, local, día local y medio de pago, con las propinas repartidas."""
+    __tablename__ = 'resumen_cobros'
+    negocio_id = Column(Integer, ForeignKey('negocios.id'), primary_key=True)
+    dia = Column(Date, primary_key=True)
+    local_id = Column(Integer, primary_key=True)
+    medio_de_pago = Column(SQLAlchemyEnum(MedioDePago), primary_key=True)
+
+    transacciones = Column(Integer, nullable=False, default=0)
+    monto = Column(Numeric(14, 2), nullable=False, default=0)
+    propinas = Column(Numeric(14, 2), nullable=False, default=0)
@@ -1,5 +1,5 @@
 # app/db/modelos/modelos_pedidos.py
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Enum as SQLAlchemyEnum, Table
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Enum as SQLAlchemyEnum, Table, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -39,12 +39,19 @@ class Pedido(Base):
     # Relaciones
     cuenta = relationship("Cuenta", back_populates="pedidos")
     detalles = relationship("DetallePedido", cascade="all, delete-orphan")
+    comandas_kds = relationship("ComandaKDS", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Solo los pedidos en producción: el índice se mantiene pequeño aunque el histórico crezca
+        Index('ix_pedidos_en_produccion', 'negocio_id', 'fecha_creacion',
+              postgresql_where=estado.in_([EstadoPedido.PENDIENTE, EstadoPedido.EN_PREPARACION])),
+    )
 
 class DetallePedido(Base):
     __tablename__ = 'detalles_pedido'
 
     id = Column(Integer, primary_key=True, index=True)
-    pedido_id = Column(Integer, ForeignKey('pedidos.id'), nullable=False)
+    pedido_id = Column(Integer, ForeignKey('pedidos.id'), nullable=False, index=True)
     producto_id = Column(Integer, ForeignKey('productos.id'), nullable=False)
     variante_id = Column(Integer, ForeignKey('variantes_producto.id'), nullable=True)
     
@@ -57,4 +64,31 @@ class DetallePedido(Base):
     pedido = relationship("Pedido", back_populates="detalles")
     producto = relationship("Producto")
     variante = relationship("VarianteProducto")
-    modificadores_seleccionados = relationship("OpcionModificador", secondary=detalle_pedido_modificadores)
\ No newline at end of file
+    modificadores_seleccionados = relationship("OpcionModificador", secondary=detalle_pedido_modificadores)
+
+class ComandaKDS(Base):
+    """
+    Proyección de lectura del KDS: una fila por (pedido, centro de producción) con los
+    items de ese centro ya serializados, más una fila de vista 'COBRO' (sin centro) con
+    todos los items mientras el pedido espera el pago en Caja. Se mantiene al crear el
+    pedido y en cada cambio de estado; las pantallas la leen sin tocar pedidos ni detalles.
+    """
+    __tablename__ = 'comandas_kds'
+
+    id = Column(Integer, primary_key=True)
+    negocio_id = Column(Integer, ForeignKey('negocios.id'), nullable=False)
+    pedido_id = Column(Integer, ForeignKey('pedidos.id', ondelete='CASCADE'), nullable=False, index=True)
+    centro_produccion_id = Column(Integer, ForeignKey('centros_produccion.id'), nullable=True)
+    vista = Column(String(20), nullable=False) # 'PRODUCCION' o 'COBRO'
+
+    mesa_id = Column(Integer, nullable=True)
+    estado = Column(SQLAlchemyEnum(EstadoPedido), nullable=False)
+    total_pedido = Column(Numeric(10, 2), nullable=False)
+    items = Column(JSON, nullable=False)
+    # Misma transacción que el pedido: en Postgres now() devuelve la misma marca de tiempo
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_comandas_kds_centro_estado', 'centro_produccion_id', 'estado', 'fecha_creacion'),
+        Index('ix_comandas_kds_negocio_vista', 'negocio_id', 'vista', 'estado', 'fecha_creacion'),
+    )
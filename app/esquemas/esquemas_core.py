@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import Optional, List
 
 # --- ESQUEMAS PARA RESPUESTAS (LEER DATOS DE LA BD) ---
@@ -42,8 +42,10 @@ class Negocio(BaseModel):
     ruc: str
     razon_social: str
     nombre_comercial: Optional[str] = None
+    slug: Optional[str] = None
     activo: bool
     modo_cobro: str
+    minutos_alerta_demora: int = 10
     tema_id: Optional[int] = None
     logo_url: Optional[str] = None
     locales: List[Local] = []
@@ -74,6 +76,7 @@ class NegocioUpdate(BaseModel):
     modo_cobro: str
     tema_id: int
     logo_url: Optional[str] = None
+    minutos_alerta_demora: Optional[int] = Field(None, ge=1, le=240) # Si no se envía, se conserva
 
 class LocalCreate(BaseModel):
     nombre: str
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class ClienteInfo(BaseModel):
@@ -46,4 +46,15 @@ class PedidoEstadoUpdate(BaseModel):
     """
     Esquema para recibir la actualización de estado de un pedido desde el KDS.
     """
-    nuevo_estado: str # Recibimos el estado como string (ej: "LISTO_PARA_RECOGER")
\ No newline at end of file
+    nuevo_estado: str # Recibimos el estado como string (ej: "LISTO_PARA_RECOGER")
+    # Opcional: el estado que la pantalla ve ahora; si el pedido ya cambió, la transición no se aplica
+    estado_actual: Optional[str] = None
+class CambioEstadoLote(PedidoEstadoUpdate):
+    pedido_id: int
+
+class PedidosEstadoUpdate(BaseModel):
+    """
+    Varias transiciones a la vez desde el KDS (endpoint o comando del socket).
+    Se aplican en una sola transacción; las que no proceden se devuelven rechazadas.
+    """
+    cambios: List[CambioEstadoLote] = Field(..., min_length=1, max_length=100)
@@ -3,6 +3,9 @@ from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from app.core.middleware import brand_middleware
 from app.core.config import settings
+from app.core.serializacion import RespuestaJSON
+from app.core.websocket_manager import manager, crear_backend
+from app.servicios.servicio_demoras import planificador_demoras
 
 # --- IMPORTACIÓN DE ROUTERS ---
 from app.api.v1 import (
@@ -12,16 +15,30 @@ from app.api.v1 import (
     rutas_kds,
     rutas_panel,
     rutas_publicas,
+    rutas_reportes,
     rutas_superadmin,
     rutas_usuarios,
     rutas_web
 )
 
-app = FastAPI(title=settings.PROJECT_NAME)
+# orjson para todas las respuestas JSON (Decimal, datetime y Enum incluidos)
+app = FastAPI(title=settings.PROJECT_NAME, default_response_class=RespuestaJSON)
 
 # --- MIDDLEWARE ---
 app.middleware("http")(brand_middleware)
 
+# --- CICLO DE VIDA ---
+@app.on_event("startup")
+async def iniciar_difusion_websockets():
+    await manager.usar_backend(crear_backend(settings.WS_BACKEND, settings.DATABASE_URL))
+    manager.iniciar_latidos()
+    await planificador_demoras.iniciar()
+
+@app.on_event("shutdown")
+async def detener_difusion_websockets():
+    planificador_demoras.detener()
+    await manager.cerrar()
+
 # --- MONTAJE DE ARCHIVOS ESTÁTICOS ---
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -33,6 +50,7 @@ api_router.include_router(rutas_api_publica.router, tags=["Público API"])
 api_router.include_router(rutas_auth.router, prefix="/auth", tags=["Autenticación"])
 api_router.include_router(rutas_gestion.router, tags=["Panel de Gestión"])
 api_router.include_router(rutas_panel.router, tags=["Panel API"])
+api_router.include_router(rutas_reportes.router, tags=["Reportes"])
 api_router.include_router(rutas_superadmin.router, tags=["Super Admin API"])
 api_router.include_router(rutas_usuarios.router, tags=["Usuarios"])
 app.include_router(api_router)
@@ -0,0 +1,132 @@
+# app/servicios/servicio_carta.py
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.modelos import modelos_core
+from app.esquemas import esquemas_carta
+
+
+class MenuSnapshot:
+    """
+    Foto inmutable del catálogo público de un negocio, lista para plantillas y APIs.
+    Sus dicts se comparten entre peticiones: se leen, nunca se modifican.
+    """
+    __slots__ = ("negocio_id", "categorias", "productos_por_id", "items_formulario", "version", "_creado_monotonic")
+
+    def __init__(
+        self,
+        negocio_id: int,
+        categorias: Tuple[dict, ...],
+        productos_por_id: Dict[int, dict],
+        items_formulario: Optional[Dict[int, dict]] = None
+    ):
+        self.negocio_id = negocio_id
+        self.categorias = categorias
+        self.productos_por_id = productos_por_id
+        # Payload ItemFormulario de cada producto activo, listo para la API de voz
+        self.items_formulario = items_formulario or {}
+        # La versión es un hash del contenido: igual en todos los workers para el mismo catálogo
+        contenido = json.dumps(categorias, sort_keys=True, default=str).encode("utf-8")
+        self.version = hashlib.sha1(contenido).hexdigest()[:16]
+        self._creado_monotonic = time.monotonic()
+
+
+_cache_menus: Dict[int, MenuSnapshot] = {}
+# Se incrementa en cada invalidación; evita guardar un snapshot construido antes del cambio
+_generaciones: Dict[int, int] = {}
+_lock_cache = threading.Lock()
+
+
+def _serializar_producto(producto: modelos_core.Producto) -> Tuple[dict, dict]:
+    """Devuelve (item completo de la carta, payload ItemFormulario) validando una sola vez."""
+    formulario = esquemas_carta.ItemFormulario.model_validate(producto).model_dump()
+    item = dict(formulario)
+    item.update({
+        "descripcion": producto.descripcion,
+        "imagen_url": producto.imagen_url,
+        "tipo_producto": producto.tipo_producto,
+        "categoria_id": producto.categoria_id,
+        "activo": bool(producto.activo),
+    })
+    return item, formulario
+
+
+def construir_menu(db: Session, negocio_id: int) -> MenuSnapshot:
+    """
+    Lee el catálogo completo con selectinload (una consulta por nivel, sin producto
+    cartesiano de variantes x modificadores) y lo congela en un MenuSnapshot.
+    """
+    categorias_db = db.execute(
+        select(modelos_core.Categoria).options(
+            selectinload(modelos_core.Categoria.productos).selectinload(modelos_core.Producto.variantes),
+            selectinload(modelos_core.Categoria.productos).selectinload(modelos_core.Producto.grupos_modificadores).selectinload(modelos_core.GrupoModificador.opciones)
+        ).where(modelos_core.Categoria.negocio_id == negocio_id).order_by(modelos_core.Categoria.id)
+    ).scalars().all()
+
+    categorias = []
+    productos_por_id = {}
+    items_formulario = {}
+    for categoria in categorias_db:
+        productos = []
+        for producto in sorted(categoria.productos, key=lambda p: p.id):
+            item, formulario = _serializar_producto(producto)
+            productos.append(item)
+            productos_por_id[producto.id] = item
+            if item["activo"]:
+                items_formulario[producto.id] = formulario
+        categorias.append({"id": categoria.id, "nombre": categoria.nombre, "productos": tuple(productos)})
+
+    return MenuSnapshot(negocio_id, tuple(categorias), productos_por_id, items_formulario)
+
+
+def _menu_vigente(negocio_id: int) -> Optional[MenuSnapshot]:
+    snapshot = _cache_menus.get(negocio_id)
+    if snapshot and time.monotonic() - snapshot._creado_monotonic < settings.CARTA_CACHE_TTL:
+        return snapshot
+    return None
+
+
+def _guardar_menu(negocio_id: int, generacion: int, snapshot: MenuSnapshot) -> MenuSnapshot:
+    with _lock_cache:
+        if _generaciones.get(negocio_id, 0) == generacion:
+            _cache_menus[negocio_id] = snapshot
+    return snapshot
+
+
+def get_menu(db: Session, negocio_id: int) -> MenuSnapshot:
+    """
+    Devuelve el snapshot del menú desde la caché del proceso, construyéndolo si falta.
+    Los cambios hechos en este proceso lo invalidan al instante; los de otros workers,
+    al vencer CARTA_CACHE_TTL.
+    """
+    snapshot = _menu_vigente(negocio_id)
+    if snapshot:
+        return snapshot
+
+    generacion = _generaciones.get(negocio_id, 0)
+    return _guardar_menu(negocio_id, generacion, construir_menu(db, negocio_id))
+
+
+async def get_menu_async(db: AsyncSession, negocio_id: int) -> MenuSnapshot:
+    """Versión asíncrona de get_menu: comparte la misma caché."""
+    snapshot = _menu_vigente(negocio_id)
+    if snapshot:
+        return snapshot
+
+    generacion = _generaciones.get(negocio_id, 0)
+    return _guardar_menu(negocio_id, generacion, await db.run_sync(construir_menu, negocio_id))
+
+
+def invalidar_menu(negocio_id: int):
+    """Descarta el snapshot de un negocio tras cambiar su catálogo."""
+    with _lock_cache:
+        _generaciones[negocio_id] = _generaciones.get(negocio_id, 0) + 1
+        _cache_menus.pop(negocio_id, None)
@@ -0,0 +1,310 @@
+# app/servicios/servicio_demoras.py
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.serializacion import a_json, de_json
+from app.core.websocket_manager import ConnectionManager, manager
+from app.db.conexion import AsyncSessionLocal
+from app.db.modelos import modelos_core, modelos_pedidos
+from app.servicios import servicio_kds
+
+ComandaKDS = modelos_pedidos.ComandaKDS
+Mesa, Zona = modelos_core.Mesa, modelos_core.Zona
+
+# Canal interno del gestor de sockets por el que viajan las altas y bajas de plazos
+CANAL_DEMORAS = "_demoras"
+# El mismo server_default de Negocio.minutos_alerta_demora (negocios creados tras el arranque)
+MINUTOS_POR_DEFECTO = 10
+# Segundos que se recuerda el nombre de una mesa y su zona
+TTL_ETIQUETAS = 3600
+
+
+def _marca(fecha: datetime) -> float:
+    """Segundos epoch de una fecha de la BD (las que llegan sin zona horaria son UTC)."""
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha.timestamp()
+
+def centros_e_item(detalles) -> Tuple[List[int], Optional[str]]:
+    """Centros de producción de un pedido y el nombre de su primer item, desde sus detalles (con 'producto')."""
+    centros = sorted({d.producto.centro_produccion_id for d in detalles if d.producto and d.producto.centro_produccion_id})
+    return centros, (detalles[0].nombre_producto if detalles else None)
+
+
+class PedidoEnEspera:
+    """Un pedido en producción con su temporizador. No es una fila ORM."""
+    __slots__ = ("pedido_id", "negocio_id", "centros", "mesa_id", "item_ejemplo", "creado_en", "temporizador", "avisado")
+
+    def __init__(self, pedido_id: int, negocio_id: int, centros: List[int], mesa_id: Optional[int], item_ejemplo: Optional[str], creado_en: float):
+        self.pedido_id = pedido_id
+        self.negocio_id = negocio_id
+        self.centros = centros
+        self.mesa_id = mesa_id
+        self.item_ejemplo = item_ejemplo
+        self.creado_en = creado_en
+        self.temporizador: Optional[asyncio.TimerHandle] = None
+        self.avisado = False
+
+
+class PlanificadorDemoras:
+    """
+    Lleva el plazo de cada pedido en producción (PENDIENTE o EN_PREPARACION) y, justo
+    al vencer, empuja un evento DEMORA a los KDS de sus centros; si el pedido sale de
+    producción después, les envía DEMORA_RESUELTA. Cada plazo es un loop.call_later
+    (el montículo de temporizadores del propio event loop): ni sondeo ni consultas.
+    Las altas y bajas viajan por el backend de difusión, así que con varios workers
+    todos llevan los mismos plazos y cada uno avisa solo a sus propios sockets.
+    Trama: {"tipo_alerta": "DEMORA", "pedido_id", "mesa_nombre", "zona_nombre", ...}
+    """
+    def __init__(self, gestor: ConnectionManager):
+        self.gestor = gestor
+        self.umbrales: Dict[int, int] = {}
+        self.pedidos: Dict[int, PedidoEnEspera] = {}
+        self.etiquetas_mesa: TTLCache = TTLCache(maxsize=4096, ttl=TTL_ETIQUETAS)
+        # Envíos de DEMORA en curso: el loop solo guarda referencias débiles a sus tareas
+        self.envios: Set[asyncio.Task] = set()
+        self.metricas = {"plazos_programados": 0, "avisos_demora": 0, "demoras_resueltas": 0}
+
+    def minutos(self, negocio_id: int) -> int:
+        return self.umbrales.get(negocio_id, MINUTOS_POR_DEFECTO)
+
+    # --- Arranque y parada ---
+
+    async def iniciar(self):
+        """Se suscribe al canal interno y programa los pedidos que ya estaban en producción."""
+        self.gestor.suscribir_interno(CANAL_DEMORAS, self._recibir)
+        async with AsyncSessionLocal() as db:
+            await self.cargar(db)
+
+    async def cargar(self, db: AsyncSession):
+        """Umbrales de todos los negocios y pedidos en producción, desde la proyección del KDS."""
+        negocios = await db.execute(select(modelos_core.Negocio.id, modelos_core.Negocio.minutos_alerta_demora))
+        self.umbrales = {fila.id: fila.minutos_alerta_demora for fila in negocios}
+
+        filas = await db.execute(
+            select(
+                ComandaKDS.pedido_id, ComandaKDS.negocio_id, ComandaKDS.centro_produccion_id, ComandaKDS.mesa_id,
+                ComandaKDS.items, ComandaKDS.fecha_creacion, Mesa.nombre_o_numero, Zona.nombre.label("zona_nombre")
+            ).outerjoin(Mesa, Mesa.id == ComandaKDS.mesa_id
+            ).outerjoin(Zona, Zona.id == Mesa.zona_id
+            ).where(
+                ComandaKDS.vista == servicio_kds.VISTA_PRODUCCION,
+                ComandaKDS.estado.in_(servicio_kds.ESTADOS_EN_PRODUCCION)
+            )
+        )
+        for fila in filas:
+            pedido = self.pedidos.get(fila.pedido_id)
+            if pedido is None:
+                item_ejemplo = fila.items[0]["nombre"] if fila.items else None
+                pedido = PedidoEnEspera(fila.pedido_id, fila.negocio_id, [], fila.mesa_id, item_ejemplo, _marca(fila.fecha_creacion))
+                self.pedidos[fila.pedido_id] = pedido
+            if fila.centro_produccion_id not in pedido.centros:
+                pedido.centros.append(fila.centro_produccion_id)
+            if fila.nombre_o_numero is not None:
+                self.etiquetas_mesa[fila.mesa_id] = (fila.zona_nombre, fila.nombre_o_numero)
+        for pedido in self.pedidos.values():
+            self._programar(pedido)
+        print(f"[DEMORAS] {len(self.pedidos)} pedidos en producción programados.")
+
+    def detener(self):
+        for pedido in self.pedidos.values():
+            if pedido.temporizador:
+                pedido.temporizador.cancel()
+        self.pedidos.clear()
+        for tarea in self.envios:
+            tarea.cancel()
+
+    # --- Avisos de las rutas (se aplican en cada worker al recibirlos) ---
+
+    async def _publicar(self, **datos):
+        await self.gestor.broadcast(a_json(datos), client_id=CANAL_DEMORAS)
+
+    async def pedido_en_espera(
+        self,
+        pedido_id: int,
+        negocio_id: int,
+        fecha_creacion: datetime,
+        centros: List[int],
+        mesa_id: Optional[int],
+        item_ejemplo: Optional[str]
+    ):
+        """El pedido entró en producción; su plazo corre desde fecha_creacion."""
+        if not centros:
+            return # Sin centro de producción no hay pantalla a la que avisar
+        await self._publicar(
+            accion="programar", pedido_id=pedido_id, negocio_id=negocio_id, creado_en=_marca(fecha_creacion),
+            centros=[int(c) for c in centros], mesa_id=mesa_id, item_ejemplo=item_ejemplo
+        )
+
+    async def pedidos_atendidos(self, pedido_ids: List[int]):
+        """Los pedidos salieron de producción (listos, completados o cancelados). Un solo mensaje."""
+        await self._publicar(accion="cancelar", pedido_ids=list(pedido_ids))
+
+    async def umbral_cambiado(self, negocio_id: int, minutos: int):
+        """Reprograma los pedidos del negocio con su nuevo umbral."""
+        await self._publicar(accion="umbral", negocio_id=negocio_id, minutos=minutos)
+
+    async def _recibir(self, canal: str, mensaje: bytes):
+        datos = de_json(mensaje)
+        accion = datos["accion"]
+        if accion == "programar":
+            anterior = self.pedidos.pop(datos["pedido_id"], None)
+            if anterior and anterior.temporizador:
+                anterior.temporizador.cancel()
+            pedido = PedidoEnEspera(
+                datos["pedido_id"], datos["negocio_id"], datos["centros"], datos["mesa_id"], datos["item_ejemplo"], datos["creado_en"]
+            )
+            self.pedidos[pedido.pedido_id] = pedido
+            self._programar(pedido)
+        elif accion == "cancelar":
+            for pedido_id in datos["pedido_ids"]:
+                pedido = self.pedidos.pop(pedido_id, None)
+                if pedido is None:
+                    continue
+                if pedido.temporizador:
+                    pedido.temporizador.cancel()
+                if pedido.avisado:
+                    await self._enviar_resuelta(pedido)
+        elif accion == "umbral":
+            self.umbrales[datos["negocio_id"]] = datos["minutos"]
+            for pedido in [p for p in self.pedidos.values() if p.negocio_id == datos["negocio_id"]]:
+                if pedido.avisado and time.time() < self._vence(pedido):
+                    pedido.avisado = False
+                    await self._enviar_resuelta(pedido)
+                self._programar(pedido)
+
+    # --- Temporizadores ---
+
+    def _vence(self, pedido: PedidoEnEspera) -> float:
+        return pedido.creado_en + self.minutos(pedido.negocio_id) * 60
+
+    def _programar(self, pedido: PedidoEnEspera):
+        if pedido.temporizador:
+            pedido.temporizador.cancel()
+            pedido.temporizador = None
+        if pedido.avisado:
+            return
+        # Un plazo ya vencido (p. ej. tras reiniciar) se avisa en la siguiente vuelta del loop
+        espera = max(self._vence(pedido) - time.time(), 0)
+        pedido.temporizador = asyncio.get_running_loop().call_later(espera, self._vencer, pedido.pedido_id)
+        self.metricas["plazos_programados"] += 1
+
+    def _vencer(self, pedido_id: int):
+        pedido = self.pedidos.get(pedido_id)
+        if pedido is None or pedido.avisado:
+            return
+        pedido.temporizador = None
+        pedido.avisado = True
+        self.metricas["avisos_demora"] += 1
+        tarea = asyncio.create_task(self._enviar_demora(pedido))
+        self.envios.add(tarea)
+        tarea.add_done_callback(self._envio_terminado)
+
+    def _envio_terminado(self, tarea: asyncio.Task):
+        self.envios.discard(tarea)
+        if not tarea.cancelled() and tarea.exception() is not None:
+            print(f"[DEMORAS] Error al enviar un aviso de demora: {tarea.exception()!r}")
+
+    # --- Envío a los KDS ---
+
+    async def _etiqueta_mesa(self, mesa_id: Optional[int]) -> Tuple[Optional[str], Optional[str]]:
+        """(zona, mesa) para la tarjeta de demora. Una consulta por mesa y TTL, no por aviso."""
+        if mesa_id is None:
+            return None, None
+        etiqueta = self.etiquetas_mesa.get(mesa_id)
+        if etiqueta is None:
+            async with AsyncSessionLocal() as db:
+                fila = (await db.execute(
+                    select(Zona.nombre, Mesa.nombre_o_numero).join(Zona, Zona.id == Mesa.zona_id).where(Mesa.id == mesa_id)
+                )).first()
+            etiqueta = (fila[0], fila[1]) if fila else (None, None)
+            self.etiquetas_mesa[mesa_id] = etiqueta
+        return etiqueta
+
+    async def _entregar(self, pedido: PedidoEnEspera, mensaje: bytes):
+        # Solo a los sockets de este worker: los demás disparan su propio temporizador
+        for centro_id in pedido.centros:
+            await self.gestor.entregar_local(str(centro_id), mensaje)
+
+    async def _enviar_demora(self, pedido: PedidoEnEspera):
+        try:
+            zona_nombre, mesa_nombre = await self._etiqueta_mesa(pedido.mesa_id)
+            await self._entregar(pedido, a_json({
+                "tipo_alerta": "DEMORA",
+                "pedido_id": pedido.pedido_id,
+                "mesa_id": pedido.mesa_id,
+                "mesa_nombre": mesa_nombre,
+                "zona_nombre": zona_nombre,
+                "item_ejemplo": pedido.item_ejemplo,
+                "fecha_creacion": datetime.fromtimestamp(pedido.creado_en, timezone.utc),
+                "umbral_minutos": self.minutos(pedido.negocio_id)
+            }))
+        except Exception as e:
+            print(f"[DEMORAS] No se pudo avisar la demora del pedido {pedido.pedido_id}: {e}")
+
+    async def _enviar_resuelta(self, pedido: PedidoEnEspera):
+        self.metricas["demoras_resueltas"] += 1
+        await self._entregar(pedido, a_json({"tipo_alerta": "DEMORA_RESUELTA", "pedido_id": pedido.pedido_id}))
+
+    def estadisticas(self) -> dict:
+        return {
+            **self.metricas,
+            "pedidos_en_produccion": len(self.pedidos),
+            "pedidos_demorados": sum(1 for p in self.pedidos.values() if p.avisado),
+        }
+
+
+planificador_demoras = PlanificadorDemoras(manager)
+
+
+def leer_demorados_centro(db: Session, negocio_id: int, centro_id: int, umbral: datetime) -> List[dict]:
+    """
+    Pedidos del centro en producción desde antes de 'umbral', con las mismas claves que
+    la trama DEMORA. Lee la proyección del KDS por su índice (centro, estado, fecha).
+    """
+    consulta = servicio_kds.consulta_comandas_produccion(
+        negocio_id, centro_id, servicio_kds.ESTADOS_EN_PRODUCCION, hasta=umbral
+    ).add_columns(Mesa.nombre_o_numero, Zona.nombre.label("zona_nombre")
+    ).outerjoin(Mesa, Mesa.id == ComandaKDS.mesa_id
+    ).outerjoin(Zona, Zona.id == Mesa.zona_id)
+
+    ahora = time.time()
+    return [
+        {
+            "pedido_id": comanda.pedido_id,
+            "mesa_id": comanda.mesa_id,
+            "mesa_nombre": mesa_nombre,
+            "zona_nombre": zona_nombre,
+            "item_ejemplo": comanda.items[0]["nombre"] if comanda.items else None,
+            "fecha_creacion": datetime.fromtimestamp(_marca(comanda.fecha_creacion), timezone.utc),
+            "minutos_espera": int((ahora - _marca(comanda.fecha_creacion)) / 60),
+        }
+        for comanda, mesa_nombre, zona_nombre in db.execute(consulta).all()
+    ]
+
+
+async def seguir_cambios_estado(cambios: List[Tuple]):
+    """
+    Avisa al planificador de los cambios de estado (ya confirmados) que meten un pedido
+    en producción o lo sacan. Cada cambio es una tupla (pedido_id, negocio_id,
+    fecha_creacion, mesa_id, estado_anterior, nuevo_estado, centros, item_ejemplo);
+    'centros' son los de sus comandas de producción. Los que salen de producción
+    se cancelan con un único mensaje al planificador.
+    """
+    atendidos = []
+    for pedido_id, negocio_id, fecha_creacion, mesa_id, estado_anterior, nuevo_estado, centros, item_ejemplo in cambios:
+        en_produccion_antes = modelos_pedidos.EstadoPedido(estado_anterior) in servicio_kds.ESTADOS_EN_PRODUCCION
+        en_produccion_ahora = modelos_pedidos.EstadoPedido(nuevo_estado) in servicio_kds.ESTADOS_EN_PRODUCCION
+        if en_produccion_antes and not en_produccion_ahora:
+            atendidos.append(pedido_id)
+        elif en_produccion_ahora and not en_produccion_antes:
+            await planificador_demoras.pedido_en_espera(pedido_id, negocio_id, fecha_creacion, centros, mesa_id, item_ejemplo)
+    if atendidos:
+        await planificador_demoras.pedidos_atendidos(atendidos)
@@ -0,0 +1,250 @@
+# app/servicios/servicio_estado_pedido.py
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, String, cast, column, select, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.serializacion import a_json
+from app.core.websocket_manager import manager
+from app.db.modelos import modelos_operativos, modelos_pedidos
+from app.servicios import servicio_demoras, servicio_kds, servicio_metricas
+
+EstadoPedido = modelos_pedidos.EstadoPedido
+Pedido = modelos_pedidos.Pedido
+ComandaKDS = modelos_pedidos.ComandaKDS
+
+# Máquina de estados del pedido: a qué estados se puede pasar desde cada uno
+TRANSICIONES: Dict[EstadoPedido, FrozenSet[EstadoPedido]] = {
+    EstadoPedido.PENDIENTE_DE_PAGO: frozenset({EstadoPedido.PENDIENTE, EstadoPedido.CANCELADO}),
+    EstadoPedido.PENDIENTE: frozenset({EstadoPedido.EN_PREPARACION, EstadoPedido.LISTO_PARA_RECOGER, EstadoPedido.CANCELADO}),
+    EstadoPedido.EN_PREPARACION: frozenset({EstadoPedido.LISTO_PARA_RECOGER, EstadoPedido.CANCELADO}),
+    EstadoPedido.LISTO_PARA_RECOGER: frozenset({EstadoPedido.COMPLETADO, EstadoPedido.EN_PREPARACION}), # o se reabre
+    EstadoPedido.COMPLETADO: frozenset(),
+    EstadoPedido.CANCELADO: frozenset(),
+}
+# La inversa: desde qué estados se llega a cada uno. Es lo que filtra el UPDATE.
+ORIGENES: Dict[EstadoPedido, FrozenSet[EstadoPedido]] = {
+    destino: frozenset(origen for origen, destinos in TRANSICIONES.items() if destino in destinos)
+    for destino in EstadoPedido
+}
+
+
+class PedidoNoEncontrado(LookupError):
+    pass
+
+class TransicionInvalida(ValueError):
+    """El estado pedido no existe o no se puede alcanzar desde el estado actual del pedido."""
+
+
+class CambioEstado:
+    """Una transición ya confirmada, con lo que devolvieron sus sentencias. No es una fila ORM."""
+    __slots__ = ("pedido_id", "negocio_id", "mesa_id", "total_pedido", "fecha_creacion", "estado_anterior", "nuevo_estado", "id_caja", "comandas")
+
+    def __init__(
+        self,
+        pedido_id: int,
+        negocio_id: int,
+        mesa_id: Optional[int],
+        total_pedido: Decimal,
+        fecha_creacion: datetime,
+        estado_anterior: EstadoPedido,
+        nuevo_estado: EstadoPedido,
+        id_caja: Optional[int],
+        comandas: List
+    ):
+        self.pedido_id = pedido_id
+        self.negocio_id = negocio_id
+        self.mesa_id = mesa_id
+        self.total_pedido = total_pedido
+        self.fecha_creacion = fecha_creacion
+        self.estado_anterior = estado_anterior
+        self.nuevo_estado = nuevo_estado
+        self.id_caja = id_caja
+        self.comandas = comandas # Filas (centro_produccion_id, vista, items) de la proyección del KDS
+
+
+def _como_estado(valor) -> EstadoPedido:
+    try:
+        return EstadoPedido(valor) # el KDS envía el estado como texto
+    except ValueError:
+        raise TransicionInvalida(f"Estado de pedido desconocido: '{valor}'.")
+
+def sentencia_transiciones(negocio_id: int, filas: List[Tuple[int, str, str]]):
+    """
+    UPDATE ... FROM (SELECT ... FOR UPDATE) ... RETURNING para un lote de pedidos.
+    'filas' son (pedido_id, nuevo_estado, origen), una por cada estado de origen
+    admitido, y entran en la consulta como una lista VALUES: cada pedido pasa a su
+    estado solo si está en uno de sus orígenes. Devuelve una fila por pedido movido,
+    con el estado que tenía y el centro Caja del negocio.
+    """
+    tipo_estado = Pedido.__table__.c.estado.type
+    solicitud = values(
+        column("pedido_id", Integer), column("nuevo_estado", String), column("origen", String), name="solicitud"
+    ).data(filas)
+    anterior = select(Pedido.id, Pedido.estado, solicitud.c.nuevo_estado).join(
+        solicitud, (solicitud.c.pedido_id == Pedido.id) & (Pedido.estado == cast(solicitud.c.origen, tipo_estado))
+    ).where(Pedido.negocio_id == negocio_id).with_for_update(of=Pedido).subquery("anterior")
+    id_caja = select(modelos_operativos.CentroProduccion.id).where(
+        modelos_operativos.CentroProduccion.negocio_id == Pedido.negocio_id,
+        modelos_operativos.CentroProduccion.nombre == 'Caja'
+    ).correlate(Pedido).limit(1).scalar_subquery()
+
+    return update(Pedido).where(Pedido.id == anterior.c.id).values(
+        estado=cast(anterior.c.nuevo_estado, tipo_estado)
+    ).returning(
+        Pedido.id, Pedido.negocio_id, Pedido.mesa_id, Pedido.total_pedido, Pedido.fecha_creacion,
+        anterior.c.estado.label("estado_anterior"), id_caja.label("id_caja")
+    )
+
+async def cambiar_estado(
+    db: AsyncSession,
+    negocio_id: int,
+    pedido_id: int,
+    nuevo_estado,
+    estado_esperado=None
+) -> CambioEstado:
+    """
+    Aplica una transición de la máquina de estados con una sola escritura condicional
+    (sin leer el pedido antes), sincroniza la proyección del KDS y los contadores en la
+    misma transacción, hace commit y difunde el cambio. Con 'estado_esperado', solo se
+    aplica si el pedido sigue en ese estado.
+    """
+    cambios, rechazados = await cambiar_estados(db, negocio_id, [(pedido_id, nuevo_estado, estado_esperado)])
+    if rechazados:
+        raise rechazados[pedido_id]
+    return cambios[0]
+
+async def cambiar_estados(
+    db: AsyncSession,
+    negocio_id: int,
+    solicitudes: Iterable[Tuple[int, str, Optional[str]]]
+) -> Tuple[List[CambioEstado], Dict[int, Exception]]:
+    """
+    Aplica un lote de transiciones, como tuplas (pedido_id, nuevo_estado, estado_esperado),
+    en una transacción: un único UPDATE para todos los pedidos, una sentencia de la
+    proyección por estado destino y los contadores agregados. Hace commit y difunde un
+    mensaje por centro. Un pedido que no se puede mover no aborta el lote: vuelve en
+    'rechazados' con la excepción que lo explica (PedidoNoEncontrado o TransicionInvalida).
+    """
+    destinos: Dict[int, EstadoPedido] = {}
+    rechazados: Dict[int, Exception] = {}
+    filas = []
+    for pedido_id, nuevo_estado, estado_esperado in solicitudes:
+        if pedido_id in destinos or pedido_id in rechazados:
+            rechazados.setdefault(pedido_id, TransicionInvalida(f"El pedido #{pedido_id} aparece más de una vez en el lote."))
+            destinos.pop(pedido_id, None)
+            continue
+        try:
+            nuevo_estado = _como_estado(nuevo_estado)
+            origenes = ORIGENES[nuevo_estado]
+            if estado_esperado is not None:
+                origenes = origenes & {_como_estado(estado_esperado)}
+        except TransicionInvalida as error:
+            rechazados[pedido_id] = error
+            continue
+        destinos[pedido_id] = nuevo_estado
+        filas += [(pedido_id, nuevo_estado.name, origen.name) for origen in origenes]
+    filas = [fila for fila in filas if fila[0] in destinos]
+
+    movidos = {}
+    if filas:
+        movidos = {fila.id: fila for fila in (await db.execute(sentencia_transiciones(negocio_id, filas))).all()}
+    sin_mover = [pedido_id for pedido_id in destinos if pedido_id not in movidos]
+    if sin_mover:
+        # Solo en el camino de error se leen los pedidos, para explicar por qué no se aplicó
+        actuales = dict((await db.execute(
+            select(Pedido.id, Pedido.estado).where(Pedido.id.in_(sin_mover), Pedido.negocio_id == negocio_id)
+        )).all())
+        for pedido_id in sin_mover:
+            estado_actual = actuales.get(pedido_id)
+            if estado_actual is None:
+                rechazados[pedido_id] = PedidoNoEncontrado(f"Pedido #{pedido_id} no encontrado.")
+            else:
+                rechazados[pedido_id] = TransicionInvalida(
+                    f"El pedido #{pedido_id} está en {estado_actual.value} y no puede pasar a {destinos[pedido_id].value}."
+                )
+    if not movidos:
+        return [], rechazados
+
+    por_destino = defaultdict(list)
+    for pedido_id in movidos:
+        por_destino[destinos[pedido_id]].append(pedido_id)
+    comandas = defaultdict(list)
+    for nuevo_estado, pedido_ids in por_destino.items():
+        for comanda in (await db.execute(
+            servicio_kds.sentencia_cambio_estado_lote(pedido_ids, nuevo_estado).returning(
+                ComandaKDS.pedido_id, ComandaKDS.centro_produccion_id, ComandaKDS.vista, ComandaKDS.items
+            )
+        )).all():
+            comandas[comanda.pedido_id].append(comanda)
+    for sentencia in servicio_metricas.sentencias_cambios_estado(negocio_id, [
+        (fila.id, fila.estado_anterior, destinos[fila.id], fila.total_pedido, fila.fecha_creacion) for fila in movidos.values()
+    ]):
+        await db.execute(sentencia)
+    await db.commit()
+
+    cambios = []
+    for pedido_id in destinos: # en el orden en que se pidieron
+        fila = movidos.get(pedido_id)
+        if fila is not None:
+            cambios.append(CambioEstado(
+                fila.id, fila.negocio_id, fila.mesa_id, fila.total_pedido, fila.fecha_creacion,
+                fila.estado_anterior, destinos[pedido_id], fila.id_caja, comandas[pedido_id]
+            ))
+    await _notificar_cambios(cambios)
+    return cambios, rechazados
+
+
+# --- DIFUSIÓN ---
+
+def _delta(cambio: CambioEstado) -> dict:
+    return {
+        "pedido_id": cambio.pedido_id,
+        "estado": cambio.nuevo_estado.value,
+        "estado_anterior": cambio.estado_anterior.value,
+    }
+
+def mensaje_cambio(cambio: CambioEstado) -> dict:
+    """Delta que reciben las pantallas: solo qué pedido cambió y a qué estado."""
+    return {"tipo_alerta": "CAMBIO_ESTADO", **_delta(cambio)}
+
+def mensaje_cambios(cambios: List[CambioEstado]) -> dict:
+    """Los deltas de un lote que van a un mismo centro, en un solo mensaje."""
+    if len(cambios) == 1:
+        return mensaje_cambio(cambios[0])
+    return {"tipo_alerta": "CAMBIOS_ESTADO", "cambios": [_delta(cambio) for cambio in cambios]}
+
+def resultado_lote(cambios: List[CambioEstado], rechazados: Dict[int, Exception]) -> dict:
+    """Respuesta de un lote para quien lo pidió (endpoint o comando del socket)."""
+    return {
+        "aplicados": [_delta(cambio) for cambio in cambios],
+        "rechazados": [{"pedido_id": pedido_id, "motivo": str(error)} for pedido_id, error in rechazados.items()],
+    }
+
+def centros_afectados(cambio: CambioEstado) -> List[str]:
+    """Los centros con comandas del pedido, más Caja."""
+    centros = {str(c.centro_produccion_id) for c in cambio.comandas if c.centro_produccion_id}
+    if cambio.id_caja:
+        centros.add(str(cambio.id_caja))
+    return sorted(centros)
+
+async def _notificar_cambios(cambios: List[CambioEstado]):
+    por_centro = defaultdict(list)
+    for cambio in cambios:
+        for centro_id in centros_afectados(cambio):
+            por_centro[centro_id].append(cambio)
+    for centro_id, del_centro in sorted(por_centro.items()):
+        await manager.broadcast(a_json(mensaje_cambios(del_centro)), client_id=centro_id)
+
+    seguimiento = []
+    for cambio in cambios:
+        produccion = [c for c in cambio.comandas if c.vista == servicio_kds.VISTA_PRODUCCION]
+        seguimiento.append((
+            cambio.pedido_id, cambio.negocio_id, cambio.fecha_creacion, cambio.mesa_id, cambio.estado_anterior, cambio.nuevo_estado,
+            [c.centro_produccion_id for c in produccion],
+            produccion[0].items[0]["nombre"] if produccion and produccion[0].items else None
+        ))
+    await servicio_demoras.seguir_cambios_estado(seguimiento)
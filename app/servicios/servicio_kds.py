@@ -0,0 +1,137 @@
+# app/servicios/servicio_kds.py
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session, selectinload
+
+from app.db.modelos import modelos_pedidos
+
+EstadoPedido = modelos_pedidos.EstadoPedido
+ComandaKDS = modelos_pedidos.ComandaKDS
+
+VISTA_PRODUCCION = "PRODUCCION"
+VISTA_COBRO = "COBRO"
+
+ESTADOS_EN_PRODUCCION = (EstadoPedido.PENDIENTE, EstadoPedido.EN_PREPARACION)
+# Ninguna pantalla muestra estos pedidos: sus comandas se borran en vez de actualizarse
+ESTADOS_TERMINALES = (EstadoPedido.COMPLETADO, EstadoPedido.CANCELADO)
+
+
+# --- ESCRITURA DE LA PROYECCIÓN ---
+
+def construir_comandas(
+    negocio_id: int,
+    mesa_id: Optional[int],
+    estado: EstadoPedido,
+    total_pedido: Decimal,
+    detalles: List[modelos_pedidos.DetallePedido]
+) -> List[ComandaKDS]:
+    """
+    Genera las comandas de un pedido nuevo a partir de sus detalles (con 'producto'
+    ya asignado). Se añaden a Pedido.comandas_kds para guardarse en la misma transacción.
+    """
+    items_por_centro = defaultdict(list)
+    for detalle in detalles:
+        if detalle.producto and detalle.producto.centro_produccion_id:
+            items_por_centro[detalle.producto.centro_produccion_id].append(
+                {"nombre": detalle.nombre_producto, "cantidad": detalle.cantidad, "nota": detalle.nota_cocina}
+            )
+
+    comandas = [
+        ComandaKDS(negocio_id=negocio_id, centro_produccion_id=centro_id, vista=VISTA_PRODUCCION,
+                   mesa_id=mesa_id, estado=estado, total_pedido=total_pedido, items=items)
+        for centro_id, items in items_por_centro.items()
+    ]
+    if estado == EstadoPedido.PENDIENTE_DE_PAGO:
+        comandas.append(ComandaKDS(
+            negocio_id=negocio_id, centro_produccion_id=None, vista=VISTA_COBRO,
+            mesa_id=mesa_id, estado=estado, total_pedido=total_pedido,
+            items=[{"nombre": d.nombre_producto, "cantidad": d.cantidad, "nota": d.nota_cocina} for d in detalles]
+        ))
+    return comandas
+
+def sentencia_cambio_estado_lote(pedido_ids: List[int], nuevo_estado: EstadoPedido):
+    """
+    Sentencia que refleja en la proyección el nuevo estado de los pedidos (todos al mismo
+    estado). Se ejecuta en la misma transacción que su UPDATE (db.execute / await db.execute).
+    """
+    nuevo_estado = EstadoPedido(nuevo_estado) # el KDS envía el estado como texto
+    if nuevo_estado in ESTADOS_TERMINALES:
+        return delete(ComandaKDS).where(ComandaKDS.pedido_id.in_(pedido_ids))
+    return update(ComandaKDS).where(ComandaKDS.pedido_id.in_(pedido_ids)).values(estado=nuevo_estado)
+
+def reconstruir_comandas(db: Session, negocio_id: Optional[int] = None) -> int:
+    """
+    Regenera la proyección desde pedidos y detalles (carga inicial o reparación).
+    No hace commit. Devuelve el número de comandas creadas.
+    """
+    borrado = delete(ComandaKDS)
+    consulta = select(modelos_pedidos.Pedido).options(
+        selectinload(modelos_pedidos.Pedido.detalles).selectinload(modelos_pedidos.DetallePedido.producto)
+    ).where(modelos_pedidos.Pedido.estado.not_in(ESTADOS_TERMINALES))
+    if negocio_id is not None:
+        borrado = borrado.where(ComandaKDS.negocio_id == negocio_id)
+        consulta = consulta.where(modelos_pedidos.Pedido.negocio_id == negocio_id)
+    db.execute(borrado)
+
+    creadas = 0
+    for pedido in db.execute(consulta).scalars():
+        for comanda in construir_comandas(pedido.negocio_id, pedido.mesa_id, pedido.estado, pedido.total_pedido, pedido.detalles):
+            comanda.pedido_id = pedido.id
+            comanda.fecha_creacion = pedido.fecha_creacion
+            db.add(comanda)
+            creadas += 1
+    return creadas
+
+
+# --- LECTURA ---
+
+def _a_dict(comanda: ComandaKDS) -> dict:
+    return {
+        "pedido_id": comanda.pedido_id,
+        "mesa_id": comanda.mesa_id,
+        "fecha_creacion": comanda.fecha_creacion,
+        "total_pedido": comanda.total_pedido,
+        "estado": comanda.estado,
+        "items": comanda.items,
+        "total_cobrar": comanda.total_pedido if comanda.estado == EstadoPedido.PENDIENTE_DE_PAGO else 0.0,
+    }
+
+def consulta_comandas_produccion(
+    negocio_id: int,
+    centro_id: int,
+    estados,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    recientes_primero: bool = False
+):
+    """Comandas de un centro en los estados pedidos, por el índice (centro, estado, fecha)."""
+    consulta = select(ComandaKDS).where(
+        ComandaKDS.centro_produccion_id == centro_id,
+        ComandaKDS.negocio_id == negocio_id,
+        ComandaKDS.estado.in_(estados)
+    )
+    if desde is not None:
+        consulta = consulta.where(ComandaKDS.fecha_creacion >= desde)
+    if hasta is not None:
+        consulta = consulta.where(ComandaKDS.fecha_creacion < hasta)
+    orden = ComandaKDS.fecha_creacion.desc() if recientes_primero else ComandaKDS.fecha_creacion.asc()
+    return consulta.order_by(orden, ComandaKDS.pedido_id)
+
+def consulta_comandas_cobro(negocio_id: int):
+    """Pedidos del negocio que esperan el pago en Caja, por el índice (negocio, vista, estado, fecha)."""
+    return select(ComandaKDS).where(
+        ComandaKDS.negocio_id == negocio_id,
+        ComandaKDS.vista == VISTA_COBRO,
+        ComandaKDS.estado == EstadoPedido.PENDIENTE_DE_PAGO
+    ).order_by(ComandaKDS.fecha_creacion.asc(), ComandaKDS.pedido_id)
+
+def leer_comandas_produccion(db: Session, negocio_id: int, centro_id: int, estados, **filtros) -> List[dict]:
+    consulta = consulta_comandas_produccion(negocio_id, centro_id, estados, **filtros)
+    return [_a_dict(c) for c in db.execute(consulta).scalars()]
+
+def leer_comandas_cobro(db: Session, negocio_id: int) -> List[dict]:
+    return [_a_dict(c) for c in db.execute(consulta_comandas_cobro(negocio_id)).scalars()]
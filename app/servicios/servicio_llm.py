@@ -1,26 +1,198 @@
-import google.generativeai as genai
+import asyncio
+import copy
 import json
-from typing import Dict, Any, List
+import re
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+from cachetools import TTLCache
 
 from app.core.config import settings
+from app.servicios.servicio_carta import MenuSnapshot
+
+RESPUESTA_DESCONOCIDA = {"intent": "UNKNOWN", "entities": []}
+
+
+class LLMNoDisponible(Exception):
+    """El LLM no respondió a tiempo, falló o el circuito está abierto."""
+
+
+# --- PROVEEDORES ---
+
+class ProveedorLLM(ABC):
+    """Interfaz mínima de un proveedor: recibe el prompt y devuelve el texto generado."""
+    @abstractmethod
+    async def generar(self, prompt: str) -> str:
+        ...
+
+
+class ProveedorGemini(ProveedorLLM):
+    def __init__(self, api_key: str, modelo: str):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(modelo)
+
+    async def generar(self, prompt: str) -> str:
+        respuesta = await self.model.generate_content_async(prompt, request_options={"timeout": settings.LLM_TIMEOUT})
+        return respuesta.text
+
+
+class ProveedorFalso(ProveedorLLM):
+    """
+    Proveedor local y determinista para pruebas y desarrollo sin API key.
+    Devuelve siempre la misma respuesta, opcionalmente tras una latencia simulada.
+    """
+    def __init__(self, respuesta: Optional[Dict[str, Any]] = None, latencia: float = 0.0):
+        self.respuesta = json.dumps(respuesta or {"intent": "NOT_FOUND", "entities": []})
+        self.latencia = latencia
+        self.llamadas = 0
+
+    async def generar(self, prompt: str) -> str:
+        self.llamadas += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        return self.respuesta
+
+
+def crear_proveedor(nombre: str) -> ProveedorLLM:
+    """Construye el proveedor configurado en settings.LLM_PROVEEDOR."""
+    if nombre == "gemini":
+        return ProveedorGemini(settings.GOOGLE_API_KEY, settings.LLM_MODELO)
+    if nombre == "falso":
+        return ProveedorFalso()
+    raise ValueError(f"Proveedor de LLM desconocido: '{nombre}'.")
+
+
+# --- CLIENTE CON TIMEOUT, LÍMITE DE CONCURRENCIA Y CIRCUIT BREAKER ---
+
+class CircuitoLLM:
+    """
+    Tras 'fallos_para_abrir' fallos seguidos deja de llamar al proveedor durante
+    'enfriamiento' segundos. Pasado ese tiempo deja pasar una llamada de prueba:
+    si sale bien se cierra, si falla vuelve a abrirse.
+    """
+    def __init__(self, fallos_para_abrir: int, enfriamiento: float):
+        self.fallos_para_abrir = fallos_para_abrir
+        self.enfriamiento = enfriamiento
+        self.fallos_seguidos = 0
+        self.abierto_hasta = 0.0
+        self.prueba_en_curso = False
+
+    @property
+    def estado(self) -> str:
+        if self.fallos_seguidos < self.fallos_para_abrir:
+            return "CERRADO"
+        return "ABIERTO" if time.monotonic() < self.abierto_hasta else "SEMIABIERTO"
+
+    def permitir(self) -> bool:
+        estado = self.estado
+        if estado == "CERRADO":
+            return True
+        if estado == "SEMIABIERTO" and not self.prueba_en_curso:
+            self.prueba_en_curso = True
+            return True
+        return False
+
+    def registrar_exito(self):
+        self.fallos_seguidos = 0
+        self.prueba_en_curso = False
+
+    def registrar_fallo(self):
+        self.fallos_seguidos += 1
+        self.prueba_en_curso = False
+        if self.fallos_seguidos >= self.fallos_para_abrir:
+            self.abierto_hasta = time.monotonic() + self.enfriamiento
+
+
+class ClienteLLM:
+    def __init__(self, proveedor: ProveedorLLM, timeout: float, concurrencia: int, circuito: CircuitoLLM):
+        self.proveedor = proveedor
+        self.timeout = timeout
+        self.semaforo = asyncio.Semaphore(concurrencia)
+        self.circuito = circuito
+        self.metricas = {"llamadas": 0, "timeouts": 0, "errores": 0, "rechazadas_circuito": 0}
 
-genai.configure(api_key=settings.GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-flash')
+    async def completar(self, prompt: str) -> str:
+        if not self.circuito.permitir():
+            self.metricas["rechazadas_circuito"] += 1
+            raise LLMNoDisponible("Circuito abierto")
 
+        try:
+            # El timeout cubre también la espera por un hueco del semáforo
+            async with asyncio.timeout(self.timeout):
+                async with self.semaforo:
+                    self.metricas["llamadas"] += 1
+                    texto = await self.proveedor.generar(prompt)
+        except TimeoutError as e:
+            self.metricas["timeouts"] += 1
+            self.circuito.registrar_fallo()
+            raise LLMNoDisponible(f"Sin respuesta en {self.timeout}s") from e
+        except Exception as e:
+            self.metricas["errores"] += 1
+            self.circuito.registrar_fallo()
+            raise LLMNoDisponible(str(e)) from e
 
-def procesar_orden_con_llm(menu_simple: List[Dict[str, Any]], texto_usuario: str) -> Dict[str, Any]:
-    # Convertimos la lista de menú a un string simple para el prompt
-    menu_texto = "\n".join([f"- ID: {item['id']}, Nombre: '{item['nombre']}', Alias: {item.get('alias', 'N/A')}" for item in menu_simple])
+        self.circuito.registrar_exito()
+        return texto
 
+    def estadisticas(self) -> dict:
+        return {**self.metricas, "circuito": self.circuito.estado}
+
+
+_cliente: Optional[ClienteLLM] = None
+
+def get_cliente() -> ClienteLLM:
+    """Cliente del proceso, creado al primer uso (así importar el módulo no configura Gemini)."""
+    global _cliente
+    if _cliente is None:
+        _cliente = ClienteLLM(
+            crear_proveedor(settings.LLM_PROVEEDOR),
+            timeout=settings.LLM_TIMEOUT,
+            concurrencia=settings.LLM_CONCURRENCIA,
+            circuito=CircuitoLLM(settings.LLM_FALLOS_PARA_ABRIR, settings.LLM_ENFRIAMIENTO),
+        )
+    return _cliente
+
+def usar_cliente(cliente: ClienteLLM):
+    """Sustituye el cliente del proceso (en pruebas, con un ProveedorFalso)."""
+    global _cliente
+    _cliente = cliente
+    _cache_resultados.clear()
+
+
+# --- PROMPT DEL MENÚ Y RESULTADOS EN CACHÉ ---
+
+# negocio_id -> (versión del menú, prompt sin la orden)
+_prompts_menu: Dict[int, Tuple[str, str]] = {}
+# (negocio_id, versión del menú, frase normalizada) -> resultado
+_cache_resultados: TTLCache = TTLCache(maxsize=2048, ttl=settings.LLM_CACHE_TTL)
+_lock_resultados = threading.Lock()
+# Llamadas en curso: la misma frase pedida a la vez espera a la primera en vez de repetirla
+_en_curso: Dict[tuple, asyncio.Future] = {}
+
+
+def prompt_menu(menu: MenuSnapshot) -> str:
+    """
+    Parte fija del prompt (instrucciones y menú) de un negocio. Se construye una vez
+    por versión del catálogo: cuando el menú cambia, cambia su versión y se rehace.
+    """
+    guardado = _prompts_menu.get(menu.negocio_id)
+    if guardado and guardado[0] == menu.version:
+        return guardado[1]
+
+    menu_texto = "\n".join(
+        f"- ID: {item['id']}, Nombre: '{item['nombre']}', Alias: {item.get('alias') or 'N/A'}"
+        for item in menu.productos_por_id.values() if item["activo"]
+    )
     prompt = f"""
     Analiza la orden de un cliente y conviértela a JSON. Eres un experto en reconocer productos de un menú.
 
     ### MENÚ DISPONIBLE:
     {menu_texto}
 
-    ### ORDEN DEL CLIENTE:
-    "{texto_usuario}"
-
     ### TUS REGLAS:
     1.  **Determina la INTENCIÓN:** 'ADD_ITEMS', 'MODIFY_QUANTITY', 'REMOVE_ITEMS', 'RESET_ORDER', o 'NOT_FOUND'.
     2.  **Extrae ENTIDADES:** Identifica los productos por su Nombre o Alias. Extrae su ID y la CANTIDAD numérica exacta. Si no hay cantidad, es 1.
@@ -34,12 +206,61 @@ def procesar_orden_con_llm(menu_simple: List[Dict[str, Any]], texto_usuario: str
         {{ "product_id": <ID>, "quantity": <CANTIDAD> }}
       ]
     }}
+
+    ### ORDEN DEL CLIENTE:
+    """
+    _prompts_menu[menu.negocio_id] = (menu.version, prompt)
+    return prompt
+
+
+def normalizar_orden(texto: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación y con espacios simples: la clave de la caché."""
+    texto = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", texto).split())
+
+
+async def procesar_orden_con_llm(menu: MenuSnapshot, texto_usuario: str) -> Dict[str, Any]:
     """
-    
+    Interpreta una orden de voz/texto con el LLM. Las frases iguales (una vez
+    normalizadas) contra la misma versión del menú se responden desde caché, y las
+    que llegan a la vez comparten una sola llamada. Si el LLM no está disponible
+    devuelve UNKNOWN (sin guardarlo en caché), igual que ante un error.
+    """
+    clave = (menu.negocio_id, menu.version, normalizar_orden(texto_usuario))
+    with _lock_resultados:
+        resultado = _cache_resultados.get(clave)
+    if resultado is not None:
+        return copy.deepcopy(resultado)
+
+    pendiente = _en_curso.get(clave)
+    if pendiente is not None:
+        try:
+            return copy.deepcopy(await asyncio.shield(pendiente))
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling() or not pendiente.cancelled():
+                raise # Cancelaron a este llamador, no la llamada compartida
+            # Cancelaron a quien hacía la llamada (cliente que se fue, apagado): se repite por cuenta propia
+            return await procesar_orden_con_llm(menu, texto_usuario)
+
+    pendiente = asyncio.get_running_loop().create_future()
+    _en_curso[clave] = pendiente
+    try:
+        resultado = await _consultar_llm(menu, texto_usuario)
+        if resultado is not RESPUESTA_DESCONOCIDA:
+            with _lock_resultados:
+                _cache_resultados[clave] = resultado
+        pendiente.set_result(resultado)
+    finally:
+        _en_curso.pop(clave, None)
+        if not pendiente.done():
+            pendiente.cancel()
+    return copy.deepcopy(resultado)
+
+
+async def _consultar_llm(menu: MenuSnapshot, texto_usuario: str) -> Dict[str, Any]:
     try:
-        response = model.generate_content(prompt)
-        json_response_str = response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(json_response_str)
-    except Exception as e:
+        texto = await get_cliente().completar(prompt_menu(menu) + f'"{texto_usuario}"\n')
+        return json.loads(texto.strip().replace("```json", "").replace("```", ""))
+    except (LLMNoDisponible, ValueError) as e:
         print(f"[ERROR en LLM]: {e}")
-        return {"intent": "UNKNOWN", "entities": []}
\ No newline at end of file
+        return RESPUESTA_DESCONOCIDA
@@ -0,0 +1,291 @@
+# app/servicios/servicio_metricas.py
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.fechas import dia_local, rango_dia_local
+from app.db.modelos import modelos_core, modelos_financieros, modelos_metricas, modelos_pedidos
+
+EstadoPedido = modelos_pedidos.EstadoPedido
+MetricaDiaria = modelos_metricas.MetricaDiaria
+MetricaNegocio = modelos_metricas.MetricaNegocio
+ResumenVentaProducto = modelos_metricas.ResumenVentaProducto
+
+# Estados que cuentan como venta: todo pedido confirmado que no se canceló
+ESTADOS_VENTA = (EstadoPedido.PENDIENTE, EstadoPedido.EN_PREPARACION, EstadoPedido.LISTO_PARA_RECOGER, EstadoPedido.COMPLETADO)
+ESTADOS_ACTIVOS = (EstadoPedido.PENDIENTE, EstadoPedido.EN_PREPARACION, EstadoPedido.LISTO_PARA_RECOGER)
+# Días previos a hoy que promedia "pedidos por día"
+DIAS_PROMEDIO = 7
+# Variantes con este stock o menos cuentan como alerta
+STOCK_MINIMO = 5
+
+
+def dia_local_sql(columna):
+    """date() local de una columna timestamptz, en SQL."""
+    # La zona va como literal: la misma expresión en SELECT y GROUP BY también con asyncpg
+    return func.date(func.timezone(literal(settings.ZONA_HORARIA, literal_execute=True), columna))
+
+def consulta_ventas_producto(signo: int = 1):
+    """
+    Detalles de pedido agregados a las dimensiones de resumen_ventas_producto
+    (negocio, día, local, producto, centro). Sin filtros: los añade quien la usa.
+    """
+    Pedido, Detalle, Producto = modelos_pedidos.Pedido, modelos_pedidos.DetallePedido, modelos_core.Producto
+    enlace = modelos_pedidos.detalle_pedido_modificadores
+    extras = select(
+        enlace.c.detalle_pedido_id, func.sum(modelos_core.OpcionModificador.precio_extra).label("extra")
+    ).join(modelos_core.OpcionModificador, modelos_core.OpcionModificador.id == enlace.c.opcion_modificador_id
+    ).group_by(enlace.c.detalle_pedido_id).subquery()
+
+    dia = dia_local_sql(Pedido.fecha_creacion)
+    local = func.coalesce(modelos_core.Zona.local_id, modelos_metricas.SIN_DIMENSION)
+    centro = func.coalesce(Producto.centro_produccion_id, modelos_metricas.SIN_DIMENSION)
+    return select(
+        Pedido.negocio_id, dia.label("dia"), local.label("local_id"), Detalle.producto_id, centro.label("centro_produccion_id"),
+        (func.sum(Detalle.cantidad) * signo).label("cantidad"),
+        (func.sum(Detalle.cantidad * (Detalle.precio_unitario + func.coalesce(extras.c.extra, 0))) * signo).label("bruto"),
+    ).select_from(Detalle).join(Pedido, Pedido.id == Detalle.pedido_id
+    ).join(Producto, Producto.id == Detalle.producto_id
+    ).outerjoin(modelos_core.Mesa, modelos_core.Mesa.id == Pedido.mesa_id
+    ).outerjoin(modelos_core.Zona, modelos_core.Zona.id == modelos_core.Mesa.zona_id
+    ).outerjoin(extras, extras.c.detalle_pedido_id == Detalle.id
+    ).group_by(Pedido.negocio_id, dia, local, Detalle.producto_id, centro)
+
+
+# --- ESCRITURA INCREMENTAL ---
+
+def _sumar_dia(negocio_id: int, dia: date, ventas=Decimal('0.00'), pedidos=0, pedidos_cancelados=0, mesas_atendidas=0):
+    sentencia = pg_insert(MetricaDiaria).values(
+        negocio_id=negocio_id, dia=dia, ventas=ventas, pedidos=pedidos,
+        pedidos_cancelados=pedidos_cancelados, mesas_atendidas=mesas_atendidas
+    )
+    return sentencia.on_conflict_do_update(
+        index_elements=[MetricaDiaria.negocio_id, MetricaDiaria.dia],
+        set_={
+            columna: getattr(MetricaDiaria, columna) + getattr(sentencia.excluded, columna)
+            for columna in ("ventas", "pedidos", "pedidos_cancelados", "mesas_atendidas")
+        }
+    )
+
+def _sumar_activos(negocio_id: int, delta: int):
+    sentencia = pg_insert(MetricaNegocio).values(negocio_id=negocio_id, pedidos_activos=max(delta, 0))
+    return sentencia.on_conflict_do_update(
+        index_elements=[MetricaNegocio.negocio_id],
+        set_={"pedidos_activos": MetricaNegocio.pedidos_activos + delta, "actualizado_en": func.now()}
+    )
+
+def _sumar_pedidos_al_resumen(pedido_ids: List[int], signo: int):
+    """
+    Suma (signo=1) o resta (signo=-1) los detalles de los pedidos en resumen_ventas_producto
+    con un solo INSERT ... SELECT ... ON CONFLICT. Los detalles ya deben estar en la
+    base de datos (tras un flush).
+    """
+    origen = consulta_ventas_producto(signo).where(modelos_pedidos.Pedido.id.in_(pedido_ids))
+    sentencia = pg_insert(ResumenVentaProducto).from_select(
+        ["negocio_id", "dia", "local_id", "producto_id", "centro_produccion_id", "cantidad", "bruto"], origen
+    )
+    return sentencia.on_conflict_do_update(
+        index_elements=[columna.name for columna in ResumenVentaProducto.__table__.primary_key.columns],
+        set_={
+            "cantidad": ResumenVentaProducto.cantidad + sentencia.excluded.cantidad,
+            "bruto": ResumenVentaProducto.bruto + sentencia.excluded.bruto,
+        }
+    )
+
+def _deltas(anterior: Optional[EstadoPedido], nuevo: EstadoPedido) -> Tuple[int, int, int]:
+    """(venta, cancelado, activos) que suma pasar de 'anterior' a 'nuevo': -1, 0 o 1 cada uno."""
+    nuevo = EstadoPedido(nuevo)
+    anterior = EstadoPedido(anterior) if anterior is not None else None
+    return (
+        (nuevo in ESTADOS_VENTA) - (anterior in ESTADOS_VENTA),
+        (nuevo == EstadoPedido.CANCELADO) - (anterior == EstadoPedido.CANCELADO),
+        (nuevo in ESTADOS_ACTIVOS) - (anterior in ESTADOS_ACTIVOS),
+    )
+
+def sentencias_cambio_estado(
+    negocio_id: int,
+    anterior: Optional[EstadoPedido],
+    nuevo: EstadoPedido,
+    total_pedido: Decimal,
+    fecha_creacion: Optional[datetime] = None,
+    pedido_id: Optional[int] = None
+) -> List:
+    """
+    Sentencias que llevan los contadores de un pedido de 'anterior' a 'nuevo'
+    (anterior=None al crearlo). La venta se imputa al día local en que se creó el
+    pedido. Con 'pedido_id' también se ajusta el resumen de ventas por producto.
+    Se ejecutan en la misma transacción que el cambio, justo antes del commit:
+    bloquean las filas de resumen el menor tiempo posible.
+    """
+    venta, cancelado, activos = _deltas(anterior, nuevo)
+    sentencias = []
+    if venta or cancelado:
+        sentencias.append(_sumar_dia(
+            negocio_id, dia_local(fecha_creacion),
+            ventas=total_pedido * venta, pedidos=venta, pedidos_cancelados=cancelado
+        ))
+    if venta and pedido_id is not None:
+        sentencias.append(_sumar_pedidos_al_resumen([pedido_id], venta))
+    if activos:
+        sentencias.append(_sumar_activos(negocio_id, activos))
+    return sentencias
+
+def sentencias_cambios_estado(
+    negocio_id: int,
+    cambios: Iterable[Tuple[int, EstadoPedido, EstadoPedido, Decimal, datetime]]
+) -> List:
+    """
+    Lo mismo para un lote de pedidos del negocio, con 'cambios' como tuplas
+    (pedido_id, anterior, nuevo, total_pedido, fecha_creacion). Los deltas se agregan:
+    un upsert por día afectado, uno del resumen por signo y uno de activos, en vez de
+    varios por pedido. Los días van ordenados para bloquear siempre en el mismo orden.
+    """
+    por_dia = defaultdict(lambda: [Decimal('0.00'), 0, 0])
+    por_signo = {1: [], -1: []}
+    total_activos = 0
+    for pedido_id, anterior, nuevo, total_pedido, fecha_creacion in cambios:
+        venta, cancelado, activos = _deltas(anterior, nuevo)
+        if venta or cancelado:
+            acumulado = por_dia[dia_local(fecha_creacion)]
+            acumulado[0] += total_pedido * venta
+            acumulado[1] += venta
+            acumulado[2] += cancelado
+        if venta:
+            por_signo[venta].append(pedido_id)
+        total_activos += activos
+
+    sentencias = [
+        _sumar_dia(negocio_id, dia, ventas=ventas, pedidos=pedidos, pedidos_cancelados=cancelados)
+        for dia, (ventas, pedidos, cancelados) in sorted(por_dia.items())
+        if ventas or pedidos or cancelados
+    ]
+    sentencias += [_sumar_pedidos_al_resumen(ids, signo) for signo, ids in por_signo.items() if ids]
+    if total_activos:
+        sentencias.append(_sumar_activos(negocio_id, total_activos))
+    return sentencias
+
+def sentencias_pedido_creado(negocio_id: int, pedido_id: int, estado: EstadoPedido, total_pedido: Decimal, abrio_cuenta_de_mesa: bool) -> List:
+    """Contadores de un pedido nuevo; si abrió la cuenta de una mesa, es una mesa atendida más."""
+    sentencias = sentencias_cambio_estado(negocio_id, None, estado, total_pedido, pedido_id=pedido_id)
+    if abrio_cuenta_de_mesa:
+        sentencias.append(_sumar_dia(negocio_id, dia_local(), mesas_atendidas=1))
+    return sentencias
+
+
+# --- LECTURA ---
+
+def _variacion(actual, anterior) -> Optional[float]:
+    if not anterior:
+        return None
+    return round((float(actual) - float(anterior)) * 100 / float(anterior), 1)
+
+def leer_dashboard(db: Session, negocio_id: int) -> dict:
+    """
+    Cifras del dashboard en dos lecturas por clave primaria (los días recientes
+    y la fila del negocio), sin recorrer pedidos ni transacciones.
+    """
+    hoy = dia_local()
+    filas = {
+        fila.dia: fila for fila in db.execute(select(MetricaDiaria).where(
+            MetricaDiaria.negocio_id == negocio_id,
+            MetricaDiaria.dia.between(hoy - timedelta(days=DIAS_PROMEDIO), hoy)
+        )).scalars()
+    }
+    negocio = db.get(MetricaNegocio, negocio_id)
+
+    vacia = MetricaDiaria(ventas=Decimal('0.00'), pedidos=0, pedidos_cancelados=0, mesas_atendidas=0)
+    de_hoy = filas.get(hoy, vacia)
+    de_ayer = filas.get(hoy - timedelta(days=1), vacia)
+    pedidos_previos = sum(fila.pedidos for dia, fila in filas.items() if dia < hoy)
+
+    return {
+        "ventas_hoy": float(de_hoy.ventas),
+        "comparacion_ayer": _variacion(de_hoy.ventas, de_ayer.ventas),
+        "pedidos_hoy": de_hoy.pedidos,
+        "pedidos_activos": negocio.pedidos_activos if negocio else 0,
+        "promedio_diario": round(pedidos_previos / DIAS_PROMEDIO),
+        "clientes_atendidos": de_hoy.mesas_atendidas,
+        "comparacion_clientes_ayer": _variacion(de_hoy.mesas_atendidas, de_ayer.mesas_atendidas),
+        "actualizado_en": negocio.actualizado_en.isoformat() if negocio and negocio.actualizado_en else None,
+    }
+
+
+def contar_alertas_stock(db: Session, negocio_id: int) -> int:
+    """Variantes con stock controlado por debajo del mínimo. Recorre el catálogo, no el histórico."""
+    return db.execute(
+        select(func.count()).select_from(modelos_core.VarianteProducto).join(modelos_core.Producto).where(
+            modelos_core.Producto.negocio_id == negocio_id,
+            modelos_core.VarianteProducto.stock.is_not(None),
+            modelos_core.VarianteProducto.stock <= STOCK_MINIMO
+        )
+    ).scalar()
+
+
+# --- RECÁLCULO (REPARA DESVÍOS) ---
+
+def recalcular_metricas(db: Session, negocio_id: Optional[int] = None, dias: int = DIAS_PROMEDIO + 1) -> int:
+    """
+    Rehace desde pedidos y cuentas los contadores de los últimos 'dias' días y los
+    pedidos activos. Es la reparación de los incrementos (por ejemplo, tras editar
+    pedidos a mano); conviene lanzarlo con poca actividad, porque un pedido que
+    entre mientras tanto puede no quedar contado. No hace commit. Devuelve las filas diarias escritas.
+    """
+    Pedido = modelos_pedidos.Pedido
+    Cuenta = modelos_financieros.Cuenta
+    desde, _ = rango_dia_local(dia_local() - timedelta(days=dias - 1))
+
+    dia_pedido = dia_local_sql(Pedido.fecha_creacion)
+    consulta_pedidos = select(
+        Pedido.negocio_id, dia_pedido.label("dia"),
+        func.coalesce(func.sum(case((Pedido.estado.in_(ESTADOS_VENTA), Pedido.total_pedido))), 0).label("ventas"),
+        func.count().filter(Pedido.estado.in_(ESTADOS_VENTA)).label("pedidos"),
+        func.count().filter(Pedido.estado == EstadoPedido.CANCELADO).label("pedidos_cancelados"),
+    ).where(Pedido.fecha_creacion >= desde).group_by(Pedido.negocio_id, dia_pedido)
+
+    dia_cuenta = dia_local_sql(Cuenta.fecha_apertura)
+    consulta_mesas = select(
+        Cuenta.negocio_id, dia_cuenta.label("dia"), func.count().label("mesas_atendidas")
+    ).where(Cuenta.fecha_apertura >= desde, Cuenta.mesa_id.is_not(None)).group_by(Cuenta.negocio_id, dia_cuenta)
+
+    consulta_activos = select(Pedido.negocio_id, func.count().label("pedidos_activos")).where(
+        Pedido.estado.in_(ESTADOS_ACTIVOS)
+    ).group_by(Pedido.negocio_id)
+
+    borrado = delete(MetricaDiaria).where(MetricaDiaria.dia >= dia_local(desde))
+    reinicio = update(MetricaNegocio).values(pedidos_activos=0, actualizado_en=func.now())
+    if negocio_id is not None:
+        consulta_pedidos = consulta_pedidos.where(Pedido.negocio_id == negocio_id)
+        consulta_mesas = consulta_mesas.where(Cuenta.negocio_id == negocio_id)
+        consulta_activos = consulta_activos.where(Pedido.negocio_id == negocio_id)
+        borrado = borrado.where(MetricaDiaria.negocio_id == negocio_id)
+        reinicio = reinicio.where(MetricaNegocio.negocio_id == negocio_id)
+
+    filas = {}
+    for fila in db.execute(consulta_pedidos):
+        filas[(fila.negocio_id, fila.dia)] = {
+            "negocio_id": fila.negocio_id, "dia": fila.dia, "ventas": fila.ventas, "pedidos": fila.pedidos,
+            "pedidos_cancelados": fila.pedidos_cancelados, "mesas_atendidas": 0,
+        }
+    for fila in db.execute(consulta_mesas):
+        filas.setdefault((fila.negocio_id, fila.dia), {
+            "negocio_id": fila.negocio_id, "dia": fila.dia, "ventas": Decimal('0.00'), "pedidos": 0, "pedidos_cancelados": 0,
+        })["mesas_atendidas"] = fila.mesas_atendidas
+
+    db.execute(borrado)
+    if filas:
+        db.execute(pg_insert(MetricaDiaria), list(filas.values()))
+
+    db.execute(reinicio)
+    for fila in db.execute(consulta_activos).all():
+        sentencia = pg_insert(MetricaNegocio).values(negocio_id=fila.negocio_id, pedidos_activos=fila.pedidos_activos)
+        db.execute(sentencia.on_conflict_do_update(
+            index_elements=[MetricaNegocio.negocio_id],
+            set_={"pedidos_activos": sentencia.excluded.pedidos_activos, "actualizado_en": func.now()}
+        ))
+    return len(filas)
@@ -0,0 +1,100 @@
+# app/servicios/servicio_negocio.py
+import re
+import threading
+import unicodedata
+from typing import Optional
+from urllib.parse import unquote
+
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.modelos import modelos_core
+
+
+def generar_slug(texto: str) -> str:
+    """'Sabor Criollo' -> 'sabor-criollo'. Quita tildes y todo lo que no sea alfanumérico."""
+    texto = unicodedata.normalize("NFKD", unquote(texto or "")).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", texto.lower()).strip("-")
+
+
+async def generar_slug_unico(db: AsyncSession, nombre: str) -> str:
+    """Genera el slug de un negocio nuevo, añadiendo -2, -3... si ya está en uso."""
+    base = generar_slug(nombre) or "negocio"
+    slug, sufijo = base, 1
+    while (await db.execute(select(modelos_core.Negocio.id).where(modelos_core.Negocio.slug == slug))).first():
+        sufijo += 1
+        slug = f"{base}-{sufijo}"
+    return slug
+
+
+class NegocioResuelto:
+    """Datos mínimos del negocio que necesitan las rutas públicas. No es una fila ORM."""
+    __slots__ = ("id", "slug", "nombre_comercial", "modo_cobro", "tema_id", "activo")
+
+    def __init__(self, id: int, slug: str, nombre_comercial: Optional[str], modo_cobro: str, tema_id: Optional[int], activo: bool):
+        self.id = id
+        self.slug = slug
+        self.nombre_comercial = nombre_comercial
+        self.modo_cobro = modo_cobro
+        self.tema_id = tema_id
+        self.activo = activo
+
+
+_cache_negocios: TTLCache = TTLCache(maxsize=2048, ttl=settings.NEGOCIO_CACHE_TTL)
+_lock_negocios = threading.Lock()
+
+_COLUMNAS = (
+    modelos_core.Negocio.id,
+    modelos_core.Negocio.slug,
+    modelos_core.Negocio.nombre_comercial,
+    modelos_core.Negocio.modo_cobro,
+    modelos_core.Negocio.tema_id,
+    modelos_core.Negocio.activo,
+)
+
+
+def _desde_cache(slug: str) -> Optional[NegocioResuelto]:
+    with _lock_negocios:
+        return _cache_negocios.get(slug)
+
+
+def _guardar(slug: str, fila) -> Optional[NegocioResuelto]:
+    if fila is None:
+        return None
+    negocio = NegocioResuelto(fila.id, fila.slug, fila.nombre_comercial, fila.modo_cobro, fila.tema_id, fila.activo is not False)
+    with _lock_negocios:
+        _cache_negocios[slug] = negocio
+    return negocio
+
+
+def resolver_negocio(db: Session, slug_negocio: str) -> Optional[NegocioResuelto]:
+    """
+    Traduce el slug de la URL al negocio. Acepta también los enlaces antiguos con el
+    nombre comercial ('Sabor%20Criollo'), porque se normalizan al mismo slug.
+    """
+    slug = generar_slug(slug_negocio)
+    negocio = _desde_cache(slug)
+    if negocio is None:
+        fila = db.execute(select(*_COLUMNAS).where(modelos_core.Negocio.slug == slug)).first()
+        negocio = _guardar(slug, fila)
+    return negocio
+
+
+async def resolver_negocio_async(db: AsyncSession, slug_negocio: str) -> Optional[NegocioResuelto]:
+    """Versión asíncrona de resolver_negocio."""
+    slug = generar_slug(slug_negocio)
+    negocio = _desde_cache(slug)
+    if negocio is None:
+        fila = (await db.execute(select(*_COLUMNAS).where(modelos_core.Negocio.slug == slug))).first()
+        negocio = _guardar(slug, fila)
+    return negocio
+
+
+def invalidar_negocio(negocio_id: int):
+    """Olvida el negocio resuelto tras cambiar su configuración (modo de cobro, tema, etc.)."""
+    with _lock_negocios:
+        for slug in [s for s, n in _cache_negocios.items() if n.id == negocio_id]:
+            _cache_negocios.pop(slug, None)
@@ -0,0 +1,211 @@
+# app/servicios/servicio_orden_voz.py
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.servicios import servicio_llm
+from app.servicios.servicio_carta import MenuSnapshot
+from app.servicios.servicio_llm import normalizar_orden
+
+# Similitud mínima (Dice sobre trigramas) para aceptar un producto sin consultar al LLM
+UMBRAL_CONFIANZA = 0.75
+# Si el segundo candidato se queda a menos de esto del primero, la frase es ambigua
+MARGEN_AMBIGUEDAD = 0.08
+# Palabras máximas de un nombre de producto que se intentan casar de una vez
+MAX_PALABRAS_NOMBRE = 6
+
+NUMEROS = {
+    "un": 1, "uno": 1, "una": 1, "otro": 1, "otra": 1, "dos": 2, "tres": 3, "cuatro": 4,
+    "cinco": 5, "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11,
+    "doce": 12, "trece": 13, "catorce": 14, "quince": 15, "veinte": 20, "docena": 12,
+}
+PALABRAS_QUITAR = {
+    "quita", "quitar", "quitame", "quitale", "saca", "sacar", "sacame", "elimina", "eliminar",
+    "borra", "borrar", "borrame", "cancela", "cancelar", "menos",
+}
+PALABRAS_AGREGAR = {
+    "quiero", "queria", "quisiera", "dame", "deme", "da", "trae", "traeme", "traiga", "traigan",
+    "pon", "ponme", "ponle", "agrega", "agregar", "agregame", "anade", "anadir", "anademe",
+    "pide", "pido", "pedir", "mandame", "manda", "tambien",
+}
+# Frases que vacían el pedido entero
+FRASES_REINICIO = (
+    "borra todo", "borrar todo", "quita todo", "quitar todo", "cancela todo", "cancelar todo",
+    "elimina todo", "empezar de nuevo", "empezar otra vez", "vaciar pedido", "vacia el pedido",
+)
+# Cambios de cantidad o correcciones: se dejan al LLM
+PALABRAS_AMBIGUAS = {"cambia", "cambiar", "cambiame", "mejor", "solo", "solamente", "envez", "vez", "no"}
+# Relleno que puede ir entre productos sin restar confianza
+PALABRAS_RELLENO = {
+    "y", "e", "con", "de", "del", "el", "la", "los", "las", "lo", "a", "al", "para", "por", "favor",
+    "porfa", "porfavor", "me", "nos", "mi", "yo", "hola", "gracias", "mas", "ademas", "tambien",
+    "porcion", "porciones", "orden", "ordenes", "unidad", "unidades", "vaso", "vasos",
+}
+
+
+def _singular(palabra: str) -> str:
+    """'papas' -> 'papa', 'limones' -> 'limon'. Basta para comparar, no es gramática."""
+    if len(palabra) > 4 and palabra.endswith("es") and palabra[-3] not in "aeiou":
+        return palabra[:-2]
+    if len(palabra) > 3 and palabra.endswith("s"):
+        return palabra[:-1]
+    return palabra
+
+
+def _trigramas(texto: str) -> Set[str]:
+    texto = f"  {texto} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _similitud(a: Set[str], b: Set[str]) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+class IndiceProductos:
+    """
+    Nombres y alias de los productos activos de un negocio, normalizados y en
+    singular, con un índice invertido de trigramas para encontrar candidatos.
+    """
+    __slots__ = ("version", "nombres", "por_trigrama")
+
+    def __init__(self, menu: MenuSnapshot):
+        self.version = menu.version
+        # (texto normalizado, trigramas, product_id)
+        self.nombres: List[Tuple[str, Set[str], int]] = []
+        self.por_trigrama: Dict[str, List[int]] = defaultdict(list)
+
+        for item in menu.productos_por_id.values():
+            if not item["activo"]:
+                continue
+            variantes = [item["nombre"]] + (item.get("alias") or "").replace(";", ",").split(",")
+            for variante in variantes:
+                texto = " ".join(_singular(p) for p in normalizar_orden(variante).split())
+                if not texto:
+                    continue
+                trigramas = _trigramas(texto)
+                posicion = len(self.nombres)
+                self.nombres.append((texto, trigramas, item["id"]))
+                for trigrama in trigramas:
+                    self.por_trigrama[trigrama].append(posicion)
+
+    def buscar(self, texto: str) -> Tuple[Optional[int], float, float]:
+        """Mejor producto para 'texto': (product_id, similitud, similitud del siguiente producto)."""
+        trigramas = _trigramas(texto)
+        candidatos = {pos for t in trigramas for pos in self.por_trigrama.get(t, ())}
+
+        mejor_por_producto: Dict[int, float] = {}
+        for posicion in candidatos:
+            nombre, trigramas_nombre, producto_id = self.nombres[posicion]
+            similitud = 1.0 if nombre == texto else _similitud(trigramas, trigramas_nombre)
+            if similitud > mejor_por_producto.get(producto_id, 0.0):
+                mejor_por_producto[producto_id] = similitud
+
+        if not mejor_por_producto:
+            return None, 0.0, 0.0
+        ranking = sorted(mejor_por_producto.items(), key=lambda par: par[1], reverse=True)
+        segundo = ranking[1][1] if len(ranking) > 1 else 0.0
+        return ranking[0][0], ranking[0][1], segundo
+
+
+# Cuántas órdenes resolvió el intérprete local y cuántas acabaron en el LLM
+METRICAS_INTERPRETE = {"locales": 0, "al_llm": 0}
+
+_indices: Dict[int, IndiceProductos] = {}
+_lock_indices = threading.Lock()
+
+
+def get_indice(menu: MenuSnapshot) -> IndiceProductos:
+    """Índice del negocio, reconstruido solo cuando cambia la versión del menú."""
+    indice = _indices.get(menu.negocio_id)
+    if indice is None or indice.version != menu.version:
+        indice = IndiceProductos(menu)
+        with _lock_indices:
+            _indices[menu.negocio_id] = indice
+    return indice
+
+
+def _es_numero(palabra: str) -> bool:
+    return palabra.isdigit() or palabra in NUMEROS
+
+
+def _cantidad(palabra: str) -> int:
+    return int(palabra) if palabra.isdigit() else NUMEROS[palabra]
+
+
+def interpretar_localmente(menu: MenuSnapshot, texto_usuario: str) -> Optional[Dict[str, Any]]:
+    """
+    Intenta interpretar la orden sin LLM: cantidades (en cifra o en palabras),
+    productos por nombre o alias y las intenciones ADD_ITEMS, REMOVE_ITEMS y
+    RESET_ORDER. Devuelve None si algo queda dudoso, para que decida el LLM.
+    """
+    texto = normalizar_orden(texto_usuario)
+    if not texto:
+        return None
+    if any(frase in texto for frase in FRASES_REINICIO):
+        return {"intent": "RESET_ORDER", "entities": []}
+
+    palabras = texto.split()
+    if any(p in PALABRAS_AMBIGUAS for p in palabras) or "ya no" in texto:
+        return None
+    quitar = any(p in PALABRAS_QUITAR for p in palabras)
+    if quitar and any(p in PALABRAS_AGREGAR for p in palabras):
+        return None
+
+    indice = get_indice(menu)
+    ignorables = PALABRAS_QUITAR | PALABRAS_AGREGAR | PALABRAS_RELLENO
+    palabras = [p if p in ignorables or _es_numero(p) else _singular(p) for p in palabras]
+
+    entidades: Dict[int, int] = {}
+    cantidad: Optional[int] = None
+    i = 0
+    while i < len(palabras):
+        palabra = palabras[i]
+        if palabra == "media" and i + 1 < len(palabras) and palabras[i + 1] == "docena":
+            cantidad, i = 6, i + 2
+            continue
+        if _es_numero(palabra):
+            cantidad, i = _cantidad(palabra), i + 1
+            continue
+
+        # La ventana más larga que empieza aquí y casa con un producto sin ambigüedad
+        encontrado = None
+        if palabra not in ignorables:
+            fin_maximo = min(len(palabras), i + MAX_PALABRAS_NOMBRE)
+            for fin in range(fin_maximo, i, -1):
+                ventana = palabras[i:fin]
+                if ventana[-1] in ignorables or any(_es_numero(p) for p in ventana):
+                    continue
+                producto_id, similitud, segundo = indice.buscar(" ".join(ventana))
+                if similitud >= UMBRAL_CONFIANZA:
+                    if similitud - segundo < MARGEN_AMBIGUEDAD:
+                        return None
+                    encontrado = (producto_id, fin)
+                    break
+
+        if encontrado:
+            producto_id, i = encontrado
+            # Sin número, quitar un producto significa quitarlo entero (misma regla que el LLM)
+            por_defecto = 999 if quitar else 1
+            entidades[producto_id] = entidades.get(producto_id, 0) + (cantidad or por_defecto)
+            cantidad = None
+        elif palabra in ignorables:
+            i += 1
+        else:
+            return None # palabra que no es relleno ni parte de un producto conocido
+
+    if not entidades or cantidad is not None:
+        return None
+    return {
+        "intent": "REMOVE_ITEMS" if quitar else "ADD_ITEMS",
+        "entities": [{"product_id": pid, "quantity": cantidad} for pid, cantidad in entidades.items()],
+    }
+
+
+async def interpretar_orden(menu: MenuSnapshot, texto_usuario: str) -> Dict[str, Any]:
+    """Primero el intérprete local; el LLM solo cuando este no está seguro."""
+    resultado = interpretar_localmente(menu, texto_usuario)
+    if resultado is not None:
+        METRICAS_INTERPRETE["locales"] += 1
+        return resultado
+    METRICAS_INTERPRETE["al_llm"] += 1
+    return await servicio_llm.procesar_orden_con_llm(menu, texto_usuario)
@@ -1,6 +1,9 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple
 from decimal import Decimal
-import json
 from collections import defaultdict
 from datetime import datetime, timezone
 
@@ -10,23 +13,132 @@ from app.db.modelos import modelos_pedidos
 from app.db.modelos import modelos_financieros
 from app.db.modelos import modelos_operativos
 from app.esquemas import esquemas_pedido
+from app.core.serializacion import a_json
 from app.core.websocket_manager import manager
+from app.servicios import servicio_demoras, servicio_kds, servicio_metricas
+from app.servicios.servicio_demoras import planificador_demoras
 
-async def crear_nuevo_pedido(
-    db: Session, 
-    negocio_id: int, 
-    pedido_data: esquemas_pedido.PedidoCreate,
-    estado_inicial: modelos_pedidos.EstadoPedido = modelos_pedidos.EstadoPedido.PENDIENTE
-) -> modelos_pedidos.Pedido:
-    
-    # 1. Calcular el total del pedido y preparar los detalles
+# --- CONSULTAS COMPARTIDAS (SÍNCRONAS Y ASÍNCRONAS) ---
+
+def _consultas_catalogo_pedido(negocio_id: int, items: List[esquemas_pedido.ItemPedidoCreate]) -> dict:
+    """
+    Construye una consulta IN por tabla (productos, variantes y opciones de modificador)
+    con todo lo que referencian los items del pedido. Omite las que no hacen falta.
+    """
+    producto_ids = {item.producto_id for item in items}
+    variante_ids = {item.variante_id for item in items if item.variante_id}
+    opcion_ids = {opcion_id for item in items for opcion_id in item.modificadores_seleccionados}
+
+    consultas = {}
+    if producto_ids:
+        consultas["productos"] = select(modelos_core.Producto).where(
+            modelos_core.Producto.id.in_(producto_ids),
+            modelos_core.Producto.negocio_id == negocio_id
+        )
+    if variante_ids:
+        consultas["variantes"] = select(modelos_core.VarianteProducto).where(
+            modelos_core.VarianteProducto.id.in_(variante_ids)
+        )
+    if opcion_ids:
+        consultas["opciones"] = select(modelos_core.OpcionModificador).where(
+            modelos_core.OpcionModificador.id.in_(opcion_ids)
+        )
+    return consultas
+
+def _sentencia_cargar_cuenta(negocio_id: int, pedido_data: esquemas_pedido.PedidoCreate, total_pedido: Decimal):
+    """
+    Abre la cuenta de la mesa o suma el pedido a la que ya está abierta, en una sola
+    sentencia atómica (INSERT ... ON CONFLICT sobre el índice único parcial
+    uq_cuentas_abierta_por_mesa) que devuelve el id y si la cuenta es nueva
+    (xmax = 0 solo en filas recién insertadas). La fila queda bloqueada hasta el
+    commit, así que dos pedidos simultáneos a la misma mesa se serializan sobre ella
+    en lugar de abrir cuentas duplicadas o pisarse el total.
+    Sin mesa no hay nada que compartir: cada pedido abre su propia cuenta.
+    """
+    Cuenta = modelos_financieros.Cuenta
+    sentencia = pg_insert(Cuenta).values(
+        negocio_id=negocio_id,
+        mesa_id=pedido_data.mesa_id,
+        zona_id=pedido_data.zona_id,
+        estado=modelos_financieros.EstadoCuenta.ABIERTA,
+        total_calculado=total_pedido
+    )
+    if pedido_data.mesa_id is not None:
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[Cuenta.negocio_id, Cuenta.mesa_id],
+            # Literal, no parámetro: Postgres debe poder inferir el índice parcial al preparar la sentencia
+            index_where=text("estado = 'ABIERTA'"),
+            set_={"total_calculado": Cuenta.total_calculado + sentencia.excluded.total_calculado}
+        )
+    return sentencia.returning(Cuenta.id, literal_column("xmax = 0").label("cuenta_nueva"))
+
+def _sentencias_metricas(nuevo_pedido: modelos_pedidos.Pedido, cuenta_nueva: bool):
+    """Contadores del dashboard y resumen de ventas del pedido nuevo (ya con id), en su misma transacción."""
+    abrio_cuenta_de_mesa = bool(cuenta_nueva) and nuevo_pedido.mesa_id is not None
+    return servicio_metricas.sentencias_pedido_creado(
+        nuevo_pedido.negocio_id, nuevo_pedido.id, nuevo_pedido.estado, nuevo_pedido.total_pedido, abrio_cuenta_de_mesa
+    )
+
+def _consulta_id_caja(negocio_id: int):
+    return select(modelos_operativos.CentroProduccion.id).where(
+        modelos_operativos.CentroProduccion.negocio_id == negocio_id,
+        modelos_operativos.CentroProduccion.nombre == 'Caja'
+    ).limit(1)
+
+def consulta_pedidos_demorados(negocio_id: int, umbral, limite: int = 5):
+    """
+    Pedidos en producción creados antes de 'umbral', los más antiguos primero.
+    Usa el índice parcial ix_pedidos_en_produccion (negocio_id, fecha_creacion).
+    """
+    return select(modelos_pedidos.Pedido).where(
+        modelos_pedidos.Pedido.negocio_id == negocio_id,
+        modelos_pedidos.Pedido.estado.in_([modelos_pedidos.EstadoPedido.PENDIENTE, modelos_pedidos.EstadoPedido.EN_PREPARACION]),
+        modelos_pedidos.Pedido.fecha_creacion < umbral
+    ).order_by(modelos_pedidos.Pedido.fecha_creacion.asc()).limit(limite)
+
+def _resolver_catalogo_pedido(
+    db: Session,
+    negocio_id: int,
+    items: List[esquemas_pedido.ItemPedidoCreate]
+) -> Tuple[Dict[int, modelos_core.Producto], Dict[int, modelos_core.VarianteProducto], Dict[int, modelos_core.OpcionModificador]]:
+    """
+    Carga en bloque (una consulta IN por tabla) los productos, variantes y opciones
+    de modificador referenciados por los items del pedido, para tarificar en memoria.
+    """
+    consultas = _consultas_catalogo_pedido(negocio_id, items)
+    mapas = {}
+    for nombre in ("productos", "variantes", "opciones"):
+        filas = db.execute(consultas[nombre]).scalars().all() if nombre in consultas else []
+        mapas[nombre] = {fila.id: fila for fila in filas}
+    return mapas["productos"], mapas["variantes"], mapas["opciones"]
+
+async def _resolver_catalogo_pedido_async(
+    db: AsyncSession,
+    negocio_id: int,
+    items: List[esquemas_pedido.ItemPedidoCreate]
+) -> Tuple[Dict[int, modelos_core.Producto], Dict[int, modelos_core.VarianteProducto], Dict[int, modelos_core.OpcionModificador]]:
+    """Versión asíncrona de _resolver_catalogo_pedido."""
+    consultas = _consultas_catalogo_pedido(negocio_id, items)
+    mapas = {}
+    for nombre in ("productos", "variantes", "opciones"):
+        filas = (await db.execute(consultas[nombre])).scalars().all() if nombre in consultas else []
+        mapas[nombre] = {fila.id: fila for fila in filas}
+    return mapas["productos"], mapas["variantes"], mapas["opciones"]
+
+# --- LÓGICA DE NEGOCIO PURA (SIN I/O) ---
+
+def _tarificar_items(
+    items: List[esquemas_pedido.ItemPedidoCreate],
+    productos_por_id: Dict[int, modelos_core.Producto],
+    variantes_por_id: Dict[int, modelos_core.VarianteProducto],
+    opciones_por_id: Dict[int, modelos_core.OpcionModificador]
+) -> Tuple[Decimal, List[modelos_pedidos.DetallePedido]]:
+    """Calcula el total del pedido y prepara sus detalles a partir del catálogo ya cargado."""
     total_pedido = Decimal('0.00')
     detalles_a_crear = []
-    
-    for item_in in pedido_data.items:
-        producto = db.query(modelos_core.Producto).options(
-            joinedload(modelos_core.Producto.centro_produccion)
-        ).filter(modelos_core.Producto.id == item_in.producto_id).first()
+
+    for item_in in items:
+        producto = productos_por_id.get(item_in.producto_id)
 
         if not producto:
             raise ValueError(f"Producto con ID {item_in.producto_id} no encontrado.")
@@ -35,11 +147,8 @@ async def crear_nuevo_pedido(
         nombre_variante = None
 
         if item_in.variante_id:
-            variante = db.query(modelos_core.VarianteProducto).filter(
-                modelos_core.VarianteProducto.id == item_in.variante_id,
-                modelos_core.VarianteProducto.producto_id == producto.id
-            ).first()
-            if not variante:
+            variante = variantes_por_id.get(item_in.variante_id)
+            if not variante or variante.producto_id != producto.id:
                 raise ValueError(f"Variante con ID {item_in.variante_id} no encontrada para el producto {producto.nombre}.")
             precio_unitario = variante.precio
             nombre_variante = variante.nombre
@@ -47,18 +156,18 @@ async def crear_nuevo_pedido(
             if producto.tiene_variantes:
                 raise ValueError(f"El producto '{producto.nombre}' requiere que se especifique una variante.")
             precio_unitario = producto.precio_base
-        
+
         precio_modificadores = Decimal('0.00')
         modificadores_db = []
-        if item_in.modificadores_seleccionados:
-            opciones = db.query(modelos_core.OpcionModificador).filter(modelos_core.OpcionModificador.id.in_(item_in.modificadores_seleccionados)).all()
-            for opcion in opciones:
+        for opcion_id in dict.fromkeys(item_in.modificadores_seleccionados):
+            opcion = opciones_por_id.get(opcion_id)
+            if opcion:
                 precio_modificadores += opcion.precio_extra
                 modificadores_db.append(opcion)
 
         total_item = (precio_unitario + precio_modificadores) * item_in.cantidad
         total_pedido += total_item
-        
+
         detalle_obj = modelos_pedidos.DetallePedido(
             producto_id=item_in.producto_id,
             variante_id=item_in.variante_id,
@@ -75,82 +184,144 @@ async def crear_nuevo_pedido(
     if not detalles_a_crear:
         raise ValueError("El pedido no puede estar vacío.")
 
-    # 2. Buscar una cuenta abierta para esa mesa o crear una nueva
-    cuenta = db.query(modelos_financieros.Cuenta).filter(
-        modelos_financieros.Cuenta.mesa_id == pedido_data.mesa_id,
-        modelos_financieros.Cuenta.estado == modelos_financieros.EstadoCuenta.ABIERTA
-    ).first()
-
-    if not cuenta:
-        cuenta = modelos_financieros.Cuenta(
-            negocio_id=negocio_id,
-            mesa_id=pedido_data.mesa_id,
-            zona_id=pedido_data.zona_id,
-            estado=modelos_financieros.EstadoCuenta.ABIERTA,
-            total_calculado=Decimal('0.00')
+    return total_pedido, detalles_a_crear
+
+def _mensajes_kds(nuevo_pedido: modelos_pedidos.Pedido) -> Dict[str, dict]:
+    """Agrupa los items del pedido por centro de producción, listos para difundir."""
+    comandos_por_centro = defaultdict(list)
+    for detalle in nuevo_pedido.detalles:
+        if detalle.producto and detalle.producto.centro_produccion_id:
+            centro_id = str(detalle.producto.centro_produccion_id)
+            comandos_por_centro[centro_id].append({
+                "nombre": detalle.nombre_producto,
+                "cantidad": detalle.cantidad,
+                "nota": detalle.nota_cocina
+            })
+
+    return {
+        centro_id: {
+            "mesa_id": nuevo_pedido.mesa_id,
+            "pedido_id": nuevo_pedido.id,
+            "items": items,
+            "fecha_creacion": nuevo_pedido.fecha_creacion
+        }
+        for centro_id, items in comandos_por_centro.items()
+    }
+
+def _mensaje_caja(nuevo_pedido: modelos_pedidos.Pedido) -> dict:
+    return {
+        "tipo_alerta": "COBRO_PENDIENTE",
+        "mesa_id": nuevo_pedido.mesa_id,
+        "pedido_id": nuevo_pedido.id,
+        "total_cobrar": nuevo_pedido.total_pedido,
+        "items": [{"nombre": det.nombre_producto, "cantidad": det.cantidad} for det in nuevo_pedido.detalles]
+    }
+
+async def _notificar_pedido(nuevo_pedido: modelos_pedidos.Pedido, estado_inicial: modelos_pedidos.EstadoPedido, id_caja: Optional[int]):
+    # --- LÓGICA DE WEBSOCKETS (SOLO PARA POSTPAGO) ---
+    if estado_inicial != modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO:
+        if id_caja:
+            print(f"[WS-LOG] Centro 'Caja' encontrado con ID: {id_caja}. Creando y enviando mensaje...")
+            await manager.broadcast(a_json(_mensaje_caja(nuevo_pedido)), client_id=str(id_caja))
+        else:
+            print("[WS-LOG] ERROR CRÍTICO: No se encontró el centro de producción 'Caja'. El mensaje no será enviado.")
+    else:
+        for centro_id, mensaje_kds in _mensajes_kds(nuevo_pedido).items():
+            await manager.broadcast(a_json(mensaje_kds), client_id=centro_id)
+
+    # El plazo de demora empieza a correr en cuanto el pedido entra en producción
+    if estado_inicial in servicio_kds.ESTADOS_EN_PRODUCCION:
+        centros, item_ejemplo = servicio_demoras.centros_e_item(nuevo_pedido.detalles)
+        await planificador_demoras.pedido_en_espera(
+            nuevo_pedido.id, nuevo_pedido.negocio_id, nuevo_pedido.fecha_creacion, centros, nuevo_pedido.mesa_id, item_ejemplo
         )
-        db.add(cuenta)
-    
-    # 3. Actualizar el total de la cuenta
-    cuenta.total_calculado = (cuenta.total_calculado or Decimal('0.00')) + total_pedido
-    db.flush() 
-    
+
+# --- SERVICIOS ---
+
+async def crear_nuevo_pedido(
+    db: Session,
+    negocio_id: int,
+    pedido_data: esquemas_pedido.PedidoCreate,
+    estado_inicial: modelos_pedidos.EstadoPedido = modelos_pedidos.EstadoPedido.PENDIENTE
+) -> modelos_pedidos.Pedido:
+
+    # 1. Resolver el catálogo del pedido en bloque y calcular el total
+    productos_por_id, variantes_por_id, opciones_por_id = _resolver_catalogo_pedido(db, negocio_id, pedido_data.items)
+    total_pedido, detalles_a_crear = _tarificar_items(pedido_data.items, productos_por_id, variantes_por_id, opciones_por_id)
+
+    # 2 y 3. Abrir la cuenta de la mesa o sumar el pedido a la abierta (atómico, en SQL)
+    cuenta_id, cuenta_nueva = db.execute(_sentencia_cargar_cuenta(negocio_id, pedido_data, total_pedido)).one()
+
     # 4. Crear el PEDIDO y asociarlo a la cuenta
     nuevo_pedido = modelos_pedidos.Pedido(
         negocio_id=negocio_id,
         mesa_id=pedido_data.mesa_id,
-        cuenta_id=cuenta.id,
+        cuenta_id=cuenta_id,
         total_pedido=total_pedido,
         estado=estado_inicial,
-        detalles=detalles_a_crear
+        detalles=detalles_a_crear,
+        comandas_kds=servicio_kds.construir_comandas(negocio_id, pedido_data.mesa_id, estado_inicial, total_pedido, detalles_a_crear)
     )
 
     db.add(nuevo_pedido)
-    
+    db.flush() # el resumen de ventas se calcula en SQL desde los detalles ya insertados
+    for sentencia in _sentencias_metricas(nuevo_pedido, cuenta_nueva):
+        db.execute(sentencia)
+
     # 5. GUARDAR EN BASE DE DATOS Y OBTENER DATOS GENERADOS
     db.commit()
     db.refresh(nuevo_pedido)
-    db.refresh(cuenta)
 
     # 6. LÓGICA DE WEBSOCKETS (AHORA CON DATOS REALES Y COMPLETOS)
-    # --- LÓGICA DE WEBSOCKETS (SOLO PARA POSTPAGO) ---
+    id_caja = None
     if estado_inicial != modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO:
         print(f"[WS-LOG] Modo PREPAGO. Buscando centro 'Caja' para negocio_id {negocio_id}...")
-        id_caja = db.query(modelos_operativos.CentroProduccion.id).filter(
-            modelos_operativos.CentroProduccion.negocio_id == negocio_id,
-            modelos_operativos.CentroProduccion.nombre == 'Caja'
-        ).scalar()
-        
-        if id_caja:
-            print(f"[WS-LOG] Centro 'Caja' encontrado con ID: {id_caja}. Creando y enviando mensaje...")
-            mensaje_caja = {
-                "tipo_alerta": "COBRO_PENDIENTE",
-                "mesa_id": nuevo_pedido.mesa_id,
-                "pedido_id": nuevo_pedido.id,
-                "total_cobrar": float(nuevo_pedido.total_pedido),
-                "items": [{"nombre": det.nombre_producto, "cantidad": det.cantidad} for det in nuevo_pedido.detalles]
-            }
-            await manager.broadcast(json.dumps(mensaje_caja), client_id=str(id_caja))
-        else:
-            print("[WS-LOG] ERROR CRÍTICO: No se encontró el centro de producción 'Caja'. El mensaje no será enviado.")
-    else:
-        comandos_por_centro = defaultdict(list)
-        for detalle in nuevo_pedido.detalles:
-            if detalle.producto and detalle.producto.centro_produccion_id:
-                centro_id = str(detalle.producto.centro_produccion_id)
-                comandos_por_centro[centro_id].append({
-                    "nombre": detalle.nombre_producto,
-                    "cantidad": detalle.cantidad,
-                    "nota": detalle.nota_cocina
-                })
-        
-        for centro_id, items in comandos_por_centro.items():
-            mensaje_kds = {
-                "mesa_id": nuevo_pedido.mesa_id,
-                "pedido_id": nuevo_pedido.id,
-                "items": items,
-                "fecha_creacion": nuevo_pedido.fecha_creacion.isoformat()
-            }
-            await manager.broadcast(json.dumps(mensaje_kds), client_id=centro_id)
-
-    return nuevo_pedido
\ No newline at end of file
+        id_caja = db.execute(_consulta_id_caja(negocio_id)).scalar()
+    await _notificar_pedido(nuevo_pedido, estado_inicial, id_caja)
+
+    return nuevo_pedido
+
+async def crear_nuevo_pedido_async(
+    db: AsyncSession,
+    negocio_id: int,
+    pedido_data: esquemas_pedido.PedidoCreate,
+    estado_inicial: modelos_pedidos.EstadoPedido = modelos_pedidos.EstadoPedido.PENDIENTE
+) -> modelos_pedidos.Pedido:
+    """
+    Igual que crear_nuevo_pedido, pero sobre una AsyncSession: ninguna consulta
+    bloquea el event loop. La sesión debe tener expire_on_commit=False
+    (AsyncSessionLocal ya lo configura), porque aquí no hay carga perezosa.
+    """
+    # 1. Resolver el catálogo del pedido en bloque y calcular el total
+    productos_por_id, variantes_por_id, opciones_por_id = await _resolver_catalogo_pedido_async(db, negocio_id, pedido_data.items)
+    total_pedido, detalles_a_crear = _tarificar_items(pedido_data.items, productos_por_id, variantes_por_id, opciones_por_id)
+
+    # 2 y 3. Abrir la cuenta de la mesa o sumar el pedido a la abierta (atómico, en SQL)
+    cuenta_id, cuenta_nueva = (await db.execute(_sentencia_cargar_cuenta(negocio_id, pedido_data, total_pedido))).one()
+
+    # 4. Crear el PEDIDO y asociarlo a la cuenta
+    nuevo_pedido = modelos_pedidos.Pedido(
+        negocio_id=negocio_id,
+        mesa_id=pedido_data.mesa_id,
+        cuenta_id=cuenta_id,
+        total_pedido=total_pedido,
+        estado=estado_inicial,
+        detalles=detalles_a_crear,
+        comandas_kds=servicio_kds.construir_comandas(negocio_id, pedido_data.mesa_id, estado_inicial, total_pedido, detalles_a_crear)
+    )
+    db.add(nuevo_pedido)
+    await db.flush() # el resumen de ventas se calcula en SQL desde los detalles ya insertados
+    for sentencia in _sentencias_metricas(nuevo_pedido, cuenta_nueva):
+        await db.execute(sentencia)
+
+    # 5. GUARDAR Y LEER SOLO LO QUE GENERA LA BASE DE DATOS
+    await db.commit()
+    await db.refresh(nuevo_pedido, ["fecha_creacion"])
+
+    # 6. LÓGICA DE WEBSOCKETS
+    id_caja = None
+    if estado_inicial != modelos_pedidos.EstadoPedido.PENDIENTE_DE_PAGO:
+        id_caja = (await db.execute(_consulta_id_caja(negocio_id))).scalar()
+    await _notificar_pedido(nuevo_pedido, estado_inicial, id_caja)
+
+    return nuevo_pedido
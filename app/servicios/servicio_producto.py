@@ -4,6 +4,7 @@ from typing import List, Optional
 
 from app.db.modelos import modelos_core
 from app.esquemas import esquemas_producto
+from app.servicios import servicio_carta
 
 def get_productos_por_negocio(db: Session, negocio_id: int) -> List[modelos_core.Producto]:
     """
@@ -31,6 +32,7 @@ def crear_producto(db: Session, producto: esquemas_producto.ProductoCreate, nego
     db.add(db_producto)
     db.commit()
     db.refresh(db_producto)
+    servicio_carta.invalidar_menu(negocio_id)
     return db_producto
 
 # --- Añadiremos más funciones (get_categorias, update, delete) aquí a medida que las necesitemos ---
@@ -48,6 +50,7 @@ def crear_categoria(db: Session, categoria: esquemas_producto.CategoriaCreate, n
     db.add(db_categoria)
     db.commit()
     db.refresh(db_categoria)
+    servicio_carta.invalidar_menu(negocio_id)
     return db_categoria
 
 def get_producto_por_id(db: Session, *, producto_id: int, negocio_id: int) -> modelos_core.Producto:
@@ -101,4 +104,5 @@ def actualizar_producto(db: Session, db_producto: modelos_core.Producto, product
         
     db.commit()
     db.refresh(db_producto)
+    servicio_carta.invalidar_menu(db_producto.negocio_id)
     return db_producto
\ No newline at end of file
@@ -0,0 +1,159 @@
+# app/servicios/servicio_reportes.py
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import delete, desc, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.fechas import rango_dia_local
+from app.db.modelos import modelos_core, modelos_financieros, modelos_metricas, modelos_pedidos
+from app.servicios.servicio_metricas import ESTADOS_VENTA, consulta_ventas_producto, dia_local_sql
+
+ResumenVentaProducto = modelos_metricas.ResumenVentaProducto
+ResumenCobro = modelos_metricas.ResumenCobro
+SIN_DIMENSION = modelos_metricas.SIN_DIMENSION
+
+DIMENSIONES_VENTA = {
+    "dia": ResumenVentaProducto.dia,
+    "local": ResumenVentaProducto.local_id,
+    "centro": ResumenVentaProducto.centro_produccion_id,
+    "producto": ResumenVentaProducto.producto_id,
+}
+
+
+def _consulta_cobros(inicio, fin):
+    """
+    Transacciones exitosas de [inicio, fin) agregadas por día y medio de pago. La
+    propina de cada cuenta se reparte entre sus transacciones en proporción a su monto.
+    """
+    Transaccion, Cuenta = modelos_financieros.Transaccion, modelos_financieros.Cuenta
+    en_rango = (Transaccion.fecha_transaccion >= inicio) & (Transaccion.fecha_transaccion < fin)
+    # El reparto usa todas las transacciones de la cuenta, aunque alguna caiga fuera del rango
+    cuentas_en_rango = select(Transaccion.cuenta_id).where(en_rango).scalar_subquery()
+    total_cuenta = func.sum(Transaccion.monto).over(partition_by=Transaccion.cuenta_id)
+    por_transaccion = select(
+        Cuenta.negocio_id,
+        dia_local_sql(Transaccion.fecha_transaccion).label("dia"),
+        func.coalesce(modelos_core.Zona.local_id, SIN_DIMENSION).label("local_id"),
+        Transaccion.medio_de_pago,
+        Transaccion.monto,
+        func.round(func.coalesce(Cuenta.propina, 0) * Transaccion.monto / func.nullif(total_cuenta, 0), 2).label("propina"),
+        en_rango.label("en_rango"),
+    ).join(Cuenta, Cuenta.id == Transaccion.cuenta_id
+    ).outerjoin(modelos_core.Zona, modelos_core.Zona.id == Cuenta.zona_id
+    ).where(
+        Transaccion.estado == modelos_financieros.EstadoTransaccion.EXITOSA,
+        Transaccion.cuenta_id.in_(cuentas_en_rango)
+    ).subquery()
+
+    return por_transaccion, select(
+        por_transaccion.c.negocio_id, por_transaccion.c.dia, por_transaccion.c.local_id, por_transaccion.c.medio_de_pago,
+        func.count().label("transacciones"),
+        func.sum(por_transaccion.c.monto).label("monto"),
+        func.coalesce(func.sum(por_transaccion.c.propina), 0).label("propinas"),
+    ).where(por_transaccion.c.en_rango
+    ).group_by(por_transaccion.c.negocio_id, por_transaccion.c.dia, por_transaccion.c.local_id, por_transaccion.c.medio_de_pago)
+
+
+# --- RECÁLCULO NOCTURNO ---
+
+def recalcular_resumenes(db: Session, desde: date, hasta: date, negocio_id: Optional[int] = None) -> dict:
+    """
+    Rehace los resúmenes de ventas y cobros de los días locales [desde, hasta]
+    desde los hechos originales. Es el job nocturno: asienta los cobros del día
+    (que no se resumen al vuelo) y corrige cualquier desvío. No hace commit.
+    """
+    inicio, _ = rango_dia_local(desde)
+    _, fin = rango_dia_local(hasta)
+    Pedido = modelos_pedidos.Pedido
+
+    ventas = consulta_ventas_producto().where(
+        Pedido.fecha_creacion >= inicio, Pedido.fecha_creacion < fin, Pedido.estado.in_(ESTADOS_VENTA)
+    )
+    por_transaccion, cobros = _consulta_cobros(inicio, fin)
+
+    borrado_ventas = delete(ResumenVentaProducto).where(ResumenVentaProducto.dia.between(desde, hasta))
+    borrado_cobros = delete(ResumenCobro).where(ResumenCobro.dia.between(desde, hasta))
+    if negocio_id is not None:
+        ventas = ventas.where(Pedido.negocio_id == negocio_id)
+        cobros = cobros.where(por_transaccion.c.negocio_id == negocio_id)
+        borrado_ventas = borrado_ventas.where(ResumenVentaProducto.negocio_id == negocio_id)
+        borrado_cobros = borrado_cobros.where(ResumenCobro.negocio_id == negocio_id)
+
+    db.execute(borrado_ventas)
+    db.execute(borrado_cobros)
+    filas_ventas = db.execute(pg_insert(ResumenVentaProducto).from_select(
+        ["negocio_id", "dia", "local_id", "producto_id", "centro_produccion_id", "cantidad", "bruto"], ventas
+    )).rowcount
+    filas_cobros = db.execute(pg_insert(ResumenCobro).from_select(
+        ["negocio_id", "dia", "local_id", "medio_de_pago", "transacciones", "monto", "propinas"], cobros
+    )).rowcount
+    return {"ventas": filas_ventas, "cobros": filas_cobros}
+
+
+# --- LECTURA PARA INFORMES ---
+
+def _filtro_rango(modelo, negocio_id: int, desde: date, hasta: date, local_id: Optional[int]):
+    condiciones = [modelo.negocio_id == negocio_id, modelo.dia.between(desde, hasta)]
+    if local_id is not None:
+        condiciones.append(modelo.local_id == local_id)
+    return condiciones
+
+def ventas_por(db: Session, negocio_id: int, desde: date, hasta: date, dimension: str = "dia", local_id: Optional[int] = None) -> List[dict]:
+    """Cantidad y bruto del rango agrupados por una dimensión (dia, local, centro o producto)."""
+    columna = DIMENSIONES_VENTA[dimension]
+    filas = db.execute(
+        select(
+            columna.label("clave"),
+            func.sum(ResumenVentaProducto.cantidad).label("cantidad"),
+            func.sum(ResumenVentaProducto.bruto).label("bruto"),
+        ).where(*_filtro_rango(ResumenVentaProducto, negocio_id, desde, hasta, local_id)
+        ).group_by(columna).order_by(columna)
+    ).all()
+    return [{dimension: fila.clave, "cantidad": int(fila.cantidad), "bruto": float(fila.bruto)} for fila in filas]
+
+def productos_top(
+    db: Session,
+    negocio_id: int,
+    desde: date,
+    hasta: date,
+    limite: int = 10,
+    criterio: str = "cantidad",
+    local_id: Optional[int] = None
+) -> List[dict]:
+    """Los 'limite' productos con más cantidad (o bruto) vendida en el rango."""
+    cantidad = func.sum(ResumenVentaProducto.cantidad).label("cantidad")
+    bruto = func.sum(ResumenVentaProducto.bruto).label("bruto")
+    ranking = select(ResumenVentaProducto.producto_id, cantidad, bruto).where(
+        *_filtro_rango(ResumenVentaProducto, negocio_id, desde, hasta, local_id)
+    ).group_by(ResumenVentaProducto.producto_id).order_by(
+        desc(bruto if criterio == "bruto" else cantidad), ResumenVentaProducto.producto_id
+    ).limit(limite).subquery()
+
+    filas = db.execute(
+        select(ranking, modelos_core.Producto.nombre).join(
+            modelos_core.Producto, modelos_core.Producto.id == ranking.c.producto_id
+        ).order_by(desc(ranking.c.bruto if criterio == "bruto" else ranking.c.cantidad), ranking.c.producto_id)
+    ).all()
+    return [
+        {"producto_id": fila.producto_id, "nombre": fila.nombre, "cantidad": int(fila.cantidad), "bruto": float(fila.bruto)}
+        for fila in filas
+    ]
+
+def cobros_por_medio(db: Session, negocio_id: int, desde: date, hasta: date, local_id: Optional[int] = None) -> List[dict]:
+    """Transacciones, monto y propinas del rango por medio de pago (hasta el último recálculo nocturno)."""
+    filas = db.execute(
+        select(
+            ResumenCobro.medio_de_pago,
+            func.sum(ResumenCobro.transacciones).label("transacciones"),
+            func.sum(ResumenCobro.monto).label("monto"),
+            func.sum(ResumenCobro.propinas).label("propinas"),
+        ).where(*_filtro_rango(ResumenCobro, negocio_id, desde, hasta, local_id)
+        ).group_by(ResumenCobro.medio_de_pago).order_by(ResumenCobro.medio_de_pago)
+    ).all()
+    return [
+        {"medio_de_pago": fila.medio_de_pago.value, "transacciones": int(fila.transacciones),
+         "monto": float(fila.monto), "propinas": float(fila.propinas)}
+        for fila in filas
+    ]
@@ -1,30 +1,98 @@
 # app/servicios/servicio_usuario.py
 import secrets
-from typing import Optional
+import threading
+from typing import FrozenSet, Optional
 from datetime import datetime, timedelta, timezone
-from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.modelos import modelos_core
 from app.esquemas import esquemas_core
-from app.core.seguridad import verificar_password, hashear_password
+from app.core.config import settings
+from app.core.seguridad import verificar_password_async, hashear_password_async
 from app.core import seguridad
 
-def authenticate_user(db: Session, numero_documento: str, password_plano: str):
-    # Busca al usuario por su número de documento
-    usuario = db.query(modelos_core.Usuario).filter(modelos_core.Usuario.numero_documento == numero_documento).first()
+async def authenticate_user_async(db: AsyncSession, numero_documento: str, password_plano: str):
+    """
+    Login: bcrypt corre en el pool dedicado de seguridad y,
+    si el hash guardado está obsoleto, se reemplaza por uno nuevo en la misma petición.
+    """
+    usuario = (await db.execute(
+        select(modelos_core.Usuario).where(modelos_core.Usuario.numero_documento == numero_documento).limit(1)
+    )).scalars().first()
     if not usuario:
         return False
-    # Verifica si la contraseña coincide
-    if not seguridad.verificar_password(password_plano, usuario.password_hashed):
+    valido, nuevo_hash = await seguridad.verificar_y_actualizar_async(password_plano, usuario.password_hashed)
+    if not valido:
         return False
+    if nuevo_hash:
+        usuario.password_hashed = nuevo_hash
+        await db.commit()
     return usuario
 
 def get_usuario_por_numero_documento(db: Session, numero_documento: str) -> modelos_core.Usuario:
     """Busca un usuario por su número de documento."""
     return db.query(modelos_core.Usuario).filter(modelos_core.Usuario.numero_documento == numero_documento).first()
 
-def crear_usuario(db: Session, usuario: esquemas_core.UsuarioCreateBase) -> modelos_core.Usuario:
+# --- USUARIO AUTENTICADO (CACHÉ DE get_current_user) ---
+
+class UsuarioAutenticado:
+    """
+    Lo que las rutas necesitan saber del usuario del token: identidad, negocio, local,
+    rol y permisos. Se guarda en caché entre peticiones, así que no es una fila ORM.
+    """
+    __slots__ = ("id", "numero_documento", "nombre_completo", "negocio_id", "nombre_negocio",
+                 "local_asignado_id", "rol_nombre", "permisos")
+
+    def __init__(self, usuario: modelos_core.Usuario):
+        self.id = usuario.id
+        self.numero_documento = usuario.numero_documento
+        self.nombre_completo = usuario.nombre_completo
+        self.negocio_id = usuario.negocio_id
+        self.nombre_negocio = usuario.negocio.nombre_comercial if usuario.negocio else None
+        self.local_asignado_id = usuario.local_asignado_id
+        self.rol_nombre = usuario.rol.nombre if usuario.rol else None
+        self.permisos: FrozenSet[str] = frozenset(p.codigo for p in usuario.rol.permisos) if usuario.rol else frozenset()
+
+
+# Clave: el 'sub' del token (número de documento)
+_cache_autenticados: TTLCache = TTLCache(maxsize=settings.AUTH_CACHE_MAX, ttl=settings.AUTH_CACHE_TTL)
+_lock_autenticados = threading.Lock()
+
+def get_usuario_autenticado(db: Session, numero_documento: str) -> Optional[UsuarioAutenticado]:
+    """
+    Resuelve el sujeto del token a un UsuarioAutenticado. Solo consulta la BD (usuario,
+    rol, negocio y permisos de una vez) si no está en caché o venció AUTH_CACHE_TTL.
+    """
+    with _lock_autenticados:
+        autenticado = _cache_autenticados.get(numero_documento)
+    if autenticado is not None:
+        return autenticado
+
+    usuario = db.query(modelos_core.Usuario).options(
+        joinedload(modelos_core.Usuario.negocio),
+        joinedload(modelos_core.Usuario.rol).selectinload(modelos_core.Rol.permisos)
+    ).filter(modelos_core.Usuario.numero_documento == numero_documento).first()
+    if usuario is None:
+        return None
+
+    autenticado = UsuarioAutenticado(usuario)
+    with _lock_autenticados:
+        _cache_autenticados[numero_documento] = autenticado
+    return autenticado
+
+def invalidar_usuario_autenticado(numero_documento: str):
+    """
+    Olvida al usuario en caché. Llamar siempre que cambie su contraseña, su rol o su
+    estado; en otros workers el cambio se aplica al vencer AUTH_CACHE_TTL.
+    """
+    with _lock_autenticados:
+        _cache_autenticados.pop(numero_documento, None)
+
+async def crear_usuario(db: AsyncSession, usuario: esquemas_core.UsuarioCreateBase) -> modelos_core.Usuario:
     """Crea un nuevo usuario en la base de datos."""
-    password_hasheado = hashear_password(usuario.password)
+    password_hasheado = await hashear_password_async(usuario.password)
     db_usuario = modelos_core.Usuario(
         tipo_documento=usuario.tipo_documento,
         numero_documento=usuario.numero_documento,
@@ -37,11 +105,11 @@ def crear_usuario(db: Session, usuario: esquemas_core.UsuarioCreateBase) -> mode
         activo=usuario.activo
     )
     db.add(db_usuario)
-    db.commit()
-    db.refresh(db_usuario)
+    await db.commit()
+    await db.refresh(db_usuario)
     return db_usuario
 
-def cambiar_password_usuario(db: Session, *, usuario: modelos_core.Usuario, passwords: esquemas_core.UsuarioChangePassword) -> bool:
+async def cambiar_password_usuario(db: AsyncSession, *, usuario: modelos_core.Usuario, passwords: esquemas_core.UsuarioChangePassword) -> bool:
     """
     Cambia la contraseña de un usuario después de verificar la actual.
     Devuelve True si el cambio fue exitoso, False en caso contrario.
@@ -51,17 +119,18 @@ def cambiar_password_usuario(db: Session, *, usuario: modelos_core.Usuario, pass
         return False # O podríamos lanzar una excepción específica
 
     # 2. Verificar que la contraseña actual sea correcta
-    if not verificar_password(passwords.password_actual, usuario.password_hashed):
+    if not await verificar_password_async(passwords.password_actual, usuario.password_hashed):
         return False # O podríamos lanzar una excepción
 
     # 3. Hashear la nueva contraseña y actualizarla en el modelo
-    nuevo_password_hasheado = hashear_password(passwords.password_nuevo)
+    nuevo_password_hasheado = await hashear_password_async(passwords.password_nuevo)
     usuario.password_hashed = nuevo_password_hasheado
 
     # 4. Guardar los cambios en la base de datos
     db.add(usuario)
-    db.commit()
-    db.refresh(usuario)
+    await db.commit()
+    await db.refresh(usuario)
+    invalidar_usuario_autenticado(usuario.numero_documento)
 
     return True
 
@@ -96,23 +165,26 @@ def solicitar_reseteo_password(db: Session, tipo_documento: str, numero_document
 
     return codigo # Devolvemos el código para poder probar
 
-def resetear_password(db: Session, *, data: esquemas_core.PasswordReset) -> bool:
+async def resetear_password(db: AsyncSession, *, data: esquemas_core.PasswordReset) -> bool:
     """Resetea la contraseña de un usuario usando un código válido."""
-    usuario = db.query(modelos_core.Usuario).filter(
-        modelos_core.Usuario.tipo_documento == data.tipo_documento,
-        modelos_core.Usuario.numero_documento == data.numero_documento,
-        modelos_core.Usuario.reset_password_token == data.token
-    ).first()
+    usuario = (await db.execute(
+        select(modelos_core.Usuario).where(
+            modelos_core.Usuario.tipo_documento == data.tipo_documento,
+            modelos_core.Usuario.numero_documento == data.numero_documento,
+            modelos_core.Usuario.reset_password_token == data.token
+        ).limit(1)
+    )).scalars().first()
 
     if not usuario or usuario.reset_password_token_expires < datetime.now(timezone.utc):
         return False
 
-    nuevo_password_hasheado = hashear_password(data.nuevo_password)
+    nuevo_password_hasheado = await hashear_password_async(data.nuevo_password)
     usuario.password_hashed = nuevo_password_hasheado
     
     usuario.reset_password_token = None
     usuario.reset_password_token_expires = None
     db.add(usuario)
-    db.commit()
+    await db.commit()
+    invalidar_usuario_autenticado(usuario.numero_documento)
 
     return True
\ No newline at end of file
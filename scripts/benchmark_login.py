@@ -0,0 +1,71 @@
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Añadir la ruta del proyecto para que podamos importar la configuración
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core import seguridad
+from app.core.config import settings
+
+PASSWORD = "clave123"
+
+
+async def _medir_lag_loop(detener: asyncio.Event, muestras: list):
+    """Latido cada 10 ms: cuánto se retrasa indica si el event loop sigue libre."""
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(0.01)
+        muestras.append((time.perf_counter() - inicio - 0.01) * 1000)
+
+
+async def _ronda(nombre: str, verificar, concurrencia: int, total: int, password_hashed: str):
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias = []
+
+    async def un_login():
+        async with semaforo:
+            inicio = time.perf_counter()
+            assert await verificar(PASSWORD, password_hashed)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    detener, lag = asyncio.Event(), []
+    latido = asyncio.create_task(_medir_lag_loop(detener, lag))
+    inicio = time.perf_counter()
+    await asyncio.gather(*(un_login() for _ in range(total)))
+    duracion = time.perf_counter() - inicio
+    detener.set()
+    await latido
+
+    latencias.sort()
+    p95 = latencias[int(len(latencias) * 0.95) - 1]
+    print(f"   {nombre:<22} {total / duracion:8.1f} logins/s   p50 {statistics.median(latencias):7.1f} ms"
+          f"   p95 {p95:7.1f} ms   lag máx. loop {max(lag, default=0):6.1f} ms")
+
+
+async def main(niveles, total: int):
+    password_hashed = seguridad.pwd_context.hash(PASSWORD)
+    print(f"--- Benchmark de login (bcrypt, {settings.PASSWORD_HASH_WORKERS} hilos dedicados) ---")
+    print(f"Hash de prueba: {password_hashed[:7]}... | {total} verificaciones por ronda\n")
+
+    async def en_threadpool_general(plano, hashed):
+        # Equivale a la ruta síncrona anterior: bcrypt en el threadpool compartido
+        return await asyncio.to_thread(seguridad.pwd_context.verify, plano, hashed)
+
+    for concurrencia in niveles:
+        print(f"-> Concurrencia {concurrencia}")
+        await _ronda("threadpool compartido", en_threadpool_general, concurrencia, total, password_hashed)
+        await _ronda("pool bcrypt dedicado", seguridad.verificar_password_async, concurrencia, total, password_hashed)
+
+    print("\nMétricas del pool dedicado:")
+    for clave, valor in seguridad.estadisticas_hashing().items():
+        print(f"   {clave}: {valor:.1f}" if isinstance(valor, float) else f"   {clave}: {valor}")
+
+
+if __name__ == "__main__":
+    # Uso: python scripts/benchmark_login.py [total] [concurrencia1,concurrencia2,...]
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    niveles = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 8, 32]
+    asyncio.run(main(niveles, total))
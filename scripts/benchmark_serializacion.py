@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# Añadir la ruta del proyecto para que podamos importar la configuración
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.serializacion import RespuestaJSON, a_json
+
+SOCKETS_POR_CENTRO = 8
+
+
+def _comandas_kds(total: int = 40):
+    """Lo que devuelve pedidos-pendientes en una hora punta: comandas con sus ítems."""
+    ahora = datetime.now()
+    return [{
+        "id": 1000 + i,
+        "pedido_id": 5000 + i,
+        "estado": "EN_PREPARACION",
+        "fecha_creacion": ahora - timedelta(minutes=i),
+        "mesa": f"Mesa {i % 12 + 1}",
+        "cliente_nombre": "Consumidor final",
+        "total": Decimal("48.50") + i,
+        "items": [{
+            "producto_nombre": f"Producto {j}",
+            "variante_nombre": "Grande" if j % 2 else None,
+            "cantidad": j + 1,
+            "precio_unitario": Decimal("12.90"),
+            "nota_cocina": "sin cebolla" if j == 0 else None,
+            "modificadores": ["extra queso", "papas fritas"],
+        } for j in range(4)],
+    } for i in range(total)]
+
+
+def _carta(categorias: int = 12, productos: int = 15):
+    return [{
+        "id": c,
+        "nombre": f"Categoría {c}",
+        "productos": [{
+            "id": c * 100 + p,
+            "nombre": f"Producto {c}-{p}",
+            "descripcion": "Descripción de ejemplo con algo de texto para la carta.",
+            "precio": Decimal("19.90") + p,
+            "disponible": True,
+            "imagen_url": f"/static/img/productos/{c}-{p}.webp",
+        } for p in range(productos)],
+    } for c in range(categorias)]
+
+
+def _a_primitivos(valor):
+    # Lo que hacían antes los servicios a mano: float() e isoformat() antes de json.dumps
+    if isinstance(valor, dict):
+        return {k: _a_primitivos(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_a_primitivos(v) for v in valor]
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+def _medir(nombre: str, funcion, iteraciones: int, base: float = None) -> float:
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        funcion()
+    por_llamada = (time.perf_counter() - inicio) / iteraciones * 1_000_000
+    mejora = f"   x{base / por_llamada:5.1f}" if base else ""
+    print(f"   {nombre:<40} {por_llamada:9.1f} µs{mejora}")
+    return por_llamada
+
+
+def main(iteraciones: int):
+    print(f"--- Benchmark de serialización (json vs orjson, {iteraciones} iteraciones) ---")
+    for titulo, datos in (("Comandas KDS", _comandas_kds()), ("Carta pública", _carta())):
+        print(f"\n-> {titulo}: {len(a_json(datos)) / 1024:.1f} KB")
+        base = _medir("json.dumps (conversión a mano)",
+                      lambda: json.dumps(_a_primitivos(datos)), iteraciones)
+        _medir("orjson a_json", lambda: a_json(datos), iteraciones, base)
+        base = _medir("jsonable_encoder + JSONResponse",
+                      lambda: JSONResponse(jsonable_encoder(datos)), iteraciones)
+        _medir("RespuestaJSON", lambda: RespuestaJSON(datos), iteraciones, base)
+
+    # Difusión: antes cada socket recibía un str que el servidor ASGI volvía a codificar
+    evento = {"type": "NUEVO_PEDIDO", "comanda": _comandas_kds(1)[0]}
+    print(f"\n-> Difusión de un evento a {SOCKETS_POR_CENTRO} sockets")
+
+    def con_json():
+        texto = json.dumps(_a_primitivos(evento))
+        for _ in range(SOCKETS_POR_CENTRO):
+            texto.encode("utf-8")
+
+    base = _medir("json.dumps + encode por socket", con_json, iteraciones)
+    _medir("a_json una vez (bytes compartidos)", lambda: a_json(evento), iteraciones, base)
+
+
+if __name__ == "__main__":
+    # Uso: python scripts/benchmark_serializacion.py [iteraciones]
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
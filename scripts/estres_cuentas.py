@@ -0,0 +1,98 @@
+import asyncio
+import os
+import sys
+import time
+from decimal import Decimal
+
+# Añadir la ruta del proyecto para que podamos importar la configuración
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import delete, func, select
+
+from app.db.conexion import AsyncSessionLocal, async_engine
+from app.db.modelos import modelos_financieros, modelos_pedidos
+from app.esquemas import esquemas_pedido
+from app.servicios import servicio_pedido
+
+Cuenta = modelos_financieros.Cuenta
+Pedido = modelos_pedidos.Pedido
+
+
+async def _un_pedido(negocio_id: int, zona_id: int, mesa_id: int, producto_id: int):
+    pedido_in = esquemas_pedido.PedidoCreate(
+        cliente=esquemas_pedido.ClienteInfo(),
+        zona_id=zona_id,
+        mesa_id=mesa_id,
+        items=[esquemas_pedido.ItemPedidoCreate(producto_id=producto_id, cantidad=1)]
+    )
+    async with AsyncSessionLocal() as db:
+        pedido = await servicio_pedido.crear_nuevo_pedido_async(db, negocio_id, pedido_in)
+        return pedido.id, pedido.cuenta_id, pedido.total_pedido
+
+
+async def _cuentas_abiertas(db, negocio_id: int, mesa_id: int):
+    return (await db.execute(select(Cuenta).where(
+        Cuenta.negocio_id == negocio_id, Cuenta.mesa_id == mesa_id,
+        Cuenta.estado == modelos_financieros.EstadoCuenta.ABIERTA
+    ))).scalars().all()
+
+
+async def estres_cuentas(negocio_id: int, zona_id: int, mesa_id: int, producto_id: int, concurrentes: int) -> bool:
+    """
+    Lanza 'concurrentes' pedidos a la vez contra la misma mesa y comprueba que todos
+    caen en una única cuenta abierta cuyo total es la suma exacta de los pedidos.
+    Necesita una mesa sin cuenta abierta; al terminar borra lo que creó.
+    """
+    print(f"--- Estrés de cuenta abierta: {concurrentes} pedidos simultáneos a la mesa {mesa_id} ---")
+    async with AsyncSessionLocal() as db:
+        if await _cuentas_abiertas(db, negocio_id, mesa_id):
+            print("[ERROR] La mesa ya tiene una cuenta abierta. Usa una mesa libre.")
+            return False
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(
+        *(_un_pedido(negocio_id, zona_id, mesa_id, producto_id) for _ in range(concurrentes)),
+        return_exceptions=True
+    )
+    duracion = time.perf_counter() - inicio
+
+    errores = [r for r in resultados if isinstance(r, Exception)]
+    creados = [r for r in resultados if not isinstance(r, Exception)]
+    for error in errores[:5]:
+        print(f"   error: {error.__class__.__name__}: {error}")
+
+    async with AsyncSessionLocal() as db:
+        cuentas = await _cuentas_abiertas(db, negocio_id, mesa_id)
+        suma_pedidos = sum((total for _, _, total in creados), Decimal('0.00'))
+        total_cuenta = cuentas[0].total_calculado if len(cuentas) == 1 else None
+        ok = not errores and len(cuentas) == 1 and total_cuenta == suma_pedidos
+
+        print(f"Pedidos creados: {len(creados)}/{concurrentes} en {duracion:.2f}s ({len(creados) / duracion:.1f} pedidos/s)")
+        print(f"Cuentas abiertas para la mesa: {len(cuentas)}")
+        print(f"Total de la cuenta: {total_cuenta} | suma de los pedidos: {suma_pedidos}")
+        print("[OK] Una sola cuenta y total exacto." if ok else "[FALLO] Cuentas duplicadas o total incorrecto.")
+
+        # Limpieza: comandas, detalles y pedidos creados, y sus cuentas si quedaron vacías
+        ids_pedidos = [pedido_id for pedido_id, _, _ in creados]
+        ids_cuentas = {cuenta_id for _, cuenta_id, _ in creados} | {c.id for c in cuentas}
+        if ids_pedidos:
+            await db.execute(delete(modelos_pedidos.ComandaKDS).where(modelos_pedidos.ComandaKDS.pedido_id.in_(ids_pedidos)))
+            await db.execute(delete(modelos_pedidos.DetallePedido).where(modelos_pedidos.DetallePedido.pedido_id.in_(ids_pedidos)))
+            await db.execute(delete(Pedido).where(Pedido.id.in_(ids_pedidos)))
+        restantes = (await db.execute(select(func.count()).select_from(Pedido).where(Pedido.cuenta_id.in_(ids_cuentas)))).scalar()
+        if ids_cuentas and not restantes:
+            await db.execute(delete(Cuenta).where(Cuenta.id.in_(ids_cuentas)))
+        await db.commit()
+
+    await async_engine.dispose()
+    return ok
+
+
+if __name__ == "__main__":
+    # Uso: python scripts/estres_cuentas.py <negocio_id> <zona_id> <mesa_id> <producto_id> [concurrentes]
+    if len(sys.argv) < 5:
+        print("Uso: python scripts/estres_cuentas.py <negocio_id> <zona_id> <mesa_id> <producto_id> [concurrentes]")
+        sys.exit(2)
+    negocio_id, zona_id, mesa_id, producto_id = (int(a) for a in sys.argv[1:5])
+    concurrentes = int(sys.argv[5]) if len(sys.argv) > 5 else 50
+    sys.exit(0 if asyncio.run(estres_cuentas(negocio_id, zona_id, mesa_id, producto_id, concurrentes)) else 1)
@@ -0,0 +1,30 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.db.conexion import SessionLocal
+from app.servicios.servicio_metricas import recalcular_metricas, DIAS_PROMEDIO
+
+def recalcular(negocio_id=None, dias=DIAS_PROMEDIO + 1):
+    """
+    Rehace los contadores del dashboard de los últimos días desde pedidos y cuentas.
+    Pensado para un cron nocturno: corrige cualquier desvío de los incrementos.
+    """
+    db = SessionLocal()
+    alcance = f"negocio {negocio_id}" if negocio_id else "todos los negocios"
+    print(f"--- Recalculando métricas del dashboard ({alcance}, últimos {dias} días) ---")
+    try:
+        filas = recalcular_metricas(db, negocio_id, dias)
+        db.commit()
+        print(f"Filas diarias escritas: {filas}")
+    except Exception as e:
+        db.rollback()
+        print(f"\n[ERROR] No se pudieron recalcular las métricas: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Uso: python scripts/recalcular_metricas.py [negocio_id] [dias]
+    negocio = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != "todos" else None
+    recalcular(negocio, int(sys.argv[2]) if len(sys.argv) > 2 else DIAS_PROMEDIO + 1)
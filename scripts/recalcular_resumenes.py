@@ -0,0 +1,35 @@
+import sys
+import os
+from datetime import date, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.fechas import dia_local
+from app.db.conexion import SessionLocal
+from app.servicios.servicio_reportes import recalcular_resumenes
+
+def recalcular(desde: date, hasta: date, negocio_id=None):
+    """
+    Job nocturno de los reportes: rehace los resúmenes de ventas por producto y de
+    cobros de [desde, hasta] desde pedidos, detalles y transacciones.
+    """
+    db = SessionLocal()
+    alcance = f"negocio {negocio_id}" if negocio_id else "todos los negocios"
+    print(f"--- Recalculando resúmenes de {desde} a {hasta} ({alcance}) ---")
+    try:
+        filas = recalcular_resumenes(db, desde, hasta, negocio_id)
+        db.commit()
+        print(f"Filas de ventas: {filas['ventas']} | filas de cobros: {filas['cobros']}")
+    except Exception as e:
+        db.rollback()
+        print(f"\n[ERROR] No se pudieron recalcular los resúmenes: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Uso: python scripts/recalcular_resumenes.py [desde AAAA-MM-DD] [hasta AAAA-MM-DD] [negocio_id]
+    # Sin fechas rehace ayer y hoy (la ejecución típica del cron nocturno).
+    hoy = dia_local()
+    desde = date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else hoy - timedelta(days=1)
+    hasta = date.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else hoy
+    recalcular(desde, hasta, int(sys.argv[3]) if len(sys.argv) > 3 else None)
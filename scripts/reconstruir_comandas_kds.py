@@ -0,0 +1,28 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.db.conexion import SessionLocal
+from app.servicios.servicio_kds import reconstruir_comandas
+
+def reconstruir(negocio_id=None):
+    """
+    Regenera la proyección comandas_kds desde pedidos y detalles. Útil si la tabla
+    quedó desalineada (por ejemplo, tras editar pedidos a mano en la base de datos).
+    """
+    db = SessionLocal()
+    alcance = f"negocio {negocio_id}" if negocio_id else "todos los negocios"
+    print(f"--- Reconstruyendo comandas del KDS ({alcance}) ---")
+    try:
+        creadas = reconstruir_comandas(db, negocio_id)
+        db.commit()
+        print(f"Comandas creadas: {creadas}")
+    except Exception as e:
+        db.rollback()
+        print(f"\n[ERROR] No se pudo reconstruir la proyección: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    reconstruir(int(sys.argv[1]) if len(sys.argv) > 1 else None)
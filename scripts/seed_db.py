@@ -51,7 +51,7 @@ def seed_database():
             tema_resto_id = db.query(modelos_configuracion.Tema.id).filter_by(nombre="Clásico Restaurante").scalar()
             negocio_resto = modelos_core.Negocio(
                 ruc='11111111111', razon_social='Sabor Criollo SAC',
-                nombre_comercial='Sabor Criollo', marca_origen='metraes',
+                nombre_comercial='Sabor Criollo', slug='sabor-criollo', marca_origen='metraes',
                 modo_cobro='POSTPAGO', tema_id=tema_resto_id
             )
             db.add(negocio_resto)
@@ -62,7 +62,7 @@ def seed_database():
             tema_disco_id = db.query(modelos_configuracion.Tema.id).filter_by(nombre="Neón Discoteca").scalar()
             negocio_disco = modelos_core.Negocio(
                 ruc='20111111111', razon_social='Discoteca Nieves EIRL',
-                nombre_comercial='Nieves', marca_origen='sirveme1',
+                nombre_comercial='Nieves', slug='nieves', marca_origen='sirveme1',
                 modo_cobro='PREPAGO', tema_id=tema_disco_id
             )
             db.add(negocio_disco)
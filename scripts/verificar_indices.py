@@ -0,0 +1,63 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, select, text
+
+# Añadir la ruta del proyecto para que podamos importar la configuración
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.core.fechas import rango_dia_local
+from app.db.modelos import modelos_pedidos
+from app.servicios import servicio_kds, servicio_pedido
+
+def _consultas_a_verificar():
+    """(descripción, consulta de la app, índice que debería usar). Los ids no necesitan existir."""
+    inicio_hoy, fin_hoy = rango_dia_local()
+    hace_10_min = datetime.now(timezone.utc) - timedelta(minutes=10)
+    return [
+        ("KDS pendientes de un centro",
+         servicio_kds.consulta_comandas_produccion(1, 1, servicio_kds.ESTADOS_EN_PRODUCCION),
+         "ix_comandas_kds_centro_estado"),
+        ("KDS completados de hoy (rango local)",
+         servicio_kds.consulta_comandas_produccion(1, 1, [modelos_pedidos.EstadoPedido.LISTO_PARA_RECOGER],
+                                                   desde=inicio_hoy, hasta=fin_hoy, recientes_primero=True),
+         "ix_comandas_kds_centro_estado"),
+        ("Caja: pedidos por cobrar",
+         servicio_kds.consulta_comandas_cobro(1),
+         "ix_comandas_kds_negocio_vista"),
+        ("Pedidos en espera",
+         servicio_pedido.consulta_pedidos_demorados(1, hace_10_min),
+         "ix_pedidos_en_produccion"),
+        ("Detalles de varios pedidos",
+         select(modelos_pedidos.DetallePedido).where(modelos_pedidos.DetallePedido.pedido_id.in_([1, 2, 3])),
+         "ix_detalles_pedido_pedido_id"),
+    ]
+
+def verificar_indices() -> bool:
+    """
+    Ejecuta EXPLAIN sobre las consultas calientes de pedidos y comprueba que el plan
+    use el índice esperado. Desactiva el seq scan dentro de la transacción: con tablas
+    pequeñas el planner lo preferiría siempre, y lo que se verifica es que el índice
+    sea utilizable (que el predicado sea sargable), no el coste.
+    """
+    print("--- Verificando planes de consulta (EXPLAIN) ---\n")
+    engine = create_engine(settings.DATABASE_URL)
+    todo_ok = True
+    with engine.connect() as conexion:
+        conexion.execute(text("SET LOCAL enable_seqscan = off"))
+        for descripcion, consulta, indice in _consultas_a_verificar():
+            sql = str(consulta.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan = "\n".join(fila[0] for fila in conexion.execute(text("EXPLAIN " + sql)))
+            ok = indice in plan
+            todo_ok = todo_ok and ok
+            print(f"[{'OK' if ok else 'FALLO'}] {descripcion} -> {indice}")
+            if not ok:
+                print("       " + plan.replace("\n", "\n       "))
+        conexion.rollback()
+
+    print("\n--- Verificación finalizada:", "todos los planes usan sus índices ---" if todo_ok else "hay consultas sin índice ---")
+    return todo_ok
+
+if __name__ == "__main__":
+    sys.exit(0 if verificar_indices() else 1)
@@ -0,0 +1,103 @@
+import os
+import sys
+
+# Añadir la ruta del proyecto para que podamos importar la configuración
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.servicios import servicio_orden_voz
+from app.servicios.servicio_carta import MenuSnapshot
+
+# (id, nombre, alias, activo)
+PRODUCTOS = [
+    (1, "Pisco Sour", "pisco", True),
+    (2, "Papa Rellena", None, True),
+    (3, "Lomo Saltado", "lomito", True),
+    (4, "Chicha Morada", "chicha", True),
+    (5, "Tequeños", None, True),
+    (6, "Inca Kola", "gaseosa", True),
+    (7, "Coca Cola", "gaseosa", True),
+    (8, "Ceviche Clásico", None, True),
+    (9, "Ceviche Mixto", None, True),
+    (10, "Pizza Vegetariana", None, False),
+]
+
+ADD, REMOVE = "ADD_ITEMS", "REMOVE_ITEMS"
+
+# (frase, resultado esperado). None: el intérprete local no decide y la frase va al LLM.
+# Las entidades se dan como {product_id: quantity}.
+CASOS = [
+    # Cantidades en palabras, en cifra y en plural
+    ("dos pisco sour y una papa rellena", (ADD, {1: 2, 2: 1})),
+    ("Dos PISCO sours, por favor", (ADD, {1: 2})),
+    ("3 chichas moradas", (ADD, {4: 3})),
+    ("dos papas rellenas", (ADD, {2: 2})),
+    ("un pisco", (ADD, {1: 1})),
+    ("otro lomito", (ADD, {3: 1})),
+    ("quiero un lomo saltado y dos chichas", (ADD, {3: 1, 4: 2})),
+    ("un pisco sour y otro pisco sour", (ADD, {1: 2})),
+    ("media docena de tequeños", (ADD, {5: 6})),
+    ("una docena de tequeños", (ADD, {5: 12})),
+    # Errores de transcripción cerca del umbral de confianza (similitud entre paréntesis)
+    ("dos pisco sur", (ADD, {1: 2})),           # 0.76
+    ("un lomo saltao", (ADD, {3: 1})),          # 0.80
+    ("un pisko sour", None),                    # 0.73
+    ("una coca", None),                         # 0.71
+    ("una inca cola", None),                    # 0.70, y Coca Cola a 0.63
+    # Quitar: sin número se quita el producto entero
+    ("quita el lomo saltado", (REMOVE, {3: 999})),
+    ("quitame dos pisco sour", (REMOVE, {1: 2})),
+    ("borra todo", ("RESET_ORDER", {})),
+    ("mejor empezar de nuevo", ("RESET_ORDER", {})),
+    # Dudosas: las decide el LLM
+    ("ya no quiero la chicha", None),
+    ("cambia el pisco por una chicha", None),
+    ("solo una papa rellena", None),
+    ("dame un pisco y quita la chicha", None),
+    ("una gaseosa", None),                     # alias de dos productos
+    ("un ceviche", None),                      # dos productos con el mismo comienzo
+    ("dos pisco sour y tres", None),           # cantidad final sin producto
+    ("quiero una hamburguesa", None),          # no está en la carta
+    ("una pizza vegetariana", None),           # producto inactivo
+    ("hola gracias", None),                    # solo relleno
+]
+
+
+def _menu() -> MenuSnapshot:
+    productos = {
+        pid: {"id": pid, "nombre": nombre, "alias": alias, "activo": activo}
+        for pid, nombre, alias, activo in PRODUCTOS
+    }
+    return MenuSnapshot(1, ({"id": 1, "nombre": "Carta", "productos": list(productos.values())},), productos)
+
+
+def _comparable(resultado):
+    if resultado is None:
+        return None
+    return resultado["intent"], {e["product_id"]: e["quantity"] for e in resultado["entities"]}
+
+
+def verificar_interprete() -> bool:
+    """
+    Pasa cada frase por el intérprete local y compara intención y entidades con lo
+    esperado. Un cambio en UMBRAL_CONFIANZA, MARGEN_AMBIGUEDAD o en las listas de
+    palabras que mueva una frase entre el camino local y el LLM aparece aquí.
+    """
+    print("--- Verificando intérprete local de órdenes de voz ---")
+    print(f"UMBRAL_CONFIANZA={servicio_orden_voz.UMBRAL_CONFIANZA} | MARGEN_AMBIGUEDAD={servicio_orden_voz.MARGEN_AMBIGUEDAD}\n")
+    menu = _menu()
+    fallos = 0
+    for frase, esperado in CASOS:
+        obtenido = _comparable(servicio_orden_voz.interpretar_localmente(menu, frase))
+        ok = obtenido == esperado
+        fallos += not ok
+        print(f"[{'OK' if ok else 'FALLO'}] {frase!r} -> {obtenido if obtenido is not None else 'LLM'}")
+        if not ok:
+            print(f"       esperado: {esperado if esperado is not None else 'LLM'}")
+
+    print(f"\n--- Verificación finalizada: {len(CASOS) - fallos}/{len(CASOS)} frases correctas ---")
+    return fallos == 0
+
+
+if __name__ == "__main__":
+    # Uso: python scripts/verificar_interprete_voz.py
+    sys.exit(0 if verificar_interprete() else 1)
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sys
+
+# Añadir la ruta del proyecto para que podamos importar la configuración
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.servicios import servicio_llm
+from app.servicios.servicio_carta import MenuSnapshot
+from app.servicios.servicio_llm import ClienteLLM, CircuitoLLM, ProveedorFalso, RESPUESTA_DESCONOCIDA
+
+TIMEOUT = 0.05
+ENFRIAMIENTO = 0.2
+RESPUESTA = {"intent": "ADD_ITEMS", "entities": [{"product_id": 1, "quantity": 2}]}
+
+
+def _menu() -> MenuSnapshot:
+    producto = {"id": 1, "nombre": "Pisco Sour", "alias": "pisco", "activo": True}
+    return MenuSnapshot(1, ({"id": 1, "nombre": "Bebidas", "productos": [producto]},), {1: producto})
+
+
+def _cliente(proveedor: ProveedorFalso) -> ClienteLLM:
+    cliente = ClienteLLM(proveedor, timeout=TIMEOUT, concurrencia=4, circuito=CircuitoLLM(2, ENFRIAMIENTO))
+    servicio_llm.usar_cliente(cliente)
+    return cliente
+
+
+def _informar(descripcion: str, ok: bool, detalle: str) -> bool:
+    print(f"[{'OK' if ok else 'FALLO'}] {descripcion}: {detalle}")
+    return ok
+
+
+async def _timeout_y_circuito(menu: MenuSnapshot) -> bool:
+    lento = ProveedorFalso(RESPUESTA, latencia=TIMEOUT * 4)
+    cliente = _cliente(lento)
+    primeras = [await servicio_llm.procesar_orden_con_llm(menu, f"frase lenta {i}") for i in range(2)]
+    ok = _informar("Timeout", all(r == RESPUESTA_DESCONOCIDA for r in primeras) and cliente.metricas["timeouts"] == 2,
+                   f"{cliente.metricas['timeouts']} timeouts, respuestas {primeras[0]['intent']}")
+
+    # Con el circuito abierto no se llama al proveedor
+    llamadas = lento.llamadas
+    rechazada = await servicio_llm.procesar_orden_con_llm(menu, "frase con circuito abierto")
+    ok &= _informar("Circuito abierto", rechazada == RESPUESTA_DESCONOCIDA and lento.llamadas == llamadas
+                    and cliente.estadisticas()["circuito"] == "ABIERTO",
+                    f"estado {cliente.estadisticas()['circuito']}, {cliente.metricas['rechazadas_circuito']} rechazadas")
+
+    # Tras el enfriamiento, una llamada de prueba que sale bien lo cierra
+    await asyncio.sleep(ENFRIAMIENTO)
+    cliente.proveedor = ProveedorFalso(RESPUESTA)
+    prueba = await servicio_llm.procesar_orden_con_llm(menu, "frase de prueba")
+    return ok & _informar("Circuito semiabierto -> cerrado", prueba == RESPUESTA and cliente.estadisticas()["circuito"] == "CERRADO",
+                          f"estado {cliente.estadisticas()['circuito']}")
+
+
+async def _deduplicacion(menu: MenuSnapshot) -> bool:
+    proveedor = ProveedorFalso(RESPUESTA, latencia=TIMEOUT / 2)
+    _cliente(proveedor)
+    # La misma frase escrita de formas distintas se normaliza a una sola clave
+    variantes = ["Dos pisco sour", "dos  PISCO sour!", "dós pisco sour"] * 4
+    resultados = await asyncio.gather(*(servicio_llm.procesar_orden_con_llm(menu, v) for v in variantes))
+    ok = _informar("Frases simultáneas comparten una llamada", proveedor.llamadas == 1 and all(r == RESPUESTA for r in resultados),
+                   f"{len(variantes)} peticiones, {proveedor.llamadas} llamada(s)")
+    await servicio_llm.procesar_orden_con_llm(menu, "dos pisco sour")
+    return ok & _informar("Caché de resultados", proveedor.llamadas == 1, f"{proveedor.llamadas} llamada(s) tras repetir la frase")
+
+
+async def _cancelacion_del_dueno(menu: MenuSnapshot) -> bool:
+    proveedor = ProveedorFalso(RESPUESTA, latencia=TIMEOUT / 2)
+    _cliente(proveedor)
+    dueno = asyncio.create_task(servicio_llm.procesar_orden_con_llm(menu, "tres pisco sour"))
+    await asyncio.sleep(0)
+    esperando = [asyncio.create_task(servicio_llm.procesar_orden_con_llm(menu, "tres pisco sour")) for _ in range(3)]
+    await asyncio.sleep(0)
+    dueno.cancel() # El cliente que hizo la llamada se desconecta
+    resultados = await asyncio.gather(*esperando, return_exceptions=True)
+    return _informar("Cancelar al dueño no cancela a quienes esperan", all(r == RESPUESTA for r in resultados),
+                     f"{[type(r).__name__ for r in resultados]}, {proveedor.llamadas} llamada(s)")
+
+
+async def verificar_llm() -> bool:
+    """
+    Ejercita el cliente del LLM con un ProveedorFalso, sin red ni API key: timeout,
+    apertura y cierre del circuito, deduplicación de frases en curso y caché.
+    """
+    print("--- Verificando cliente LLM (ProveedorFalso) ---\n")
+    menu = _menu()
+    ok = await _timeout_y_circuito(menu)
+    ok &= await _deduplicacion(menu)
+    ok &= await _cancelacion_del_dueno(menu)
+    print("\n--- Verificación finalizada:", "todo correcto ---" if ok else "hay fallos ---")
+    return ok
+
+
+if __name__ == "__main__":
+    # Uso: python scripts/verificar_llm.py
+    sys.exit(0 if asyncio.run(verificar_llm()) else 1)
@@ -4,6 +4,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const razonSocialInput = document.getElementById('razon_social');
     const nombreComercialInput = document.getElementById('nombre_comercial');
     const modoCobroSelect = document.getElementById('modo_cobro');
+    const minutosDemoraInput = document.getElementById('minutos_alerta_demora');
     const themeGallery = document.getElementById('theme-gallery');
     const temaIdInput = document.getElementById('tema_id');
 
@@ -18,6 +19,7 @@ document.addEventListener('DOMContentLoaded', () => {
             razonSocialInput.value = negocio.razon_social;
             nombreComercialInput.value = negocio.nombre_comercial;
             modoCobroSelect.value = negocio.modo_cobro;
+            minutosDemoraInput.value = negocio.minutos_alerta_demora;
             temaIdInput.value = negocio.tema_id;
 
             // Cargar la galería de temas
@@ -60,6 +62,7 @@ document.addEventListener('DOMContentLoaded', () => {
         const data = {
             nombre_comercial: nombreComercialInput.value,
             modo_cobro: modoCobroSelect.value,
+            minutos_alerta_demora: parseInt(minutosDemoraInput.value, 10),
             tema_id: parseInt(temaIdInput.value, 10),
             logo_url: null // Aún no manejamos la subida de archivos
         };
@@ -2,6 +2,9 @@ let KDS_CENTRO_ID;
 let timers = {};
 let audioContextUnlocked = false;
 let alertTimer;
+// Pedidos demorados del panel lateral, por pedido_id. Llegan por el socket (DEMORA /
+// DEMORA_RESUELTA); la API solo se consulta al cargar o tras un snapshot.
+let pedidosDemorados = new Map();
 
 // --- FUNCIONES DE API ---
 async function fetchAPI(url) {
@@ -25,21 +28,88 @@ const getPedidosPendientes = (centroId) => fetchAPI(`/api/v1/panel/kds/${centroI
 const getPedidosCompletados = (centroId) => fetchAPI(`/api/v1/panel/kds/${centroId}/pedidos-completados`);
 const actualizarEstadoPedido = (pedidoId, nuevoEstado) => fetch(`/api/v1/panel/pedidos/${pedidoId}/actualizar-estado`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, credentials: 'include', body: JSON.stringify({ nuevo_estado: nuevoEstado }) });
 const marcarComoPagadoAPI = (pedidoId) => fetch(`/api/v1/panel/pedidos/${pedidoId}/marcar-pagado`, { method: 'POST', credentials: 'include' });
-const getPedidosEnEspera = () => fetchAPI(`/api/v1/panel/negocio/pedidos-en-espera`);
+const getPedidosEnEspera = (centroId) => fetchAPI(`/api/v1/panel/negocio/pedidos-en-espera?centro_id=${centroId}`);
+const actualizarEstadosPedidosAPI = (cambios) => fetch('/api/v1/panel/pedidos/actualizar-estados', { method: 'POST', headers: { 'Content-Type': 'application/json' }, credentials: 'include', body: JSON.stringify({ cambios }) });
 
 // --- LÓGICA DE WEBSOCKET ---
-function conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback) {
+// Último evento aplicado; al reconectar se envía para recibir solo lo perdido
+let wsUltimoSeq = null;
+let wsEpoca = null;
+// Socket abierto y comandos enviados por él que esperan su RESPUESTA, por id
+let wsSocket = null;
+let wsSiguienteId = 1;
+const wsComandosPendientes = new Map();
+// El servidor envía las tramas como JSON UTF-8 en mensajes binarios
+const wsDecodificador = new TextDecoder();
+
+function conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback, onSnapshotCallback) {
     const proto = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
     const host = window.location.host;
-    const url = `${proto}//${host}/ws/kds/${centroId}`;
+    let url = `${proto}//${host}/ws/kds/${centroId}`;
+    if (wsUltimoSeq !== null && wsEpoca) url += `?resume_from=${wsUltimoSeq}&epoca=${wsEpoca}`;
     const socket = new WebSocket(url);
-
-    socket.onopen = () => onStatusChangeCallback(true);
-    socket.onmessage = (event) => { try { onMessageCallback(JSON.parse(event.data)); } catch (e) { console.error("Error al parsear WS:", e); } };
-    socket.onclose = () => { onStatusChangeCallback(false); setTimeout(() => conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback), 3000); };
+    socket.binaryType = 'arraybuffer';
+
+    socket.onopen = () => { wsSocket = socket; onStatusChangeCallback(true); };
+    socket.onmessage = (event) => {
+        let trama;
+        const texto = typeof event.data === 'string' ? event.data : wsDecodificador.decode(event.data);
+        try { trama = JSON.parse(texto); } catch (e) { console.error("Error al parsear WS:", e); return; }
+        if (trama.control === 'PING') {
+            socket.send(JSON.stringify({ control: 'PONG', t: trama.t })); // Sin PONG el servidor cierra el socket
+            return;
+        }
+        if (trama.control === 'RESPUESTA') {
+            const pendiente = wsComandosPendientes.get(trama.id);
+            if (pendiente) { wsComandosPendientes.delete(trama.id); pendiente(trama); }
+            return;
+        }
+        if (trama.control) {
+            const requiereSnapshot = trama.control === 'SNAPSHOT';
+            wsUltimoSeq = trama.seq;
+            wsEpoca = trama.epoca;
+            if (requiereSnapshot && onSnapshotCallback) onSnapshotCallback();
+            return;
+        }
+        if (trama.epoca === wsEpoca && wsUltimoSeq !== null && trama.seq <= wsUltimoSeq) return; // Duplicado
+        wsUltimoSeq = trama.seq;
+        wsEpoca = trama.epoca;
+        // Un micro-lote trae varios eventos en una trama; se aplican todos antes del siguiente repintado
+        (trama.eventos || [trama.evento]).forEach(onMessageCallback);
+    };
+    socket.onclose = (event) => {
+        if (wsSocket === socket) wsSocket = null;
+        onStatusChangeCallback(false);
+        if (event.code === 4401) { window.location.href = '/login'; return; } // Sesión vencida
+        if (event.code === 4403) return; // Centro de otro negocio: reintentar no sirve
+        setTimeout(() => conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback, onSnapshotCallback), 3000);
+    };
     socket.onerror = (error) => { console.error("Error WS:", error); socket.close(); };
 }
 
+// Envía un comando por el socket y resuelve con su RESPUESTA (o null si no llega a tiempo)
+function enviarComandoWS(comando, datos, esperaMs = 10000) {
+    const id = wsSiguienteId++;
+    return new Promise((resolve) => {
+        const temporizador = setTimeout(() => { wsComandosPendientes.delete(id); resolve(null); }, esperaMs);
+        wsComandosPendientes.set(id, (respuesta) => { clearTimeout(temporizador); resolve(respuesta); });
+        wsSocket.send(JSON.stringify({ comando, id, ...datos }));
+    });
+}
+
+// Varios cambios de estado en un solo envío: por el socket si está abierto, si no por la API
+async function actualizarEstadosPedidos(cambios) {
+    if (wsSocket && wsSocket.readyState === WebSocket.OPEN) {
+        const respuesta = await enviarComandoWS('CAMBIAR_ESTADOS', { cambios });
+        if (respuesta && !respuesta.error) return respuesta;
+        if (respuesta) throw new Error(respuesta.error);
+        // Sin respuesta: el lote pudo aplicarse; los que ya cambiaron volverán como rechazados
+    }
+    const response = await actualizarEstadosPedidosAPI(cambios);
+    if (!response.ok) throw new Error('El servidor rechazó el lote de cambios.');
+    return await response.json();
+}
+
 // --- LÓGICA DE LA INTERFAZ (UI) ---
 function renderizarComandas(listaComandas, vista) {
     const grid = document.getElementById(`vista-${vista}`);
@@ -154,7 +224,7 @@ function agregarAlertaDeCobro(alertaData) {
 
 function marcarComandaComoLista(pedidoId) {
     const comandaElement = document.getElementById(`pedido-${pedidoId}`);
-    if (!comandaElement) return;
+    if (!comandaElement || comandaElement.classList.contains('listo')) return; // El delta pudo llegar antes que la respuesta
     if (timers[pedidoId]) { clearInterval(timers[pedidoId]); delete timers[pedidoId]; }
     const boton = comandaElement.querySelector('.btn-listo');
     comandaElement.classList.add('listo');
@@ -165,26 +235,106 @@ function marcarComandaComoLista(pedidoId) {
     }, 3000);
 }
 
-function renderizarPedidosEnEspera(mesas) {
+function retirarComanda(elemento) {
+    const pedidoId = elemento.id.split('-')[1];
+    if (timers[pedidoId]) { clearInterval(timers[pedidoId]); delete timers[pedidoId]; }
+    elemento.classList.add('ocultando');
+    elemento.addEventListener('transitionend', () => elemento.remove());
+}
+
+// Delta CAMBIO_ESTADO: otra pantalla (o esta misma) cambió el estado de un pedido
+function aplicarCambioEstado(cambio) {
+    const elemento = document.getElementById(`pedido-${cambio.pedido_id}`);
+    if (!elemento || elemento.classList.contains('ocultando')) return; // Esta pantalla no lo muestra
+    const terminado = cambio.estado === 'COMPLETADO' || cambio.estado === 'CANCELADO';
+
+    if (elemento.classList.contains('alerta-cobro')) {
+        // La alerta de Caja sobra cuando el pedido se cobra, se cierra o se cancela
+        if (terminado || cambio.estado_anterior === 'PENDIENTE_DE_PAGO') retirarComanda(elemento);
+        return;
+    }
+    elemento.dataset.estado = cambio.estado;
+    elemento.classList.toggle('en-preparacion', cambio.estado === 'EN_PREPARACION');
+    if (terminado) {
+        retirarComanda(elemento);
+    } else if (cambio.estado === 'LISTO_PARA_RECOGER' && elemento.closest('#vista-pendientes') && !elemento.classList.contains('listo')) {
+        marcarComandaComoLista(cambio.pedido_id);
+    }
+}
+
+// Selección de comandas para marcarlas como listas de una vez
+function actualizarBotonLote() {
+    const boton = document.getElementById('btn-listos-lote');
+    if (!boton) return;
+    const seleccionadas = document.querySelectorAll('#vista-pendientes .comanda.seleccionada:not(.listo):not(.ocultando)').length;
+    boton.hidden = seleccionadas === 0;
+    boton.textContent = `Marcar ${seleccionadas} como Listos`;
+}
+
+async function handleMarcarSeleccionadosComoListos(boton) {
+    const seleccionadas = [...document.querySelectorAll('#vista-pendientes .comanda.seleccionada:not(.listo):not(.ocultando)')];
+    if (seleccionadas.length === 0) return;
+    boton.disabled = true;
+    try {
+        const resultado = await actualizarEstadosPedidos(seleccionadas.map(elemento => ({
+            pedido_id: Number(elemento.id.split('-')[1]),
+            nuevo_estado: 'LISTO_PARA_RECOGER'
+        })));
+        resultado.aplicados.forEach(cambio => marcarComandaComoLista(cambio.pedido_id));
+        if (resultado.rechazados.length > 0) {
+            alert(resultado.rechazados.map(rechazo => rechazo.motivo).join('\n'));
+        }
+    } catch (error) {
+        console.error('Error al marcar comandas como listas:', error);
+        alert('No se pudieron marcar los pedidos como listos.');
+    } finally {
+        seleccionadas.forEach(elemento => elemento.classList.remove('seleccionada'));
+        boton.disabled = false;
+        actualizarBotonLote();
+    }
+}
+
+function renderizarPedidosEnEspera() {
     const container = document.getElementById('pedidos-espera-container');
     if (!container) return;
     container.innerHTML = '';
-    if (!mesas || mesas.length === 0) {
+    if (pedidosDemorados.size === 0) {
         container.innerHTML = '<p class="no-pedidos-espera">No hay pedidos con demora.</p>';
     } else {
-        mesas.forEach(mesa => {
-            const itemEjemploHTML = mesa.item_ejemplo ? `<small>${mesa.item_ejemplo} y más...</small>` : '';
+        const ahora = new Date();
+        const pedidos = [...pedidosDemorados.values()].sort((a, b) => new Date(a.fecha_creacion) - new Date(b.fecha_creacion));
+        pedidos.forEach(pedido => {
+            const minutosEspera = Math.floor((ahora - new Date(pedido.fecha_creacion)) / 60000);
+            const lugar = pedido.mesa_nombre ? `${pedido.zona_nombre} / Mesa ${pedido.mesa_nombre}` : `Pedido #${pedido.pedido_id}`;
+            const itemEjemploHTML = pedido.item_ejemplo ? `<small>${pedido.item_ejemplo} y más...</small>` : '';
             const cardHTML = `
                 <div class="mesa-espera-card">
-                    <div class="info">${mesa.zona_nombre} / Mesa ${mesa.mesa_nombre}</div>
+                    <div class="info">${lugar}</div>
                     <div class="item-ejemplo">${itemEjemploHTML}</div>
-                    <div class="tiempo">ESPERA HACE ${mesa.minutos_espera} MINUTOS</div>
+                    <div class="tiempo">ESPERA HACE ${minutosEspera} MINUTOS</div>
                 </div>`;
             container.insertAdjacentHTML('beforeend', cardHTML);
         });
     }
 }
 
+async function cargarPedidosEnEspera() {
+    try {
+        const pedidos = await getPedidosEnEspera(KDS_CENTRO_ID);
+        pedidosDemorados = new Map(pedidos.map(pedido => [pedido.pedido_id, pedido]));
+        renderizarPedidosEnEspera();
+    } catch (e) { console.error("Error cargando pedidos en espera:", e); }
+}
+
+function manejarAlertaDemora(mensaje) {
+    if (mensaje.tipo_alerta === 'DEMORA') {
+        pedidosDemorados.set(mensaje.pedido_id, mensaje);
+    } else {
+        pedidosDemorados.delete(mensaje.pedido_id);
+    }
+    renderizarPedidosEnEspera();
+}
+
 
 // --- GESTIÓN DE EVENTOS CENTRALIZADA (LA SOLUCIÓN AL BUG) ---
 document.addEventListener('DOMContentLoaded', () => {
@@ -231,7 +381,8 @@ async function handleCambiarVista(vista) {
 
 async function handleMarcarComoListo(pedidoId, boton) {
     try {
-        await actualizarEstadoPedido(pedidoId, 'LISTO_PARA_RECOGER');
+        const response = await actualizarEstadoPedido(pedidoId, 'LISTO_PARA_RECOGER');
+        if (!response.ok) throw new Error('El servidor rechazó el cambio de estado.');
         marcarComandaComoLista(pedidoId);
     } catch (error) {
         console.error('Error al marcar como listo:', error);
@@ -272,14 +423,9 @@ async function handleMarcarComoPagado(pedidoId, boton) {
 
 function iniciarTimersPeriodicos() {
     if (alertTimer) clearInterval(alertTimer);
-    const actualizarAlertas = async () => {
-        try {
-            const mesasEnEspera = await getPedidosEnEspera();
-            renderizarPedidosEnEspera(mesasEnEspera);
-        } catch(e) { console.error("Error actualizando pedidos en espera:", e); }
-    };
-    actualizarAlertas();
-    alertTimer = setInterval(actualizarAlertas, 30000); // Actualizar cada 30 segundos
+    cargarPedidosEnEspera();
+    // Solo repinta los minutos de espera; las demoras nuevas llegan por el socket
+    alertTimer = setInterval(renderizarPedidosEnEspera, 30000);
 }
 
 
@@ -308,12 +454,31 @@ function inicializarKDS(centroId) {
 
     handleCambiarVista('pendientes').catch(console.error);
 
+    // Tocar una comanda (fuera de su botón) la selecciona para el botón de lote
+    document.getElementById('vista-pendientes').addEventListener('click', (event) => {
+        if (event.target.closest('button')) return;
+        const comanda = event.target.closest('.comanda');
+        if (!comanda || comanda.classList.contains('alerta-cobro') || comanda.classList.contains('listo')) return;
+        comanda.classList.toggle('seleccionada');
+        actualizarBotonLote();
+    });
+    const botonLote = document.getElementById('btn-listos-lote');
+    if (botonLote) botonLote.addEventListener('click', () => handleMarcarSeleccionadosComoListos(botonLote));
+
     // --- LÓGICA DE DEPURACIÓN AÑADIDA ---
     conectarWebSocket(
         centroId,
         (mensajeRecibido) => {
             if (mensajeRecibido.tipo_alerta === 'COBRO_PENDIENTE') {
                 agregarAlertaDeCobro(mensajeRecibido);
+            } else if (mensajeRecibido.tipo_alerta === 'DEMORA' || mensajeRecibido.tipo_alerta === 'DEMORA_RESUELTA') {
+                manejarAlertaDemora(mensajeRecibido);
+            } else if (mensajeRecibido.tipo_alerta === 'CAMBIO_ESTADO') {
+                aplicarCambioEstado(mensajeRecibido);
+                actualizarBotonLote();
+            } else if (mensajeRecibido.tipo_alerta === 'CAMBIOS_ESTADO') {
+                mensajeRecibido.cambios.forEach(aplicarCambioEstado);
+                actualizarBotonLote();
             } else {
                 agregarComanda(mensajeRecibido, true, 'pendientes');
             }
@@ -321,6 +486,12 @@ function inicializarKDS(centroId) {
         (estaConectado) => {
             statusIndicator.textContent = estaConectado ? 'Conectado' : 'Desconectado';
             statusIndicator.className = `status-indicator ${estaConectado ? 'connected' : 'disconnected'}`;
+        },
+        () => {
+            // El servidor ya no tiene los eventos perdidos: recargamos la vista completa
+            const vistaActiva = document.querySelector('.tab-button.active')?.dataset.view || 'pendientes';
+            handleCambiarVista(vistaActiva).catch(console.error);
+            cargarPedidosEnEspera();
         }
     );
     
@@ -1,13 +1,22 @@
 // Contiene toda la lógica para la conexión en tiempo real con el servidor
 
 let socket;
+// Último evento aplicado; al reconectar se envía para recibir solo lo perdido
+let ultimoSeq = null;
+let epocaServidor = null;
+// El servidor envía las tramas como JSON UTF-8 en mensajes binarios
+const decodificador = new TextDecoder();
 
-function conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback) {
+function conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback, onSnapshotCallback) {
     const proto = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
     const host = window.location.host;
-    const url = `${proto}//${host}/ws/kds/${centroId}`;
+    let url = `${proto}//${host}/ws/kds/${centroId}`;
+    if (ultimoSeq !== null && epocaServidor) {
+        url += `?resume_from=${ultimoSeq}&epoca=${epocaServidor}`;
+    }
     
     socket = new WebSocket(url);
+    socket.binaryType = 'arraybuffer';
 
     socket.onopen = () => {
         console.log("Conectado al WebSocket del KDS.");
@@ -15,19 +24,41 @@ function conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback)
     };
 
     socket.onmessage = (event) => {
-        console.log("Mensaje WS recibido:", event.data);
+        const texto = typeof event.data === 'string' ? event.data : decodificador.decode(event.data);
+        console.log("Mensaje WS recibido:", texto);
+        let trama;
         try {
-            const comandaData = JSON.parse(event.data);
-            onMessageCallback(comandaData);
+            trama = JSON.parse(texto);
         } catch (e) {
             console.error("Error al parsear mensaje de WebSocket:", e);
+            return;
         }
+        if (trama.control === 'PING') {
+            socket.send(JSON.stringify({ control: 'PONG', t: trama.t })); // Sin PONG el servidor cierra el socket
+            return;
+        }
+        if (trama.control === 'RESPUESTA') return; // Este módulo no envía comandos
+        if (trama.control) {
+            // HOLA: punto de partida. SNAPSHOT: el hueco ya no está en el servidor, hay que recargar todo.
+            ultimoSeq = trama.seq;
+            epocaServidor = trama.epoca;
+            if (trama.control === 'SNAPSHOT' && onSnapshotCallback) onSnapshotCallback();
+            return;
+        }
+        if (trama.epoca === epocaServidor && ultimoSeq !== null && trama.seq <= ultimoSeq) {
+            return; // Evento ya aplicado
+        }
+        ultimoSeq = trama.seq;
+        epocaServidor = trama.epoca;
+        (trama.eventos || [trama.evento]).forEach(onMessageCallback); // Micro-lote: varios eventos en una trama
     };
 
-    socket.onclose = () => {
-        console.log("WebSocket desconectado. Intentando reconectar en 3 segundos...");
+    socket.onclose = (event) => {
         onStatusChangeCallback(false); // false = desconectado
-        setTimeout(() => conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback), 3000);
+        if (event.code === 4401) { window.location.href = '/login'; return; } // Sesión vencida
+        if (event.code === 4403) { console.error("Este centro no pertenece a tu negocio."); return; }
+        console.log("WebSocket desconectado. Intentando reconectar en 3 segundos...");
+        setTimeout(() => conectarWebSocket(centroId, onMessageCallback, onStatusChangeCallback, onSnapshotCallback), 3000);
     };
 
     socket.onerror = (error) => {
@@ -0,0 +1,42 @@
+document.addEventListener('DOMContentLoaded', () => {
+    // Las cifras salen de contadores ya calculados en el servidor: refrescar es barato
+    const INTERVALO_REFRESCO_MS = 60000;
+
+    const formatearVariacion = (valor, textoSinDatos) =>
+        valor === null ? textoSinDatos : `${valor > 0 ? '+' : ''}${valor.toFixed(1)}% vs ayer`;
+
+    const pintarComparacion = (elemento, valor, textoSinDatos) => {
+        if (!elemento) return;
+        elemento.classList.toggle('negative', valor !== null && valor < 0);
+        elemento.classList.toggle('positive', valor === null || valor >= 0);
+        elemento.querySelector('span').textContent = formatearVariacion(valor, textoSinDatos);
+    };
+
+    const ponerTexto = (id, texto) => {
+        const elemento = document.getElementById(id);
+        if (elemento) elemento.textContent = texto;
+    };
+
+    async function refrescarMetricas() {
+        try {
+            const response = await fetch('/panel/dashboard/metricas', { credentials: 'include' });
+            if (response.status === 401) window.location.href = '/login';
+            if (!response.ok) throw new Error(`Error de red: ${response.statusText}`);
+            const metricas = await response.json();
+
+            ponerTexto('metrica-ventas-hoy', `S/ ${metricas.ventas_hoy.toFixed(2)}`);
+            ponerTexto('metrica-pedidos-activos', metricas.pedidos_activos);
+            ponerTexto('metrica-promedio-diario', `Promedio diario: ${metricas.promedio_diario}`);
+            ponerTexto('metrica-alertas-stock', metricas.alertas_stock);
+            ponerTexto('metrica-clientes-atendidos', metricas.clientes_atendidos);
+            pintarComparacion(document.getElementById('metrica-comparacion-ayer'), metricas.comparacion_ayer, 'Sin ventas ayer');
+            pintarComparacion(document.getElementById('metrica-comparacion-clientes'), metricas.comparacion_clientes_ayer, 'Sin mesas ayer');
+            ponerTexto('dashboard-actualizado', new Date().toLocaleTimeString('es-PE', { hour: '2-digit', minute: '2-digit' }));
+        } catch (error) {
+            console.error('No se pudieron refrescar las métricas del dashboard:', error);
+        }
+    }
+
+    ponerTexto('dashboard-actualizado', new Date().toLocaleTimeString('es-PE', { hour: '2-digit', minute: '2-digit' }));
+    setInterval(refrescarMetricas, INTERVALO_REFRESCO_MS);
+});